@@ -17,7 +17,9 @@ import argparse
 import logging
 import requests
 import re
-from typing import Dict, Any, List, Optional, Set
+import time
+import asyncio
+from typing import Dict, Any, List, Optional, Set, Tuple
 from dataclasses import dataclass
 from dotenv import load_dotenv
 from google import genai
@@ -25,9 +27,9 @@ from google.genai import types
 from google.adk.tools.mcp_tool import McpToolset, StreamableHTTPConnectionParams
 
 # Import from common module
-from common.config import get_mcp_urls
+from common.config import get_mcp_urls, get_comment_generator_concurrency
 from common.credentials import CredentialManager
-from common.utils import parse_token_from_response, create_token_request, mask_sensitive_data
+from common.utils import parse_token_from_response, mask_sensitive_data
 from common.context import progress_callback_var, session_id_var, browser_session_id_var, auth_token_var, cancelled_var, timeout_signal_var, cancelled_sessions
 
 # Configure logging
@@ -41,14 +43,49 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Cached MCP sessions idle for longer than this are pinged before they are reused
+SESSION_HEALTH_CHECK_SECONDS = 30
+SESSION_PING_TIMEOUT_SECONDS = 10
+
+# Tables with at most this many missing column comments are packed into multi-table prompts
+SMALL_TABLE_MAX_COLUMNS = 5
+# Upper bounds for a multi-table prompt
+BATCH_MAX_TABLES = 8
+BATCH_TOKEN_BUDGET = 6000
+
+# Tables sampled per batched (UNION ALL) sample-row query
+SAMPLE_BATCH_TABLES = 20
+SAMPLE_ROWS = 3
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt budgeting (about 4 characters per token)"""
+    return len(text) // 4
+
 class MCPClient:
-    """Client for communicating with Visulate MCP servers."""
+    """
+    Client for communicating with Visulate MCP servers.
+
+    ADK's session manager already caches one session per header set and replaces
+    sessions whose streams have closed. On top of that, a session that sits idle is
+    pinged before it is reused, and a session that fails a call is replaced and the
+    call retried once. Only the failed session is closed: concurrent table tasks share
+    it, and the first task to hit the failure replaces it for all of them.
+    """
 
     def __init__(self, api_server_tools: McpToolset, query_engine_tools: McpToolset, session_id: Optional[str] = None):
         self.api_server_tools = api_server_tools
         self.query_engine_tools = query_engine_tools
         self.session_id = session_id
         self.credential_token = None
+        # id(toolset) -> (session, last used monotonic time)
+        self._sessions: Dict[int, Any] = {}
+        self._session_locks: Dict[int, asyncio.Lock] = {}
+        self.sessions_created = 0
+        self.sessions_reused = 0
+        self.session_create_seconds = 0.0
+        self.sessions_replaced = 0
+        self.failed_health_checks = 0
+        self.retried_calls = 0
 
     async def _unwrap_result(self, result: Any) -> Any:
         """Unwrap JSON from MCP ToolResponse if present"""
@@ -76,12 +113,92 @@ class MCPClient:
             return data
         return result
 
+    def _is_disconnected(self, toolset: McpToolset, session: Any) -> bool:
+        """Check whether the session manager considers a session closed"""
+        check = getattr(toolset._mcp_session_manager, "_is_session_disconnected", None)
+        try:
+            return bool(check(session)) if check else False
+        except Exception:
+            return True
+
+    async def _discard_session(self, toolset: McpToolset, session: Any):
+        """Close one session in the toolset's session manager, leaving any others open"""
+        manager = toolset._mcp_session_manager
+        for session_key, (cached, exit_stack, loop) in list(manager._sessions.items()):
+            if cached is session:
+                try:
+                    await manager._cleanup_session(session_key, exit_stack, loop)
+                except Exception as e:
+                    logger.debug(f"Error closing MCP session: {e}")
+
+    async def _get_session(self, toolset: McpToolset, failed: Any = None) -> Any:
+        """
+        Return the session for a toolset, replacing it if it is unhealthy.
+
+        Args:
+            toolset: The toolset whose session is needed
+            failed: A session a call has just failed on. It is replaced only if it is still
+                the current one; otherwise another task has already replaced it.
+        """
+        key = id(toolset)
+        lock = self._session_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cached = self._sessions.get(key)
+            if cached and failed is not None and cached[0] is not failed:
+                self.sessions_reused += 1
+                self._sessions[key] = (cached[0], time.monotonic())
+                return cached[0]
+            if cached and failed is None:
+                session, last_used = cached
+                healthy = not self._is_disconnected(toolset, session)
+                if healthy and time.monotonic() - last_used > SESSION_HEALTH_CHECK_SECONDS:
+                    try:
+                        await asyncio.wait_for(session.send_ping(), timeout=SESSION_PING_TIMEOUT_SECONDS)
+                    except Exception as e:
+                        logger.info(f"Cached MCP session failed health check: {e}")
+                        self.failed_health_checks += 1
+                        healthy = False
+                if healthy:
+                    self.sessions_reused += 1
+                    self._sessions[key] = (session, time.monotonic())
+                    return session
+            if cached:
+                self.sessions_replaced += 1
+                del self._sessions[key]
+                await self._discard_session(toolset, cached[0])
+
+            started = time.monotonic()
+            session = await toolset._mcp_session_manager.create_session()
+            elapsed = time.monotonic() - started
+            self.sessions_created += 1
+            self.session_create_seconds += elapsed
+            logger.info(f"Opened MCP session in {elapsed * 1000:.0f} ms")
+            self._sessions[key] = (session, time.monotonic())
+            return session
+
     async def _call_mcp_tool(self, toolset: McpToolset, tool_name: str, arguments: Dict[str, Any]) -> Any:
-        """Helper to call an MCP tool using the internal session manager"""
-        # Get session from session manager
-        session = await toolset._mcp_session_manager.create_session()
-        # Call the tool
-        return await session.call_tool(tool_name, arguments=arguments)
+        """Helper to call an MCP tool on the toolset's long-lived session"""
+        session = await self._get_session(toolset)
+        try:
+            return await session.call_tool(tool_name, arguments=arguments)
+        except Exception as e:
+            logger.warning(f"MCP call {tool_name} failed ({e}); retrying on a new session")
+            self.retried_calls += 1
+            session = await self._get_session(toolset, failed=session)
+            return await session.call_tool(tool_name, arguments=arguments)
+
+    def get_session_stats(self) -> Dict[str, Any]:
+        """Session creation, reuse and health statistics for this client"""
+        total_create_ms = self.session_create_seconds * 1000
+        return {
+            "created": self.sessions_created,
+            "reused": self.sessions_reused,
+            "total_create_ms": round(total_create_ms, 1),
+            "avg_create_ms": round(total_create_ms / self.sessions_created, 1) if self.sessions_created else 0.0,
+            "replaced": self.sessions_replaced,
+            "failed_health_checks": self.failed_health_checks,
+            "retried_calls": self.retried_calls
+        }
 
     async def call_api_server_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """Call a tool on the API server MCP endpoint"""
@@ -130,7 +247,8 @@ class MCPClient:
                             import re
                             results_match = re.search(r'Results:\s*(\[.*?\])', text, re.DOTALL)
                             if results_match:
-                                return {"success": True, "data": json.loads(results_match.group(1))}
+                                return {"success": True, "data": json.loads(results_match.group(1)),
+                                        "truncated": "Results truncated" in text}
                         except Exception as e:
                             logger.error(f"JSON parse error in execute_sql: {e}")
                             return {"success": False, "error": f"Parse error: {e}"}
@@ -150,7 +268,8 @@ class MCPClient:
         })
 
 class CommentGenerator:
-    def __init__(self, mcp_client: MCPClient, database: str, schema: str, credential_token: Optional[str] = None, session_id: str = "default", username: Optional[str] = None):
+    def __init__(self, mcp_client: MCPClient, database: str, schema: str, credential_token: Optional[str] = None, session_id: str = "default", username: Optional[str] = None, concurrency: Optional[int] = None,
+                 batch_max_tables: int = BATCH_MAX_TABLES, batch_token_budget: int = BATCH_TOKEN_BUDGET):
         self.client = mcp_client
         self.database = database
         self.schema_input = schema
@@ -160,6 +279,12 @@ class CommentGenerator:
         self.genai_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
         self.session_id = session_id
         self.db_type = "oracle" 
+        self.concurrency = concurrency or get_comment_generator_concurrency()
+        self.batch_max_tables = batch_max_tables
+        self.batch_token_budget = batch_token_budget
+        # Filled by prefetch(); tables missing here are fetched one at a time
+        self._prefetched_context: Dict[str, Dict[str, Any]] = {}
+        self._prefetched_samples: Dict[str, List[Dict[str, Any]]] = {}
 
     async def create_credential_token(self, database: str, username: str) -> bool:
         """
@@ -175,11 +300,14 @@ class CommentGenerator:
             return True
         return False
 
+    def stop_requested(self) -> bool:
+        """Check whether the run has been cancelled or has hit its time limit"""
+        return bool(cancelled_var.get() or timeout_signal_var.get() or self.session_id in cancelled_sessions)
+
     def report_progress(self, message: str):
         """Send progress update to the context-local callback if available"""
         # Check for cancellation before reporting progress
-        from common.context import cancelled_sessions
-        if cancelled_var.get() or timeout_signal_var.get() or self.session_id in cancelled_sessions:
+        if self.stop_requested():
              logger.info(f"Stop signal detected for session {self.session_id} in report_progress for: {message}. Raising Exception.")
              raise Exception("Task stopped")
 
@@ -259,8 +387,116 @@ class CommentGenerator:
 
         return objects_to_process
 
+    def _load_schema_metadata(self, result: Any) -> List[Dict[str, Any]]:
+        """
+        Return the rows of a getSchemaColumns/getSchemaRelationships result.
+        Large schemas return a summary that points at the API server's metadata cache file.
+        """
+        if isinstance(result, list):
+            return result
+        if isinstance(result, dict) and result.get("cacheFile"):
+            downloads_base = os.getenv("VISULATE_DOWNLOADS") or os.path.join(os.path.abspath(os.getcwd()), "downloads")
+            file_path = os.path.join(downloads_base, "metadata", os.path.basename(result["cacheFile"]))
+            try:
+                with open(file_path, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read metadata cache {file_path}: {e}")
+        return []
+
+    async def prefetch_metadata(self, table_names: List[str]):
+        """Fetch column and foreign key context for all target tables with two schema-level calls"""
+        args = {"db": self.database, "owner": self.schema}
+        columns = self._load_schema_metadata(await self.client.call_api_server_tool("getSchemaColumns", dict(args)))
+        relationships = self._load_schema_metadata(await self.client.call_api_server_tool("getSchemaRelationships", dict(args)))
+
+        wanted = set(table_names)
+        contexts = {}
+        for column in columns:
+            table_name = column.get("tableName")
+            if table_name in wanted:
+                context = contexts.setdefault(table_name, {"owner": self.schema, "name": table_name, "columns": [], "foreignKeys": [], "referencedBy": []})
+                context["columns"].append({k: v for k, v in column.items() if k != "tableName"})
+
+        for rel in relationships:
+            if rel.get("tableName") in contexts:
+                contexts[rel["tableName"]]["foreignKeys"].append({
+                    "constraintName": rel.get("constraintName"),
+                    "referencedOwner": rel.get("referencedOwner"),
+                    "referencedTable": rel.get("referencedTable")
+                })
+            same_schema = str(rel.get("referencedOwner") or self.schema).upper() == self.schema.upper()
+            if same_schema and rel.get("referencedTable") in contexts:
+                contexts[rel["referencedTable"]]["referencedBy"].append({
+                    "constraintName": rel.get("constraintName"),
+                    "table": rel.get("tableName")
+                })
+
+        self._prefetched_context.update(contexts)
+        logger.info(f"Prefetched context for {len(contexts)} of {len(wanted)} objects")
+
+    def _sample_rows_sql(self, table_names: List[str]) -> str:
+        """Build one query returning up to SAMPLE_ROWS rows, as JSON text, from each table"""
+        parts = []
+        for table_name in table_names:
+            label = table_name.replace("'", "''")
+            if self.db_type == "postgres":
+                parts.append(f'SELECT \'{label}\' AS table_name, row_to_json(s)::text AS row_json '
+                             f'FROM (SELECT * FROM "{self.schema}"."{table_name}" LIMIT {SAMPLE_ROWS}) s')
+            else:
+                parts.append(f"SELECT '{label}' AS table_name, JSON_OBJECT(*) AS row_json "
+                             f"FROM (SELECT * FROM {self.schema}.{table_name} WHERE ROWNUM <= {SAMPLE_ROWS}) s")
+        return "\nUNION ALL\n".join(parts)
+
+    async def prefetch_sample_rows(self, table_names: List[str]):
+        """
+        Fetch sample rows for many tables per query.
+
+        Only tables that returned rows are recorded, so tables missing from a batch (or a
+        batch that failed or hit the query engine's row/size limit) fall back to per-table sampling.
+        """
+        for i in range(0, len(table_names), SAMPLE_BATCH_TABLES):
+            chunk = table_names[i:i + SAMPLE_BATCH_TABLES]
+            result = await self.client.execute_sql(self.database, self._sample_rows_sql(chunk))
+            if not isinstance(result, dict) or not result.get("success"):
+                logger.info(f"Batched sample query failed, sampling {len(chunk)} objects individually: {result.get('error') if isinstance(result, dict) else result}")
+                continue
+            if result.get("truncated"):
+                logger.info(f"Batched sample query was truncated, sampling {len(chunk)} objects individually")
+                continue
+
+            samples = {}
+            for row in result.get("data") or []:
+                values = {key.lower(): value for key, value in row.items()}
+                table_name = values.get("table_name")
+                if table_name in chunk:
+                    try:
+                        samples.setdefault(table_name, []).append(json.loads(values.get("row_json")))
+                    except (TypeError, ValueError):
+                        pass
+            self._prefetched_samples.update(samples)
+
+    async def prefetch(self, to_process: List[Tuple[str, Dict[str, Any]]]):
+        """Bulk-load context and sample rows for every object before generation starts"""
+        table_names = [table_name for table_name, _ in to_process]
+        self.report_progress(f"Prefetching metadata and sample rows for {len(table_names)} objects...")
+        try:
+            await self.prefetch_metadata(table_names)
+        except Exception as e:
+            logger.warning(f"Metadata prefetch failed, falling back to getContext per object: {e}")
+        await self.prefetch_sample_rows(table_names)
+
+    async def get_table_context(self, table_name: str, table_type: str) -> Dict[str, Any]:
+        """Get context for a table/view, using prefetched metadata when available"""
+        context = self._prefetched_context.get(table_name)
+        if context:
+            return {**context, "type": table_type}
+        return await self.client.get_context(self.database, self.schema, table_name, table_type)
+
     async def get_sample_rows(self, table_name: str) -> List[Dict[str, Any]]:
         """Get sample rows for a table/view"""
+        if table_name in self._prefetched_samples:
+            return self._prefetched_samples[table_name]
         if self.db_type == "postgres":
             sql = f'SELECT * FROM "{self.schema}"."{table_name}" LIMIT 3'
         else:
@@ -270,26 +506,110 @@ class CommentGenerator:
             return result.get("data", [])
         return []
 
-    async def generate_comments_batch(self, object_name: str, object_type: str, context: Dict[str, Any], sample_data: List[Dict[str, Any]], missing_table_comment: bool, missing_columns: List[str]) -> Dict[str, str]:
-        """Generate comments for a table and its columns in a single request"""
-
-        # Build the prompt for all comments needed
+    def _comment_targets(self, object_name: str, object_type: str, missing_table_comment: bool, missing_columns: List[str]):
+        """Return the prompt target lines and expected JSON keys for one object"""
         targets = []
+        json_keys = []
         if missing_table_comment:
             targets.append(f"TABLE_COMMENT for {object_type} {self.schema}.{object_name}")
-
+            json_keys.append('"table_comment": "your table comment here"')
         for column_name in missing_columns:
             targets.append(f"COLUMN_COMMENT for {column_name} in {object_type} {object_name}")
+            json_keys.append(f'"{column_name}_comment": "your comment for {column_name} here"')
+        return targets, json_keys
+
+    @staticmethod
+    def _parse_json_response(response: Any) -> Dict[str, Any]:
+        """Parse the JSON object returned by the model, stripping any markdown fence"""
+        response_text = response.text.strip()
+        if response_text.startswith('```json'):
+            response_text = response_text.replace('```json', '').replace('```', '').strip()
+        return json.loads(response_text)
+
+    def _multi_table_section(self, table_name: str, info: Dict[str, Any], context: Dict[str, Any], sample_data: List[Dict[str, Any]]) -> str:
+        """Prompt section describing one table in a multi-table request"""
+        targets, json_keys = self._comment_targets(table_name, info['type'], info['missing_table_comment'], info['missing_columns'])
+        return f"""
+        ### {self.schema}.{table_name} ({info['type']})
 
-        if not targets:
+        Context (Structure, Columns, Relationships):
+        {json.dumps(context)}
+
+        Sample Data (First 3 rows):
+        {json.dumps(sample_data)}
+
+        Targets:
+        {chr(10).join(f'- {target}' for target in targets)}
+
+        JSON keys for "{table_name}": {{{', '.join(json_keys)}}}
+        """
+
+    def pack_prompts(self, inputs: List[Tuple[str, Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]]) -> List[List[Tuple]]:
+        """Group fetched table inputs so that each group's prompt stays under the token budget"""
+        groups = []
+        current = []
+        current_tokens = 0
+        for item in inputs:
+            tokens = estimate_tokens(self._multi_table_section(*item))
+            if current and current_tokens + tokens > self.batch_token_budget:
+                groups.append(current)
+                current = []
+                current_tokens = 0
+            current.append(item)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    async def generate_comments_multi(self, group: List[Tuple[str, Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]]) -> Dict[str, Dict[str, str]]:
+        """
+        Generate comments for several small tables in a single request.
+        Returns a dict keyed by table name; tables the model left out are simply absent.
+        """
+        sections = "".join(self._multi_table_section(*item) for item in group)
+        prompt = f"""
+        You are a {self.db_type.capitalize()} Database expert. Generate concise but descriptive comments for the following database objects.
+        {sections}
+
+        Instructions:
+        1. For table comments: Describe what this object represents based on its name, columns, and data.
+        2. For column comments: Explain what each column stores based on its name, data type, and sample values.
+        3. If it's a view, mention its purpose in the comment.
+        4. If there are foreign keys, you may reference related tables.
+        5. Keep column comments under 200 characters, prioritize clarity.
+        6. Return a single JSON object with one key per object name. Each value is an object containing that object's JSON keys.
+
+        Expected JSON format:
+        {{
+            "OBJECT_NAME": {{"table_comment": "...", "COLUMN_comment": "..."}}
+        }}
+
+        Return ONLY the JSON object, no other text or formatting.
+        """
+
+        try:
+            def do_generate():
+                return self.genai_client.models.generate_content(
+                    model="gemini-flash-latest",
+                    contents=prompt
+                )
+
+            response = await asyncio.to_thread(do_generate)
+            result = self._parse_json_response(response)
+            if not isinstance(result, dict):
+                return {}
+            return {name: comments for name, comments in result.items() if isinstance(comments, dict)}
+        except Exception as e:
+            logger.error(f"Error generating comments for {', '.join(item[0] for item in group)}: {e}")
             return {}
 
-        # Build the expected JSON structure
-        json_keys = []
-        if missing_table_comment:
-            json_keys.append('"table_comment": "your table comment here"')
-        for column_name in missing_columns:
-            json_keys.append(f'"{column_name}_comment": "your comment for {column_name} here"')
+    async def generate_comments_batch(self, object_name: str, object_type: str, context: Dict[str, Any], sample_data: List[Dict[str, Any]], missing_table_comment: bool, missing_columns: List[str]) -> Dict[str, str]:
+        """Generate comments for a table and its columns in a single request"""
+
+        # Build the prompt for all comments needed
+        targets, json_keys = self._comment_targets(object_name, object_type, missing_table_comment, missing_columns)
+        if not targets:
+            return {}
 
         prompt = f"""
         You are a {self.db_type.capitalize()} Database expert. Generate concise but descriptive comments for the following database objects.
@@ -322,7 +642,6 @@ class CommentGenerator:
         """
 
         try:
-            import asyncio
             def do_generate():
                 return self.genai_client.models.generate_content(
                     model="gemini-flash-latest",
@@ -330,14 +649,7 @@ class CommentGenerator:
                 )
 
             response = await asyncio.to_thread(do_generate)
-
-            # Parse the JSON response
-            response_text = response.text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text.replace('```json', '').replace('```', '').strip()
-
-            comments_dict = json.loads(response_text)
-            return comments_dict
+            return self._parse_json_response(response)
 
         except Exception as e:
             logger.error(f"Error generating comments for {object_name}: {e}")
@@ -388,6 +700,110 @@ class CommentGenerator:
             
         return processed
 
+    async def process_table(self, table_name: str, info: Dict[str, Any]) -> List[str]:
+        """Generate the COMMENT statements for one table or view"""
+        table_type = info['type']
+        self.report_progress(f"Processing {table_type} {table_name}...")
+
+        # 3. Get Context (once per table)
+        context = await self.get_table_context(table_name, table_type)
+
+        # 4. Get Sample Data (once per table)
+        sample_data = await self.get_sample_rows(table_name)
+
+        # 5. Generate all comments in a single request
+        comments_dict = await self.generate_comments_batch(table_name, table_type, context, sample_data, info['missing_table_comment'], info['missing_columns'])
+        return self.build_table_statements(table_name, info, comments_dict)
+
+    def build_table_statements(self, table_name: str, info: Dict[str, Any], comments_dict: Dict[str, str]) -> List[str]:
+        """Turn generated comments into COMMENT statements for one table or view"""
+        table_type = info['type']
+        missing_table_comment = info['missing_table_comment']
+        missing_columns = info['missing_columns']
+        table_statements = [] # Statements for THIS table
+
+        # 6. Process table comment
+        if missing_table_comment and 'table_comment' in comments_dict:
+            comment = comments_dict['table_comment']
+            self.report_progress(f"Generated table comment for {table_name}")
+            safe_comment = comment.replace("'", "''")
+            if self.db_type == "postgres":
+                if table_type.upper() == "VIEW":
+                    obj_keyword = "VIEW"
+                elif "MATERIALIZED" in table_type.upper():
+                    obj_keyword = "MATERIALIZED VIEW"
+                else:
+                    obj_keyword = "TABLE"
+                stmt = f'COMMENT ON {obj_keyword} "{self.schema}"."{table_name}" IS \'{safe_comment}\';'
+            else:
+                stmt = f"COMMENT ON TABLE {self.schema}.{table_name} IS '{safe_comment}';"
+            table_statements.append(stmt)
+            logger.info(f"Generated table comment: {comment}")
+
+        # 7. Process column comments
+        for col_name in missing_columns:
+            comment_key = f'{col_name}_comment'
+            if comment_key in comments_dict:
+                comment = comments_dict[comment_key]
+                self.report_progress(f"Generated column comment for {table_name}.{col_name}")
+                safe_comment = comment.replace("'", "''")
+                if self.db_type == "postgres":
+                    stmt = f'COMMENT ON COLUMN "{self.schema}"."{table_name}"."{col_name}" IS \'{safe_comment}\';'
+                else:
+                    stmt = f"COMMENT ON COLUMN {self.schema}.{table_name}.{col_name} IS '{safe_comment}';"
+                table_statements.append(stmt)
+                logger.info(f"Generated column comment for {col_name}: {comment}")
+        return table_statements
+
+    def plan_batches(self, to_process: List[Tuple[str, Dict[str, Any]]]) -> List[List[Tuple[str, Dict[str, Any]]]]:
+        """Group consecutive small tables (few missing comments) so they can share an LLM request"""
+        batches = []
+        current = []
+        for item in to_process:
+            small = len(item[1]['missing_columns']) <= SMALL_TABLE_MAX_COLUMNS
+            if small and len(current) < self.batch_max_tables:
+                current.append(item)
+                continue
+            if current:
+                batches.append(current)
+                current = []
+            if small:
+                current.append(item)
+            else:
+                batches.append([item])
+        if current:
+            batches.append(current)
+        return batches
+
+    async def process_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> List[List[str]]:
+        """
+        Generate the COMMENT statements for a batch of tables.
+        Small tables share multi-table requests under the token budget; any table missing
+        from a multi-table response falls back to its own request.
+        """
+        if len(batch) == 1:
+            return [await self.process_table(*batch[0])]
+
+        inputs = []
+        for table_name, info in batch:
+            self.report_progress(f"Processing {info['type']} {table_name}...")
+            context = await self.get_table_context(table_name, info['type'])
+            sample_data = await self.get_sample_rows(table_name)
+            inputs.append((table_name, info, context, sample_data))
+
+        generated = {}
+        for group in self.pack_prompts(inputs):
+            if len(group) > 1:
+                generated.update(await self.generate_comments_multi(group))
+
+        results = []
+        for table_name, info, context, sample_data in inputs:
+            comments_dict = generated.get(table_name)
+            if comments_dict is None:
+                comments_dict = await self.generate_comments_batch(table_name, info['type'], context, sample_data, info['missing_table_comment'], info['missing_columns'])
+            results.append(self.build_table_statements(table_name, info, comments_dict))
+        return results
+
     async def run(self, wildcard: str, output_file: str, offset: int = 0) -> int:
         """Main execution flow. Returns the number of comments generated."""
 
@@ -503,78 +919,50 @@ class CommentGenerator:
                 f.write(f"-- Generated on {json.dumps(str(os.getenv('VISULATE_BASE')))}\n\n")
                 f.flush()
 
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def worker(batch: List[Tuple[str, Dict[str, Any]]]) -> Optional[List[List[str]]]:
+                async with semaphore:
+                    # Check for cancellation or timeout before starting another batch
+                    if self.stop_requested():
+                        return None
+                    return await self.process_batch(batch)
+
+            # Up to self.concurrency batches are in flight; results are written in to_process order
+            batches = self.plan_batches(to_process)
+            tasks = []
             try:
-                for table_name, info in to_process:
-                    # Check for cancellation or timeout
-                    if cancelled_var.get() or timeout_signal_var.get() or self.session_id in cancelled_sessions:
+                await self.prefetch(to_process)
+                tasks = [asyncio.create_task(worker(batch)) for batch in batches]
+                for batch, task in zip(batches, tasks):
+                    batch_statements = await task
+                    if batch_statements is None:
                         reason = "Time limit" if timeout_signal_var.get() else "Cancellation"
-                        logger.info(f"▌{reason.upper()}: Process stopped while working on {table_name}.")
+                        logger.info(f"▌{reason.upper()}: Process stopped while working on {batch[0][0]}.")
                         break
 
-                    table_type = info['type']
-                    missing_table_comment = info['missing_table_comment']
-                    missing_columns = info['missing_columns']
-
-                    self.report_progress(f"Processing {table_type} {table_name}...")
-                    
-                    table_statements = [] # Statements for THIS table
-
-                    # 3. Get Context (once per table)
-                    context = await self.client.get_context(self.database, self.schema, table_name, table_type)
-
-                    # 4. Get Sample Data (once per table)
-                    sample_data = await self.get_sample_rows(table_name)
-
-                    # 5. Generate all comments in a single request
-                    comments_dict = await self.generate_comments_batch(table_name, table_type, context, sample_data, missing_table_comment, missing_columns)
-
-                    # 6. Process table comment
-                    if missing_table_comment and 'table_comment' in comments_dict:
-                        comment = comments_dict['table_comment']
-                        self.report_progress(f"Generated table comment for {table_name}")
-                        safe_comment = comment.replace("'", "''")
-                        if self.db_type == "postgres":
-                            if table_type.upper() == "VIEW":
-                                obj_keyword = "VIEW"
-                            elif "MATERIALIZED" in table_type.upper():
-                                obj_keyword = "MATERIALIZED VIEW"
-                            else:
-                                obj_keyword = "TABLE"
-                            stmt = f'COMMENT ON {obj_keyword} "{self.schema}"."{table_name}" IS \'{safe_comment}\';'
-                        else:
-                            stmt = f"COMMENT ON TABLE {self.schema}.{table_name} IS '{safe_comment}';"
-                        table_statements.append(stmt)
-                        self.generated_count += 1
-                        logger.info(f"Generated table comment: {comment}")
-
-                    # 7. Process column comments
-                    for col_name in missing_columns:
-                        comment_key = f'{col_name}_comment'
-                        if comment_key in comments_dict:
-                            comment = comments_dict[comment_key]
-                            self.report_progress(f"Generated column comment for {table_name}.{col_name}")
-                            safe_comment = comment.replace("'", "''")
-                            if self.db_type == "postgres":
-                                stmt = f'COMMENT ON COLUMN "{self.schema}"."{table_name}"."{col_name}" IS \'{safe_comment}\';'
-                            else:
-                                stmt = f"COMMENT ON COLUMN {self.schema}.{table_name}.{col_name} IS '{safe_comment}';"
-                            table_statements.append(stmt)
-                            self.generated_count += 1
-                            logger.info(f"Generated column comment for {col_name}: {comment}")
-                    
-                    if table_statements:
+                    for table_statements in batch_statements:
+                        if not table_statements:
+                            continue
                         for stmt in table_statements:
                             f.write(stmt + "\n")
                         f.write("\n") # Add blank line between objects
                         f.flush()
                         os.fsync(f.fileno()) # Ensure it hits the disk
+                        self.generated_count += len(table_statements)
             except Exception as e:
                 if str(e) == "Task stopped":
                     logger.info("Task stopped via exception, returning partial results.")
                 else:
                     raise e
+            finally:
+                # Tables after a stop (or an error) are abandoned; resume picks them up next time
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
 
         logger.info(f"Successfully finalized {self.generated_count} comments to {output_file}")
+        logger.info(f"MCP session stats: {self.client.get_session_stats()}")
         if self.generated_count > 0:
              self.report_progress(f"▌SUCCESS: SQL script updated with {self.generated_count} new comments: {output_file}")
         return self.generated_count
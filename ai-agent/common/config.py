@@ -50,3 +50,30 @@ def get_max_attachments() -> int:
     Default: 10
     """
     return int(os.getenv("VISULATE_MAX_ATTACHMENTS", "10"))
+
+def get_http_client_config() -> dict:
+    """
+    Get connection pool settings for the shared HTTP clients (see common/http_clients.py).
+    Defaults:
+        VISULATE_HTTP_MAX_CONNECTIONS: 100 connections per upstream
+        VISULATE_HTTP_MAX_KEEPALIVE: 20 idle keep-alive connections per upstream
+        VISULATE_HTTP_KEEPALIVE_EXPIRY: 30 seconds before an idle connection is closed
+        VISULATE_HTTP_CONNECT_TIMEOUT: 10 seconds to establish a connection
+        VISULATE_HTTP_TIMEOUT: 60 seconds default read/write timeout (callers may override per request)
+        VISULATE_HTTP2: "true" to negotiate HTTP/2 with https upstreams when the h2 package is installed
+    """
+    return {
+        "max_connections": int(os.getenv("VISULATE_HTTP_MAX_CONNECTIONS", "100")),
+        "max_keepalive_connections": int(os.getenv("VISULATE_HTTP_MAX_KEEPALIVE", "20")),
+        "keepalive_expiry": float(os.getenv("VISULATE_HTTP_KEEPALIVE_EXPIRY", "30")),
+        "connect_timeout": float(os.getenv("VISULATE_HTTP_CONNECT_TIMEOUT", "10")),
+        "timeout": float(os.getenv("VISULATE_HTTP_TIMEOUT", "60")),
+        "http2": os.getenv("VISULATE_HTTP2", "true").lower() == "true",
+    }
+
+def get_comment_generator_concurrency() -> int:
+    """
+    Get the number of tables the comment generator works on at once.
+    Default: 4
+    """
+    return max(1, int(os.getenv("VISULATE_COMMENT_CONCURRENCY", "4")))
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from common.config import get_http_client_config
+
+# h2 is optional - without it every upstream is reached over HTTP/1.1
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def upstream_key(url: str) -> str:
+    """Return the scheme://host:port origin that identifies an upstream service."""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+class HttpClientRegistry:
+    """
+    Process-wide pooled httpx.AsyncClient instances, one per upstream.
+
+    The API server, the query engine and each sub-agent are separate origins, so each
+    gets its own connection pool and keep-alive connections are reused across tool
+    calls and sessions. Clients are bound to the event loop that created them; a
+    caller on a different loop gets a fresh client; the one it replaces is closed on
+    its own loop if that loop is still running, otherwise kept until close_all().
+    Timeouts are set per request by callers that need something other than the
+    configured default.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport
+        self._clients: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+        self._retired: List[Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = []
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _create_client(self) -> httpx.AsyncClient:
+        config = get_http_client_config()
+        limits = httpx.Limits(
+            max_connections=config["max_connections"],
+            max_keepalive_connections=config["max_keepalive_connections"],
+            keepalive_expiry=config["keepalive_expiry"],
+        )
+        timeout = httpx.Timeout(config["timeout"], connect=config["connect_timeout"])
+        return httpx.AsyncClient(
+            limits=limits,
+            timeout=timeout,
+            http2=config["http2"] and H2_AVAILABLE,
+            transport=self._transport,
+        )
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        """
+        Get the shared client for the upstream serving a URL.
+        Args:
+            url (str): Any URL on the upstream (only the origin is used).
+        Returns:
+            httpx.AsyncClient: A client that must not be closed by the caller.
+        """
+        key = upstream_key(url)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry and not entry[0].is_closed and entry[1] is loop:
+                return entry[0]
+            if entry:
+                self._retire(*entry)
+            client = self._create_client()
+            self._clients[key] = (client, loop)
+            self.created += 1
+        logger.debug(f"Created shared HTTP client for {key}")
+        return client
+
+    def _retire(self, client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop):
+        """Close a replaced client on its own loop, or keep it for close_all(). Called with the lock held."""
+        if client.is_closed:
+            return
+        if loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            self._retired.append((client, loop))
+
+    async def close_all(self):
+        """
+        Close every client created on the running event loop, and any replaced client
+        whose loop has stopped. Clients of other running loops are forgotten.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entries = list(self._clients.values()) + self._retired
+            self._clients.clear()
+            self._retired = []
+        for client, client_loop in entries:
+            if client.is_closed or (client_loop is not loop and client_loop.is_running()):
+                continue
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing HTTP client: {e}")
+
+    def get_stats(self) -> dict:
+        """Get registry statistics."""
+        with self._lock:
+            return {
+                "upstreams": sorted(self._clients),
+                "retired": len(self._retired),
+                "created": self.created,
+                "http2": H2_AVAILABLE and get_http_client_config()["http2"],
+            }
+
+
+# Process-wide registry shared by every agent in this service
+http_clients = HttpClientRegistry()
+
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    """Shortcut for http_clients.get(url)."""
+    return http_clients.get(url)
+
+
+async def close_http_clients():
+    """Close the shared HTTP clients. Called from the app's shutdown hook."""
+    await http_clients.close_all()
@@ -12,6 +12,7 @@ from google.genai import types
 from common.context import progress_callback_var, session_id_var, browser_session_id_var, auth_token_var, cancelled_var, cancelled_sessions, ui_context_var, db_credentials_var, timeout_signal_var
 from common.utils import format_tool_name
 from common.config import get_ai_timeout, get_max_attachments
+from common.http_clients import close_http_clients
 import time
 
 from google.adk.flows.llm_flows.auto_flow import AutoFlow
@@ -35,6 +36,10 @@ def create_agent_app(agent_factory: Callable[[], LlmAgent], agent_name: str) ->
     async def startup_event():
         await setup_session_db()
 
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        await close_http_clients()
+
     @app.get("/agent/health")
     async def health():
         return {"status": "ok", "agent": agent_name}
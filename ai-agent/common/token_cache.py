@@ -0,0 +1,87 @@
+import hashlib
+import hmac
+import logging
+import secrets
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Expiry requested for credential tokens minted by the agent handshake
+TOKEN_EXPIRY_MINUTES = 30
+
+# Tokens are refreshed this many seconds before the query engine would expire them
+TOKEN_REFRESH_MARGIN_SECONDS = 120
+
+# Error text returned by the query engine for unknown, revoked or expired tokens
+INVALID_TOKEN_MESSAGE = "Invalid or expired credential token"
+
+# Per-process key used to fingerprint passwords in cache keys (never leaves RAM)
+_DIGEST_KEY = secrets.token_bytes(32)
+
+
+class TokenCache:
+    """
+    Caches query engine credential tokens per (browser session, database, username).
+
+    Tokens are keyed with a fingerprint of the password they were minted with, so a
+    password change in the UI produces a new token rather than reusing the old one.
+    Entries expire TOKEN_REFRESH_MARGIN_SECONDS before the token itself, and callers
+    invalidate a token when the query engine rejects it.
+    """
+
+    def __init__(self, refresh_margin: float = TOKEN_REFRESH_MARGIN_SECONDS):
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[Tuple[str, str, str, str], Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(session_id: str, database: str, username: str, password: str) -> Tuple[str, str, str, str]:
+        digest = hmac.new(_DIGEST_KEY, password.encode(), hashlib.sha256).hexdigest()
+        return (session_id, database.lower(), (username or "").upper(), digest)
+
+    def get(self, session_id: str, database: str, username: str, password: str) -> Optional[str]:
+        """Return a cached token that is not about to expire, or None."""
+        key = self._key(session_id, database, username, password)
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry and time.time() < entry[1]:
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._tokens[key]
+            self.misses += 1
+            return None
+
+    def put(self, session_id: str, database: str, username: str, password: str, token: str,
+            expiry_minutes: int = TOKEN_EXPIRY_MINUTES):
+        """Cache a newly minted token until shortly before it expires."""
+        refresh_at = time.time() + expiry_minutes * 60 - self.refresh_margin
+        with self._lock:
+            self._tokens[self._key(session_id, database, username, password)] = (token, refresh_at)
+
+    def invalidate(self, token: str) -> bool:
+        """Drop a token the query engine has rejected."""
+        with self._lock:
+            for key, (cached_token, _) in list(self._tokens.items()):
+                if cached_token == token:
+                    del self._tokens[key]
+                    return True
+        return False
+
+    def clear(self):
+        """Remove all cached tokens."""
+        with self._lock:
+            self._tokens.clear()
+
+    def get_stats(self) -> dict:
+        """Get cache statistics."""
+        with self._lock:
+            return {"size": len(self._tokens), "hits": self.hits, "misses": self.misses}
+
+
+# Process-wide token cache shared by every agent in this service
+token_cache = TokenCache()
@@ -7,16 +7,18 @@ from google.adk.tools.mcp_tool import McpToolset, StreamableHTTPConnectionParams
 from google.adk.tools.function_tool import FunctionTool
 from common.config import get_mcp_urls
 from common.credentials import CredentialManager
-from common.utils import parse_token_from_response, create_token_request, mask_sensitive_data, call_mcp_tool_rest, format_mcp_text_response
+from common.token_cache import token_cache, TOKEN_EXPIRY_MINUTES, INVALID_TOKEN_MESSAGE
+from common.utils import parse_token_from_response, create_token_request_async, mask_sensitive_data, call_mcp_tool_rest, format_mcp_text_response
 from common.context import session_id_var, auth_token_var, progress_callback_var, ui_context_var, browser_session_id_var
 
 logger = logging.getLogger(__name__)
 
-async def get_valid_token(database: str, schema: str) -> Optional[str]:
+async def get_valid_token(database: str, schema: str, force_refresh: bool = False) -> Optional[str]:
     """
     Internal helper to retrieve or create a valid credential token.
     Uses the shared security logic to fetch from UI context and perform a handshake
-    with the Query Engine of the specified database.
+    with the Query Engine of the specified database. Tokens are reused from the
+    token cache until shortly before they expire unless force_refresh is set.
     """
     cred_manager = CredentialManager()
     
@@ -30,13 +32,20 @@ async def get_valid_token(database: str, schema: str) -> Optional[str]:
     # 2. Extract session info
     _, query_engine_url = get_mcp_urls()
     session_id = browser_session_id_var.get() or session_id_var.get() or "default"
+
+    if not force_refresh:
+        token = token_cache.get(session_id, database, username, password)
+        if token:
+            logger.debug(f"Reusing cached credential token for {database} (user: {username}).")
+            return token
     
     # 3. Create token via Query Engine
     # Use the username found by the credential manager for the token request
-    result = create_token_request(query_engine_url, database, username, password, session_id)
+    result = await create_token_request_async(query_engine_url, database, username, password, session_id, TOKEN_EXPIRY_MINUTES)
     token = parse_token_from_response(result)
     
     if token:
+        token_cache.put(session_id, database, username, password, token, TOKEN_EXPIRY_MINUTES)
         logger.info(f"Handshake successful: Created new token for {database} (user: {username}) using {source}.")
     else:
         logger.error(f"Handshake failed: Query Engine rejected credential token request for {database}.{username}.")
@@ -81,15 +90,25 @@ def create_smart_execute_sql_tool(query_engine_tools: McpToolset) -> FunctionToo
         # 2. Delegate to the actual MCP tool on the Query Engine via REST
         _, query_engine_url = get_mcp_urls()
         session_id = browser_session_id_var.get() or session_id_var.get() or "default"
-        
-        result = await call_mcp_tool_rest(query_engine_url, "execute_sql", {
+        arguments = {
             "database": database,
             "sql": sql,
             "credential_token": token,
             "session_id": session_id
-        })
-        
-        return format_mcp_text_response(result)
+        }
+        result = await call_mcp_tool_rest(query_engine_url, "execute_sql", arguments)
+        response_text = format_mcp_text_response(result)
+
+        # 3. A cached token may have been revoked or expired - mint a new one and retry once
+        if INVALID_TOKEN_MESSAGE in response_text:
+            token_cache.invalidate(token)
+            token = await get_valid_token(database, schema, force_refresh=True)
+            if not token:
+                return f"Error: Authentication failed for {database}.{schema}. Please provide schema credentials using the Smart Key icon in the UI."
+            result = await call_mcp_tool_rest(query_engine_url, "execute_sql", {**arguments, "credential_token": token})
+            response_text = format_mcp_text_response(result)
+
+        return response_text
 
     return FunctionTool(execute_sql)
 
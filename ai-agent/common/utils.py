@@ -101,6 +101,37 @@ def create_token_request(query_engine_url: str, database: str, username: str, pa
             "exception_type": type(e).__name__
         }
 
+async def create_token_request_async(query_engine_url: str, database: str, username: str, password: str, session_id: str, expiry_minutes: int = 30) -> Dict[str, Any]:
+    """
+    Async version of create_token_request for use from the agent's event loop.
+    Uses the shared query engine client so concurrent sessions do not block each other
+    and repeat handshakes reuse keep-alive connections to the query engine.
+    Returns:
+        Dict[str, Any]: The JSON response from the tool, or a dictionary with an "error" key.
+    """
+    import httpx
+    from common.http_clients import get_http_client
+    url = f"{query_engine_url}/call_tool"
+    payload = {
+        "name": "create_credential_token",
+        "arguments": {
+            "database": database,
+            "username": username,
+            "password": password,
+            "session_id": session_id,
+            "expiry_minutes": expiry_minutes
+        }
+    }
+    try:
+        response = await get_http_client(url).post(url, json=payload, timeout=30.0)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        return {
+            "error": f"Request to {url} failed: {str(e)}",
+            "exception_type": type(e).__name__
+        }
+
 def create_zip_archive(directory_path: str, archive_name: str) -> str:
     """
     Creates a zip archive of all files in the specified directory.
@@ -144,23 +175,22 @@ async def call_mcp_tool_rest(base_url: str, tool_name: str, arguments: Dict[str,
     Calls an MCP tool via the custom REST endpoint.
     This is an async alternative to create_token_request that can be used for any tool.
     """
-    import httpx
+    from common.http_clients import get_http_client
     url = f"{base_url}/call_tool"
     payload = {
         "name": tool_name,
         "arguments": arguments
     }
     
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            return {
-                "error": f"REST tool call to {url} failed: {str(e)}",
-                "success": False
-            }
+    try:
+        response = await get_http_client(url).post(url, json=payload, timeout=60.0)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        return {
+            "error": f"REST tool call to {url} failed: {str(e)}",
+            "success": False
+        }
 
 def format_mcp_text_response(result: Dict[str, Any]) -> str:
     """
@@ -19,6 +19,7 @@ from google.adk.a2a.utils.agent_to_a2a import to_a2a
 
 # Import from common module
 from common.config import get_mcp_urls, get_max_attachments, get_ai_timeout
+from common.http_clients import close_http_clients
 from common.context import session_id_var, auth_token_var, progress_callback_var, stream_callback_var, cancelled_var, ui_context_var, db_credentials_var, timeout_signal_var
 from common.utils import format_tool_name
 # Import Root Agent factory from local agent.py
@@ -329,6 +330,7 @@ def create_app() -> FastAPI:
     async def shutdown_event():
         if hasattr(app.state, "a2a_lifespan"):
             await app.state.a2a_lifespan.__aexit__(None, None, None)
+        await close_http_clients()
 
     return app
 
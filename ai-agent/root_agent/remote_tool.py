@@ -1,10 +1,10 @@
 import logging
-import httpx
 import json
 import asyncio
 import uuid
 from typing import Dict, Any
 from google.adk.tools.function_tool import FunctionTool
+from common.http_clients import get_http_client
 from common.context import progress_callback_var, stream_callback_var, session_id_var, auth_token_var, ui_context_var, db_credentials_var
 
 logger = logging.getLogger(__name__)
@@ -40,56 +40,58 @@ def create_remote_delegate_tool(agent_name: str, endpoint_url: str) -> FunctionT
         stream_callback = stream_callback_var.get()
 
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                async with client.stream(
-                    "POST",
-                    f"{endpoint_url}/agent/generate",
-                    json={
-                        "message": message,
-                        "session_id": sub_session_id,
-                        "browser_session_id": session_id,
-                        "context": ui_context
-                    }
-                ) as response:
-                    response.raise_for_status()
-                    async for chunk in response.aiter_bytes():
-                        if not chunk:
-                            continue
-
-                        chunk_str = chunk.decode('utf-8', errors='ignore')
-
-                        # Filter out heartbeats (single spaces used for keep-alive)
-                        if chunk_str == " ":
-                            continue
-
-                        # Check for progress updates in the chunk
-                        if "▌" in chunk_str:
-                            lines = chunk_str.split('\n')
-                            for line in lines:
-                                if line.startswith("▌"):
-                                    logger.info(f"Relaying progress from {agent_name}: {line.strip()}")
-                                    if progress_callback:
-                                        clean_msg = line.replace("▌STATUS: ", "").replace("▌ERROR: ", "").replace("▌SUCCESS: ", "").strip()
-                                        progress_callback(clean_msg)
-
-                                    # Capture errors and success markers (like download links) in the return value
-                                    # so the LLM is aware of the final status and deliverables.
-                                    if "▌ERROR:" in line or "▌SUCCESS:" in line:
-                                        full_response.append(line + "\n")
-                                elif line.strip():
+            # Sub-agent responses stream for as long as the agent runs, so no timeout
+            url = f"{endpoint_url}/agent/generate"
+            async with get_http_client(url).stream(
+                "POST",
+                url,
+                json={
+                    "message": message,
+                    "session_id": sub_session_id,
+                    "browser_session_id": session_id,
+                    "context": ui_context
+                },
+                timeout=None
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    if not chunk:
+                        continue
+
+                    chunk_str = chunk.decode('utf-8', errors='ignore')
+
+                    # Filter out heartbeats (single spaces used for keep-alive)
+                    if chunk_str == " ":
+                        continue
+
+                    # Check for progress updates in the chunk
+                    if "▌" in chunk_str:
+                        lines = chunk_str.split('\n')
+                        for line in lines:
+                            if line.startswith("▌"):
+                                logger.info(f"Relaying progress from {agent_name}: {line.strip()}")
+                                if progress_callback:
+                                    clean_msg = line.replace("▌STATUS: ", "").replace("▌ERROR: ", "").replace("▌SUCCESS: ", "").strip()
+                                    progress_callback(clean_msg)
+
+                                # Capture errors and success markers (like download links) in the return value
+                                # so the LLM is aware of the final status and deliverables.
+                                if "▌ERROR:" in line or "▌SUCCESS:" in line:
                                     full_response.append(line + "\n")
-                                    if stream_callback:
-                                        try:
-                                            stream_callback(line + "\n")
-                                        except Exception as cb_err:
-                                            logger.warning(f"stream_callback error (ignored): {cb_err}")
-                        else:
-                            full_response.append(chunk_str)
-                            if stream_callback:
-                                try:
-                                    stream_callback(chunk_str)
-                                except Exception as cb_err:
-                                    logger.warning(f"stream_callback error (ignored): {cb_err}")
+                            elif line.strip():
+                                full_response.append(line + "\n")
+                                if stream_callback:
+                                    try:
+                                        stream_callback(line + "\n")
+                                    except Exception as cb_err:
+                                        logger.warning(f"stream_callback error (ignored): {cb_err}")
+                    else:
+                        full_response.append(chunk_str)
+                        if stream_callback:
+                            try:
+                                stream_callback(chunk_str)
+                            except Exception as cb_err:
+                                logger.warning(f"stream_callback error (ignored): {cb_err}")
 
         except Exception as e:
             error_msg = f"Error calling {agent_name}: {str(e)}"
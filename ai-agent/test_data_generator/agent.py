@@ -1,7 +1,6 @@
 import logging
 import os
 import json
-import httpx
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from google.adk.agents import LlmAgent
@@ -10,6 +9,7 @@ from google.adk.tools.function_tool import FunctionTool
 from common.tools import get_mcp_toolsets
 from common.config import get_mcp_urls
 from common.context import session_id_var, progress_callback_var
+from common.http_clients import get_http_client
 from common.utils import create_zip_archive
 from test_data_generator.generator import TestDataGenerator
 
@@ -37,10 +37,9 @@ async def list_tables(database: str, owner: str, filter_pattern: str) -> str:
     try:
         report_progress(f"Listing tables in {owner} matching '{filter_pattern}'...")
         payload = {"owner": owner}
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, timeout=30.0)
-            response.raise_for_status()
-            data = response.json()
+        response = await get_http_client(url).post(url, json=payload, timeout=30.0)
+        response.raise_for_status()
+        data = response.json()
 
         # Custom filtering since the REST endpoint returns everything
         pattern = filter_pattern.replace('*', '').upper()
@@ -2,10 +2,10 @@ import os
 import json
 import logging
 import asyncio
-import httpx
 from typing import List, Dict, Any, Optional
 from google import genai
 from common.context import progress_callback_var, session_id_var
+from common.http_clients import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -37,10 +37,9 @@ class TestDataGenerator:
                 "name": name,
                 "relationship_types": "FK"
             }
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, timeout=30.0)
-                response.raise_for_status()
-                return response.json()
+            response = await get_http_client(url).post(url, json=payload, timeout=30.0)
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
             logger.error(f"Error fetching details for {name} from {url}: {e}")
             return {"error": str(e)}
@@ -51,20 +50,19 @@ class TestDataGenerator:
         base_url = self.api_server_url.replace('/mcp', '')
         url = f"{base_url}/api/{db}"
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, timeout=10.0)
-                response.raise_for_status()
-                data = response.json()
-                # The endpoint returns a list of dictionaries, one of which includes the ADB status
-                for item in data:
-                    if item.get("title") == "Oracle Cloud Autonomous Database Instance":
-                        rows = item.get("rows", [])
-                        if rows:
-                            # Use case-insensitive key check
-                            row = rows[0]
-                            adb_val = row.get("Autonomous Database") or row.get("AUTONOMOUS DATABASE")
-                            return adb_val == "Yes"
-                return False
+            response = await get_http_client(url).get(url, timeout=10.0)
+            response.raise_for_status()
+            data = response.json()
+            # The endpoint returns a list of dictionaries, one of which includes the ADB status
+            for item in data:
+                if item.get("title") == "Oracle Cloud Autonomous Database Instance":
+                    rows = item.get("rows", [])
+                    if rows:
+                        # Use case-insensitive key check
+                        row = rows[0]
+                        adb_val = row.get("Autonomous Database") or row.get("AUTONOMOUS DATABASE")
+                        return adb_val == "Yes"
+            return False
         except Exception as e:
             logger.error(f"Error checking ADB status for {db} at {url}: {e}")
             return False
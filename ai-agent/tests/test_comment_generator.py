@@ -1,4 +1,5 @@
 import pytest
+import asyncio
 import os
 import json
 from unittest.mock import MagicMock, AsyncMock, patch
@@ -78,3 +79,310 @@ async def test_comment_generator_run_no_objects(tmp_path):
                 count = await generator.run(wildcard="%", output_file=str(output_file))
                 assert count == 0
         mock_call.assert_awaited()
+
+def make_session_toolset():
+    """Mock a toolset whose session manager caches one session, like ADK's MCPSessionManager."""
+    toolset = MagicMock(spec=McpToolset)
+    manager = MagicMock()
+    manager._sessions = {}
+    manager._is_session_disconnected = MagicMock(return_value=False)
+    manager.close = AsyncMock()
+
+    async def create_session():
+        if "default" in manager._sessions:
+            return manager._sessions["default"][0]
+        session = MagicMock()
+        session.call_tool = AsyncMock(return_value={"ok": True})
+        session.send_ping = AsyncMock()
+        manager._sessions["default"] = (session, MagicMock(), None)
+        return session
+
+    async def cleanup_session(session_key, exit_stack, loop):
+        del manager._sessions[session_key]
+
+    manager.create_session = AsyncMock(side_effect=create_session)
+    manager._cleanup_session = AsyncMock(side_effect=cleanup_session)
+    toolset._mcp_session_manager = manager
+    return toolset
+
+@pytest.mark.asyncio
+async def test_mcp_client_reuses_session_per_toolset():
+    api_tools = make_session_toolset()
+    qe_tools = make_session_toolset()
+    client = MCPClient(api_tools, qe_tools)
+
+    for _ in range(3):
+        await client._call_mcp_tool(api_tools, "getContext", {})
+        await client._call_mcp_tool(qe_tools, "execute_sql", {})
+
+    assert api_tools._mcp_session_manager.create_session.await_count == 1
+    assert qe_tools._mcp_session_manager.create_session.await_count == 1
+    stats = client.get_session_stats()
+    assert (stats["created"], stats["reused"], stats["replaced"]) == (2, 4, 0)
+
+@pytest.mark.asyncio
+async def test_mcp_client_session_stats_count_creation_and_reuse():
+    qe_tools = make_session_toolset()
+    client = MCPClient(make_session_toolset(), qe_tools)
+
+    reused = []
+    for _ in range(4):
+        await client._call_mcp_tool(qe_tools, "execute_sql", {})
+        reused.append(client.get_session_stats()["reused"])
+
+    stats = client.get_session_stats()
+    assert stats["created"] == 1
+    assert reused == [0, 1, 2, 3]
+    assert stats["total_create_ms"] >= 0
+    assert stats["avg_create_ms"] == stats["total_create_ms"]
+
+@pytest.mark.asyncio
+async def test_mcp_client_reconnects_disconnected_session():
+    api_tools = make_session_toolset()
+    client = MCPClient(api_tools, make_session_toolset())
+
+    first = await client._get_session(api_tools)
+    api_tools._mcp_session_manager._is_session_disconnected.return_value = True
+    second = await client._get_session(api_tools)
+
+    assert second is not first
+    api_tools._mcp_session_manager._cleanup_session.assert_awaited_once()
+    api_tools._mcp_session_manager.close.assert_not_awaited()
+    assert client.get_session_stats()["replaced"] == 1
+
+@pytest.mark.asyncio
+async def test_mcp_client_retries_failed_call_on_new_session():
+    api_tools = make_session_toolset()
+    client = MCPClient(api_tools, make_session_toolset())
+
+    session = await client._get_session(api_tools)
+    session.call_tool.side_effect = Exception("connection reset")
+
+    result = await client._call_mcp_tool(api_tools, "getContext", {})
+    assert result == {"ok": True}
+    assert client.get_session_stats()["replaced"] == 1
+
+@pytest.mark.asyncio
+async def test_mcp_client_concurrent_failures_replace_session_once():
+    api_tools = make_session_toolset()
+    client = MCPClient(api_tools, make_session_toolset())
+
+    session = await client._get_session(api_tools)
+    started = asyncio.Event()
+    calls = []
+
+    async def fail_together(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 5:
+            started.set()
+        await started.wait()
+        raise Exception("connection reset")
+    session.call_tool.side_effect = fail_together
+
+    results = await asyncio.gather(*[client._call_mcp_tool(api_tools, "getContext", {}) for _ in range(5)])
+    assert results == [{"ok": True}] * 5
+    stats = client.get_session_stats()
+    assert (stats["created"], stats["replaced"], stats["retried_calls"]) == (2, 1, 5)
+    assert api_tools._mcp_session_manager.create_session.await_count == 2
+
+@pytest.mark.asyncio
+async def test_mcp_client_pings_idle_session():
+    api_tools = make_session_toolset()
+    client = MCPClient(api_tools, make_session_toolset())
+
+    session = await client._get_session(api_tools)
+    client._sessions[id(api_tools)] = (session, 0)
+    session.send_ping.side_effect = Exception("stale")
+
+    assert await client._get_session(api_tools) is not session
+    session.send_ping.assert_awaited_once()
+
+def make_generator(concurrency):
+    client = MCPClient(MagicMock(spec=McpToolset), MagicMock(spec=McpToolset))
+    client.call_query_engine_tool = AsyncMock(return_value={})
+    with patch("comment_generator.main.genai.Client"):
+        generator = CommentGenerator(client, "db", "HR", session_id="concurrency-test", concurrency=concurrency, batch_max_tables=1)
+    generator.create_credential_token = AsyncMock(return_value=True)
+    tables = {f"T{i}": {"type": "TABLE", "missing_table_comment": True, "missing_columns": []} for i in range(6)}
+    generator.find_missing_comments = AsyncMock(return_value=tables)
+    generator.prefetch = AsyncMock()
+    return generator
+
+@pytest.mark.asyncio
+async def test_run_processes_tables_concurrently_in_order(tmp_path):
+    import asyncio
+    generator = make_generator(concurrency=3)
+    in_flight = 0
+    peak = 0
+
+    async def process_table(table_name, info):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        # Later tables finish first
+        await asyncio.sleep(0.01 * (6 - int(table_name[1:])))
+        in_flight -= 1
+        return [f"COMMENT ON TABLE HR.{table_name} IS 'x';"]
+
+    generator.process_table = process_table
+    output_file = tmp_path / "comments.sql"
+    assert await generator.run("%", str(output_file)) == 6
+    assert peak == 3
+
+    written = [line for line in output_file.read_text().splitlines() if line.startswith("COMMENT")]
+    assert written == [f"COMMENT ON TABLE HR.T{i} IS 'x';" for i in range(6)]
+    assert set(generator.get_already_processed_stats(str(output_file))) == {f"T{i}" for i in range(6)}
+
+@pytest.mark.asyncio
+async def test_run_stops_at_cancellation(tmp_path):
+    from common.context import cancelled_sessions
+    generator = make_generator(concurrency=1)
+
+    async def process_table(table_name, info):
+        if table_name == "T1":
+            cancelled_sessions.add(generator.session_id)
+        return [f"COMMENT ON TABLE HR.{table_name} IS 'x';"]
+
+    generator.process_table = process_table
+    output_file = tmp_path / "comments.sql"
+    try:
+        # The final progress report raises once the session is cancelled (handled by the agent)
+        with pytest.raises(Exception, match="Task stopped"):
+            await generator.run("%", str(output_file))
+    finally:
+        cancelled_sessions.discard(generator.session_id)
+    assert generator.generated_count == 2
+    assert "HR.T1" in output_file.read_text()
+    assert "HR.T2" not in output_file.read_text()
+
+def make_batch_generator(**kwargs):
+    client = MCPClient(MagicMock(spec=McpToolset), MagicMock(spec=McpToolset))
+    client.get_context = AsyncMock(return_value={"columns": ["ID", "NAME"]})
+    with patch("comment_generator.main.genai.Client"):
+        generator = CommentGenerator(client, "db", "HR", **kwargs)
+    generator.get_sample_rows = AsyncMock(return_value=[{"ID": 1, "NAME": "a"}])
+    return generator
+
+def test_plan_batches_groups_small_tables():
+    generator = make_batch_generator(batch_max_tables=2)
+    small = {"type": "TABLE", "missing_table_comment": True, "missing_columns": ["CODE"]}
+    large = {"type": "TABLE", "missing_table_comment": True, "missing_columns": [f"C{i}" for i in range(20)]}
+    to_process = [("A", small), ("B", small), ("C", small), ("BIG", large), ("D", small)]
+    batches = generator.plan_batches(to_process)
+    assert [[name for name, _ in batch] for batch in batches] == [["A", "B"], ["C"], ["BIG"], ["D"]]
+
+def test_pack_prompts_respects_token_budget():
+    generator = make_batch_generator(batch_token_budget=150)
+    info = {"type": "TABLE", "missing_table_comment": True, "missing_columns": ["CODE"]}
+    inputs = [(name, info, {"columns": ["CODE"]}, []) for name in ["A", "B", "C"]]
+    groups = generator.pack_prompts(inputs)
+    assert len(groups) > 1
+    assert [item[0] for group in groups for item in group] == ["A", "B", "C"]
+
+@pytest.mark.asyncio
+async def test_process_batch_splits_response_and_falls_back():
+    generator = make_batch_generator()
+    info = {"type": "TABLE", "missing_table_comment": True, "missing_columns": ["CODE"]}
+    generator.generate_comments_multi = AsyncMock(return_value={
+        "A": {"table_comment": "Table A", "CODE_comment": "Code of A"}
+    })
+    generator.generate_comments_batch = AsyncMock(return_value={"table_comment": "Table B"})
+
+    results = await generator.process_batch([("A", info), ("B", info)])
+
+    generator.generate_comments_multi.assert_awaited_once()
+    # Only the table missing from the multi-table response is requested on its own
+    generator.generate_comments_batch.assert_awaited_once()
+    assert generator.generate_comments_batch.await_args.args[0] == "B"
+    assert results == [
+        ["COMMENT ON TABLE HR.A IS 'Table A';", "COMMENT ON COLUMN HR.A.CODE IS 'Code of A';"],
+        ["COMMENT ON TABLE HR.B IS 'Table B';"]
+    ]
+
+@pytest.mark.asyncio
+async def test_generate_comments_multi_parses_per_table_json():
+    generator = make_batch_generator()
+    info = {"type": "TABLE", "missing_table_comment": True, "missing_columns": []}
+    response = MagicMock()
+    response.text = '```json\n{"A": {"table_comment": "Table A"}, "B": "not an object"}\n```'
+    generator.genai_client.models.generate_content.return_value = response
+
+    result = await generator.generate_comments_multi([("A", info, {}, []), ("B", info, {}, [])])
+    assert result == {"A": {"table_comment": "Table A"}}
+
+@pytest.mark.asyncio
+async def test_prefetch_metadata_groups_schema_columns(tmp_path, monkeypatch):
+    generator = make_batch_generator()
+    metadata_dir = tmp_path / "metadata"
+    metadata_dir.mkdir()
+    columns = [{"tableName": "ORDERS", "columnName": "ID", "dataType": "NUMBER"},
+               {"tableName": "ORDERS", "columnName": "CUSTOMER_ID", "dataType": "NUMBER"},
+               {"tableName": "CUSTOMERS", "columnName": "ID", "dataType": "NUMBER"},
+               {"tableName": "OTHER", "columnName": "ID", "dataType": "NUMBER"}]
+    (metadata_dir / "db_hr_columns.json").write_text(json.dumps(columns))
+    monkeypatch.setenv("VISULATE_DOWNLOADS", str(tmp_path))
+
+    relationships = [{"tableName": "ORDERS", "constraintName": "ORD_CUST_FK", "referencedTable": "CUSTOMERS", "referencedOwner": "HR"}]
+    generator.client.call_api_server_tool = AsyncMock(side_effect=[
+        {"count": 4, "cacheFile": "db_hr_columns.json"}, relationships
+    ])
+
+    await generator.prefetch_metadata(["ORDERS", "CUSTOMERS"])
+
+    assert generator.client.call_api_server_tool.await_count == 2
+    orders = await generator.get_table_context("ORDERS", "TABLE")
+    assert [c["columnName"] for c in orders["columns"]] == ["ID", "CUSTOMER_ID"]
+    assert orders["foreignKeys"][0]["referencedTable"] == "CUSTOMERS"
+    customers = await generator.get_table_context("CUSTOMERS", "TABLE")
+    assert customers["referencedBy"] == [{"constraintName": "ORD_CUST_FK", "table": "ORDERS"}]
+    generator.client.get_context.assert_not_awaited()
+
+    # Objects without prefetched metadata fall back to getContext
+    await generator.get_table_context("MISSING", "VIEW")
+    generator.client.get_context.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_prefetch_sample_rows_uses_union_all():
+    client = MCPClient(MagicMock(spec=McpToolset), MagicMock(spec=McpToolset))
+    with patch("comment_generator.main.genai.Client"):
+        generator = CommentGenerator(client, "db", "HR")
+    client.execute_sql = AsyncMock(return_value={"success": True, "data": [
+        {"TABLE_NAME": "A", "ROW_JSON": '{"ID": 1}'},
+        {"TABLE_NAME": "A", "ROW_JSON": '{"ID": 2}'},
+        {"TABLE_NAME": "B", "ROW_JSON": '{"CODE": "x"}'}
+    ]})
+
+    await generator.prefetch_sample_rows(["A", "B", "C"])
+
+    client.execute_sql.assert_awaited_once()
+    sql = client.execute_sql.await_args.args[1]
+    assert sql.count("UNION ALL") == 2
+    assert "JSON_OBJECT(*)" in sql
+    assert await generator.get_sample_rows("A") == [{"ID": 1}, {"ID": 2}]
+    client.execute_sql.assert_awaited_once()
+
+    # A table with no rows in the batch is sampled on its own
+    client.execute_sql.return_value = {"success": True, "data": []}
+    assert await generator.get_sample_rows("C") == []
+    assert client.execute_sql.await_count == 2
+
+@pytest.mark.asyncio
+async def test_prefetch_sample_rows_skips_truncated_batch():
+    client = MCPClient(MagicMock(spec=McpToolset), MagicMock(spec=McpToolset))
+    with patch("comment_generator.main.genai.Client"):
+        generator = CommentGenerator(client, "db", "HR")
+    client.execute_sql = AsyncMock(return_value={"success": True, "truncated": True, "data": [
+        {"TABLE_NAME": "A", "ROW_JSON": '{"ID": 1}'}
+    ]})
+
+    await generator.prefetch_sample_rows(["A", "B"])
+
+    assert generator._prefetched_samples == {}
+
+def test_postgres_sample_rows_sql():
+    generator = make_batch_generator()
+    generator.db_type = "postgres"
+    generator.schema = "public"
+    sql = generator._sample_rows_sql(["orders"])
+    assert sql == ("SELECT 'orders' AS table_name, row_to_json(s)::text AS row_json "
+                   'FROM (SELECT * FROM "public"."orders" LIMIT 3) s')
@@ -0,0 +1,83 @@
+import asyncio
+import httpx
+import pytest
+from common.http_clients import HttpClientRegistry, upstream_key
+
+
+def test_upstream_key_uses_origin():
+    assert upstream_key("http://localhost:5000/mcp-sql/call_tool") == "http://localhost:5000"
+    assert upstream_key("https://visulate.example.com/mcp") == "https://visulate.example.com:443"
+
+
+@pytest.mark.asyncio
+async def test_one_client_per_upstream():
+    registry = HttpClientRegistry(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    api = registry.get("http://localhost:3000/mcp/context/pdb21")
+    assert registry.get("http://localhost:3000/api/pdb21") is api
+    query_engine = registry.get("http://localhost:5000/mcp-sql/call_tool")
+    assert query_engine is not api
+    assert registry.get_stats()["upstreams"] == ["http://localhost:3000", "http://localhost:5000"]
+
+    await registry.close_all()
+    assert api.is_closed and query_engine.is_closed
+    assert registry.get_stats()["upstreams"] == []
+
+
+@pytest.mark.asyncio
+async def test_closed_client_is_replaced():
+    registry = HttpClientRegistry()
+    client = registry.get("http://localhost:5000")
+    await client.aclose()
+    assert registry.get("http://localhost:5000") is not client
+    assert registry.created == 2
+    await registry.close_all()
+
+
+def test_clients_are_bound_to_their_event_loop():
+    registry = HttpClientRegistry()
+
+    async def get_client():
+        return registry.get("http://localhost:5000")
+
+    first = asyncio.run(get_client())
+    second = asyncio.run(get_client())
+    assert first is not second
+
+    # The replaced client's loop has stopped, so it is kept for close_all
+    assert registry.get_stats()["retired"] == 1
+    asyncio.run(registry.close_all())
+    assert first.is_closed and second.is_closed
+    assert registry.get_stats()["retired"] == 0
+
+
+def test_replaced_client_closed_on_its_running_loop():
+    import threading
+    registry = HttpClientRegistry()
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        async def get_client():
+            return registry.get("http://localhost:5000")
+
+        first = asyncio.run_coroutine_threadsafe(get_client(), other_loop).result(5)
+        second = asyncio.run(get_client())
+        assert second is not first
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), other_loop).result(5)
+        assert first.is_closed
+        assert registry.get_stats()["retired"] == 0
+    finally:
+        other_loop.call_soon_threadsafe(other_loop.stop)
+        thread.join(5)
+        other_loop.close()
+
+
+@pytest.mark.asyncio
+async def test_limits_from_config(monkeypatch):
+    monkeypatch.setenv("VISULATE_HTTP_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("VISULATE_HTTP_TIMEOUT", "12")
+    registry = HttpClientRegistry()
+    client = registry.get("http://localhost:3000")
+    assert client.timeout.read == 12.0
+    assert client._transport._pool._max_connections == 7
+    await registry.close_all()
@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+from common.token_cache import TokenCache, token_cache
+from common.tools import get_valid_token, create_smart_execute_sql_tool
+from common.context import browser_session_id_var
+
+def test_token_cache_keyed_by_session_database_user_and_password():
+    cache = TokenCache()
+    cache.put("s1", "pdb21", "rntmgr2", "secret", "tok1")
+    assert cache.get("s1", "PDB21", "RNTMGR2", "secret") == "tok1"
+    assert cache.get("s2", "pdb21", "RNTMGR2", "secret") is None
+    assert cache.get("s1", "pdb21", "RNTMGR2", "changed") is None
+    assert cache.get_stats() == {"size": 1, "hits": 1, "misses": 2}
+
+def test_token_cache_refreshes_before_expiry():
+    cache = TokenCache(refresh_margin=120)
+    cache.put("s1", "pdb21", "RNTMGR2", "secret", "tok1", expiry_minutes=1)
+    assert cache.get("s1", "pdb21", "RNTMGR2", "secret") is None
+    assert cache.get_stats()["size"] == 0
+
+def test_token_cache_invalidate():
+    cache = TokenCache()
+    cache.put("s1", "pdb21", "RNTMGR2", "secret", "tok1")
+    assert cache.invalidate("tok1") is True
+    assert cache.get("s1", "pdb21", "RNTMGR2", "secret") is None
+
+@pytest.mark.asyncio
+async def test_get_valid_token_reuses_cached_token():
+    token_cache.clear()
+    browser_session_id_var.set("browser-1")
+    response = {"content": [{"type": "text", "text": "Use this token for execute_sql calls: tok-123"}]}
+    with patch("common.tools.CredentialManager.get_password", return_value=("pw", "test", "RNTMGR2")), \
+         patch("common.tools.create_token_request_async", new_callable=AsyncMock, return_value=response) as mock_request:
+        assert await get_valid_token("pdb21", "RNTMGR2") == "tok-123"
+        assert await get_valid_token("pdb21", "RNTMGR2") == "tok-123"
+        assert mock_request.call_count == 1
+
+@pytest.mark.asyncio
+async def test_execute_sql_retries_with_new_token_when_rejected():
+    token_cache.clear()
+    browser_session_id_var.set("browser-2")
+    token_cache.put("browser-2", "pdb21", "RNTMGR2", "pw", "stale-token")
+    minted = {"content": [{"type": "text", "text": "Use this token for execute_sql calls: fresh-token"}]}
+    rejected = {"content": [{"type": "text", "text": "Query failed on pdb21:\n\nError: Invalid or expired credential token"}]}
+    succeeded = {"content": [{"type": "text", "text": "Query executed successfully on pdb21"}]}
+
+    tool = create_smart_execute_sql_tool(None)
+    with patch("common.tools.CredentialManager.get_password", return_value=("pw", "test", "RNTMGR2")), \
+         patch("common.tools.create_token_request_async", new_callable=AsyncMock, return_value=minted), \
+         patch("common.tools.call_mcp_tool_rest", new_callable=AsyncMock, side_effect=[rejected, succeeded]) as mock_call:
+        result = await tool.func(database="pdb21", sql="select 1 from dual")
+
+    assert result == "Query executed successfully on pdb21"
+    tokens = [call.args[2]["credential_token"] for call in mock_call.call_args_list]
+    assert tokens == ["stale-token", "fresh-token"]
@@ -33,3 +33,37 @@ def test_create_zip_archive():
     finally:
         # Cleanup
         shutil.rmtree(temp_dir)
+
+@pytest.mark.asyncio
+async def test_create_token_request_async_uses_shared_client():
+    import httpx
+    from unittest.mock import patch
+    from common import utils
+    from common import http_clients as http_clients_module
+    from common.http_clients import HttpClientRegistry
+
+    def handler(request):
+        assert request.url.path == "/mcp-sql/call_tool"
+        return httpx.Response(200, json={"content": [{"type": "text", "text": "Use this token for execute_sql calls: abc"}]})
+
+    registry = HttpClientRegistry(transport=httpx.MockTransport(handler))
+    with patch.object(http_clients_module, "http_clients", registry):
+        result = await utils.create_token_request_async("http://qe/mcp-sql", "pdb21", "u", "p", "s1")
+        await utils.create_token_request_async("http://qe/mcp-sql", "pdb21", "u", "p", "s2")
+    assert utils.parse_token_from_response(result) == "abc"
+    assert registry.created == 1
+    await registry.close_all()
+
+@pytest.mark.asyncio
+async def test_create_token_request_async_reports_errors():
+    import httpx
+    from unittest.mock import patch
+    from common import utils
+    from common import http_clients as http_clients_module
+    from common.http_clients import HttpClientRegistry
+
+    registry = HttpClientRegistry(transport=httpx.MockTransport(lambda request: httpx.Response(500)))
+    with patch.object(http_clients_module, "http_clients", registry):
+        result = await utils.create_token_request_async("http://qe/mcp-sql", "pdb21", "u", "p", "s1")
+    assert result["exception_type"] == "HTTPStatusError"
+    await registry.close_all()
@@ -98,9 +98,12 @@ def create_app(test_config=None):
     @app.errorhandler(Exception)
     def handle_error(e):
         code = 500
+        headers = {}
         if isinstance(e, HTTPException):
             code = e.code
-        return jsonify(error=str(e)), code
+            if getattr(e, "retry_after", None):
+                headers["Retry-After"] = str(e.retry_after)
+        return jsonify(error=str(e)), code, headers
 
     from . import sql2csv
     app.register_blueprint(sql2csv.bp)
@@ -108,4 +111,14 @@ def create_app(test_config=None):
     from . import mcp
     app.register_blueprint(mcp.bp)
 
+    from . import export_jobs
+    app.register_blueprint(export_jobs.bp)
+
+    # Expire credential tokens in the background rather than on the request path
+    from .secure_credentials import credential_sweeper
+    credential_sweeper.start()
+
+    # Remove expired export jobs and their spool files
+    export_jobs.job_manager.start()
+
     return app
\ No newline at end of file
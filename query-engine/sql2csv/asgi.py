@@ -0,0 +1,375 @@
+"""
+ASGI entry point for the query engine.
+Streams /sql results with the asyncio database drivers so a slow client holds a
+coroutine rather than a worker thread. Every other route is served by the Flask app.
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+import anyio
+import oracledb
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import HTTPException, abort
+from werkzeug.test import EnvironBuilder
+
+# psycopg (v3) is optional - it is only needed for Postgres endpoints in ASGI mode
+try:
+    import psycopg
+    PSYCOPG_AVAILABLE = True
+except ImportError:
+    PSYCOPG_AVAILABLE = False
+
+from . import create_app
+from . import sql2csv
+from .result_cache import result_cache, get_cache_config
+from .connection_pool import (
+    ConnectionPoolManager, get_pool_config, oracle_connect_args, postgres_connect_args,
+    is_pool_busy_error, POOL_BUSY_RETRY_AFTER
+)
+from .encoders import (
+    CsvEncoder, JsonEncoder, ArrowEncoder, ARROW_MIMETYPES, choose_content_encoding, compress_chunks_async
+)
+
+logger = logging.getLogger(__name__)
+
+
+def async_postgres_connect_args(params: dict) -> dict:
+    """Build psycopg (v3) connection keyword arguments from endpoint parameters."""
+    args = postgres_connect_args(params)
+    if "database" in args:
+        args["dbname"] = args.pop("database")
+    if "dsn" in args:
+        args["conninfo"] = args.pop("dsn")
+    return args
+
+
+class AsyncOraclePoolManager:
+    """
+    Oracle connection pools for the asyncio driver.
+
+    DESIGN:
+    - Pools are keyed like ConnectionPoolManager: (endpoint, username, password fingerprint)
+    - Pools are created lazily inside the event loop and closed when the app shuts down
+    - Endpoints with "pool": false get a dedicated connection per request
+    - Postgres endpoints open a dedicated psycopg connection per request
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._borrowed = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, endpoint: str, username: str, password: str, params: dict):
+        """Borrow a connection for an endpoint, creating the pool on first use."""
+        config = get_pool_config(params)
+        if not config["enabled"]:
+            return await oracledb.connect_async(user=username, password=password, **oracle_connect_args(params))
+
+        key = ConnectionPoolManager._pool_key(endpoint, username, password)
+        async with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = oracledb.create_pool_async(
+                    user=username, password=password,
+                    min=config["min"], max=config["max"], increment=config["increment"],
+                    getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+                    wait_timeout=int(config["wait_timeout"] * 1000),
+                    timeout=int(config["idle_timeout"]),
+                    **oracle_connect_args(params)
+                )
+                self._pools[key] = pool
+                logger.info(f"Created async oracle connection pool for {endpoint}/{username} (max={config['max']})")
+
+        try:
+            connection = await pool.acquire()
+        except Exception:
+            # Drop pools that have never produced a connection (e.g. bad password)
+            async with self._lock:
+                if pool.opened == 0 and self._pools.get(key) is pool:
+                    del self._pools[key]
+                    await pool.close(force=True)
+            raise
+        self._borrowed[id(connection)] = pool
+        return connection
+
+    async def release(self, connection, discard: bool = False):
+        """
+        Return a connection to its pool, or close it if it was not pooled.
+
+        Args:
+            discard: drop a pooled connection instead of returning it (e.g. after a call was cancelled)
+        """
+        pool = self._borrowed.pop(id(connection), None)
+        if pool is None:
+            await connection.close()
+        elif discard:
+            await pool.drop(connection)
+        else:
+            # Do not carry a request's timeout_ms over to the next borrower
+            connection.call_timeout = 0
+            await pool.release(connection)
+
+    async def close_all(self):
+        """Close every pool managed by this instance."""
+        async with self._lock:
+            for pool in self._pools.values():
+                try:
+                    await pool.close(force=True)
+                except Exception as e:
+                    logger.warning(f"Error closing async connection pool: {e}")
+            self._pools.clear()
+            self._borrowed.clear()
+
+
+# Global async pool manager instance (one per ASGI worker process)
+async_pool_manager = AsyncOraclePoolManager()
+
+
+async def get_async_connection(query: dict, is_postgres: bool):
+    """Open (Postgres) or borrow (Oracle) an asyncio driver connection for a prepared query."""
+    params = query["params"]
+    if is_postgres and not PSYCOPG_AVAILABLE:
+        abort(501, description="Postgres endpoints require psycopg to be installed in ASGI mode")
+    try:
+        if is_postgres:
+            connection = await psycopg.AsyncConnection.connect(
+                user=query["username"], password=query["password"], **async_postgres_connect_args(params)
+            )
+            await connection.set_read_only(True)
+        else:
+            connection = await async_pool_manager.acquire(query["endpoint"], query["username"], query["password"], params)
+            connection.outputtypehandler = sql2csv.output_type_handler
+        return connection
+    except Exception as e:
+        if is_pool_busy_error(e):
+            abort(503, description=f"No database connection available, try again later: {str(e)}",
+                  retry_after=POOL_BUSY_RETRY_AFTER)
+        abort(401, description=str(e))
+
+
+async def release_async_connection(connection, is_postgres: bool, discard: bool = False):
+    """Close (Postgres) or return (Oracle) an asyncio driver connection."""
+    try:
+        if is_postgres:
+            await connection.close()
+        else:
+            await async_pool_manager.release(connection, discard)
+    except Exception as e:
+        logger.warning(f"Error releasing connection: {str(e)}")
+
+
+async def get_async_cursor(connection, query: dict, is_postgres: bool):
+    """Create a cursor and execute a prepared query."""
+    sql, binds, timeout_ms = query["sql"], query["binds"], query["timeout_ms"]
+    try:
+        if timeout_ms and is_postgres:
+            # Transaction scoped, like the WSGI path; the connection is closed after the request
+            await connection.execute("select set_config('statement_timeout', %s, true)", [str(timeout_ms)])
+        elif timeout_ms:
+            connection.call_timeout = timeout_ms
+        if is_postgres:
+            # A named (server side) cursor streams rows instead of buffering the result in the client
+            cursor = connection.cursor(name="sql2csv")
+            cursor.itersize = query["arraysize"]
+        else:
+            cursor = connection.cursor()
+            if query["prefetchrows"]:
+                cursor.prefetchrows = query["prefetchrows"]
+            await cursor.execute("set transaction read only")
+        cursor.arraysize = query["arraysize"]
+
+        if binds:
+            await cursor.execute(*sql2csv.translate_binds(sql, binds, is_postgres))
+        else:
+            await cursor.execute(sql)
+        return cursor
+    except Exception as e:
+        await release_async_connection(connection, is_postgres)
+        if timeout_ms and sql2csv.is_timeout_error(e):
+            abort(504, description=f"Query exceeded timeout_ms ({timeout_ms}): {str(e)}")
+        abort(400, description=str(e))
+
+
+async def cancel_async_query(connection, is_postgres: bool):
+    """Interrupt the database call running on a connection."""
+    try:
+        with anyio.CancelScope(shield=True):
+            if is_postgres:
+                await connection.cancel_safe()
+            else:
+                connection.cancel()
+    except Exception as e:
+        logger.warning(f"Error cancelling query: {str(e)}")
+
+
+async def stream_results(query: dict, connection, cursor, is_postgres: bool):
+    """Async generator of encoded result chunks in the query's output format."""
+    output_format = query["output_format"]
+    window = query["window"]
+    encoder = None
+    cancelled = False
+    try:
+        columns = [desc[0] for desc in cursor.description]
+        if output_format in ARROW_MIMETYPES:
+            fields = sql2csv.build_arrow_fields(cursor.description, is_postgres, query["download_lobs"])
+            encoder = ArrowEncoder(fields, output_format, query["chunk_size"])
+            plan = []
+        else:
+            plan = sql2csv.build_converter_plan(cursor.description, is_postgres, query["download_lobs"])
+            if output_format == 'csv':
+                encoder = CsvEncoder(query["chunk_size"])
+                if query["csv_header"] == 'y':
+                    encoder.write_header(columns)
+            else:
+                encoder = JsonEncoder(columns, output_format == 'json-compact', query["chunk_size"])
+                yield encoder.start()
+
+        async for rows in window.async_blocks(cursor):
+            chunk = encoder.write_rows(sql2csv.apply_converter_plan(plan, rows))
+            if chunk:
+                yield chunk
+
+        if output_format == 'csv':
+            yield encoder.flush()
+        elif output_format in ARROW_MIMETYPES:
+            yield encoder.finish()
+        else:
+            yield encoder.finish({"executionTime": time.time() - query["start_time"], **window.trailer()})
+        window.complete = True
+    except asyncio.CancelledError:
+        # The client disconnected while a fetch was running; stop it on the database too
+        cancelled = True
+        await cancel_async_query(connection, is_postgres)
+        raise
+    except Exception as e:
+        logger.error(f"Error during {output_format} streaming: {str(e)}")
+        if output_format == 'csv':
+            yield (encoder.flush() if encoder else '') + f"ERROR: {str(e)}"
+        elif output_format in ARROW_MIMETYPES:
+            # Error text cannot be embedded in a binary stream. Re-raise so the server aborts the
+            # chunked response: a stream that just stops would be read as a complete result
+            raise
+        else:
+            yield (encoder.flush() if encoder else '') + f'{{"error": "Internal Server Error: {str(e)}"}}'
+    finally:
+        # Cleanup must run even though the task is being cancelled
+        with anyio.CancelScope(shield=True):
+            try:
+                closed = cursor.close()
+                if inspect.isawaitable(closed):
+                    await closed
+            except Exception:
+                pass
+            await release_async_connection(connection, is_postgres, discard=cancelled)
+
+
+async def replay_cached(cached):
+    """Async generator over a cached result, reading spilled results off the event loop."""
+    chunks = iter(cached.chunks)
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def cors_headers(request) -> dict:
+    """Return CORS headers for a whitelisted Origin, matching the Flask app's /sql/* policy."""
+    origin = request.headers.get('origin')
+    origins = os.getenv('CORS_ORIGIN_WHITELIST')
+    if origin and origins and origin in origins.split(','):
+        return {"Access-Control-Allow-Origin": origin, "Vary": "Origin"}
+    return {}
+
+
+async def run_sql(flask_app, request):
+    """Async entry point for running SQL and streaming results (POST /sql and /sql/<endpoint>)"""
+    headers = cors_headers(request)
+    body = await request.body()
+
+    # Validate the request with the same code as the WSGI route
+    environ = EnvironBuilder(
+        path=request.url.path, method="POST", headers=list(request.headers.items()), data=body
+    ).get_environ()
+    try:
+        with flask_app.request_context(environ):
+            query = sql2csv.prepare_query(request.path_params.get("endpoint"))
+        is_postgres = query["params"].get("dbType", "oracle") == "postgres"
+        cache_config = get_cache_config(query["params"])
+        cached = None
+        if cache_config:
+            cache_key = sql2csv.get_cache_key(query)
+            cached = result_cache.get(cache_key)
+        if cached is None:
+            connection = await get_async_connection(query, is_postgres)
+            cursor = await get_async_cursor(connection, query, is_postgres)
+    except HTTPException as e:
+        logger.info(f"{request.client.host if request.client else '-'} POST {request.url.path} {e.code}")
+        if e.code == 503 and getattr(e, "retry_after", None):
+            headers = {**headers, "Retry-After": str(e.retry_after)}
+        return JSONResponse({"error": str(e)}, status_code=e.code, headers=headers)
+
+    output_format = query["output_format"]
+    if output_format == 'csv':
+        media_type = 'text/csv'
+    else:
+        media_type = ARROW_MIMETYPES.get(output_format, 'application/json')
+
+    if cached is not None:
+        chunks = replay_cached(cached)
+        headers["X-Cache"] = "HIT"
+    else:
+        chunks = stream_results(query, connection, cursor, is_postgres)
+        if cache_config:
+            chunks = result_cache.capture_async(cache_key, chunks, media_type, cache_config,
+                                                lambda: query["window"].complete)
+            headers["X-Cache"] = "MISS"
+
+    compression = sql2csv.get_compression_config(query["params"])
+    # Parquet pages are already compressed
+    if compression is not None and output_format != 'parquet':
+        encoding = choose_content_encoding(request.headers.get('accept-encoding'))
+        if encoding:
+            chunks = compress_chunks_async(chunks, encoding, compression[f'{encoding}_level'])
+            headers["Content-Encoding"] = encoding
+            headers["Vary"] = ", ".join(filter(None, [headers.get("Vary"), "Accept-Encoding"]))
+
+    logger.info(f"{request.client.host if request.client else '-'} POST {request.url.path} 200")
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+def create_asgi_app(test_config=None):
+    """
+    Create the ASGI application.
+
+    POST /sql and /sql/<endpoint> run on the event loop. All other routes (including
+    /mcp-sql) are served by the Flask app through a WSGI adapter.
+    """
+    flask_app = create_app(test_config)
+
+    async def sql_route(request):
+        return await run_sql(flask_app, request)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await async_pool_manager.close_all()
+
+    app = Starlette(
+        routes=[
+            Route("/sql", sql_route, methods=["POST"]),
+            Route("/sql/{endpoint}", sql_route, methods=["POST"]),
+            Mount("/", app=WSGIMiddleware(flask_app))
+        ],
+        lifespan=lifespan
+    )
+    app.state.flask_app = flask_app
+    return app
@@ -0,0 +1,309 @@
+"""
+Connection pooling for the query engine.
+Keeps one driver pool per (endpoint, username) so repeat queries skip the login handshake.
+"""
+
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import oracledb
+import psycopg2
+import psycopg2.pool
+
+logger = logging.getLogger(__name__)
+
+
+# Defaults used when an endpoint does not supply a "pool" object in endpoints.json
+DEFAULT_POOL_CONFIG = {
+    "enabled": True,
+    "min": 0,               # connections opened when the pool is created
+    "max": 4,               # upper bound on pooled connections per (endpoint, username)
+    "increment": 1,         # Oracle only - connections opened when the pool grows
+    "idle_timeout": 600,    # seconds before an unused pool is closed
+    "wait_timeout": 30      # Oracle only - seconds to wait for a free pooled connection
+}
+
+# Per-process key used to fingerprint passwords in the pool key (never leaves RAM)
+_DIGEST_KEY = secrets.token_bytes(32)
+
+# Driver errors meaning no connection was free within the pool's wait timeout, or the
+# database refused another session. These are reported as 503 rather than as a login failure.
+POOL_BUSY_ERROR_CODES = {
+    "DPY-4005",     # python-oracledb: timed out waiting for a pooled connection
+    "ORA-24418",    # cannot open further sessions
+    "ORA-24496",    # timed out waiting for a free session
+    "ORA-00018",    # maximum number of sessions exceeded
+    "53300"         # Postgres too_many_connections
+}
+
+# Seconds a client is asked to wait before retrying when no connection is available
+POOL_BUSY_RETRY_AFTER = 5
+
+
+def oracle_connect_args(params: dict) -> dict:
+    """Build oracledb connection keyword arguments from endpoint parameters."""
+    args = {"dsn": params.get("dsn")}
+    wallet_location = params.get("wallet_location")
+    if wallet_location:
+        args.update({
+            "config_dir": wallet_location,
+            "wallet_location": wallet_location,
+            "wallet_password": params.get("wallet_password")
+        })
+    return args
+
+
+def postgres_connect_args(params: dict) -> dict:
+    """Build psycopg2 connection keyword arguments from endpoint parameters."""
+    dsn = params.get("dsn")
+    args = {}
+    if '/' in dsn and ':' in dsn and ' ' not in dsn and '=' not in dsn:
+        host_port, dbname = dsn.split('/')
+        host, port = host_port.split(':')
+        args.update({"host": host, "port": port, "database": dbname})
+    else:
+        args["dsn"] = dsn
+    return args
+
+
+def is_pool_busy_error(error) -> bool:
+    """Return True if a connection attempt failed because the pool or database had no free connection."""
+    if isinstance(error, psycopg2.pool.PoolError):
+        return "exhausted" in str(error)
+    if isinstance(error, oracledb.Error) and error.args:
+        code = getattr(error.args[0], 'full_code', None)
+    else:
+        code = getattr(error, 'pgcode', None) or getattr(error, 'sqlstate', None)
+    return code in POOL_BUSY_ERROR_CODES
+
+
+def get_pool_config(params: dict) -> dict:
+    """
+    Return the pool configuration for an endpoint.
+
+    The "pool" key in endpoints.json may be an object overriding DEFAULT_POOL_CONFIG
+    or false to disable pooling for that endpoint.
+    """
+    config = dict(DEFAULT_POOL_CONFIG)
+    pool_params = params.get("pool") if isinstance(params, dict) else None
+    if pool_params is False:
+        config["enabled"] = False
+    elif isinstance(pool_params, dict):
+        config.update(pool_params)
+    return config
+
+
+@dataclass
+class PoolEntry:
+    """A driver pool and its usage counters."""
+    pool: object
+    db_type: str
+    endpoint: str
+    username: str
+    config: dict
+    created_at: float
+    last_used: float
+    in_use: int = 0
+    acquired: int = 0
+    released: int = 0
+    overflow: int = 0
+
+
+class ConnectionPoolManager:
+    """
+    Manages database connection pools for the query engine.
+
+    DESIGN:
+    - One pool per (endpoint, username, password fingerprint) - a connection is never
+      handed to a caller that has not presented the password used to open it
+    - Pools are created lazily after the gunicorn worker forks
+    - Pools that stay idle longer than idle_timeout are closed
+    - Connections must be returned with release(), never closed directly
+    """
+
+    def __init__(self, eviction_interval: int = 60):
+        self.eviction_interval = eviction_interval
+        self._pools: Dict[Tuple[str, str, str], PoolEntry] = {}
+        self._borrowed: Dict[int, Tuple[str, str, str]] = {}
+        self._lock = threading.RLock()
+        self._last_eviction = time.time()
+
+    @staticmethod
+    def _pool_key(endpoint: str, username: str, password: str) -> Tuple[str, str, str]:
+        """Key a pool by endpoint, username and a keyed hash of the password."""
+        digest = hmac.new(_DIGEST_KEY, password.encode(), hashlib.sha256).hexdigest()
+        return (endpoint, username, digest)
+
+    def _create_pool(self, username: str, password: str, params: dict, config: dict):
+        """Create a driver level pool for an endpoint."""
+        if params.get("dbType", "oracle") == "postgres":
+            return psycopg2.pool.ThreadedConnectionPool(
+                config["min"], config["max"],
+                user=username, password=password,
+                **postgres_connect_args(params)
+            )
+        return oracledb.create_pool(
+            user=username, password=password,
+            min=config["min"], max=config["max"], increment=config["increment"],
+            getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+            wait_timeout=int(config["wait_timeout"] * 1000),
+            timeout=int(config["idle_timeout"]),
+            **oracle_connect_args(params)
+        )
+
+    @staticmethod
+    def _close_pool(entry: PoolEntry):
+        """Close a driver level pool, ignoring errors."""
+        try:
+            if entry.db_type == "postgres":
+                entry.pool.closeall()
+            else:
+                entry.pool.close(force=True)
+        except Exception as e:
+            logger.warning(f"Error closing pool for {entry.endpoint}/{entry.username}: {e}")
+
+    def acquire(self, endpoint: str, username: str, password: str, params: dict):
+        """
+        Borrow a connection for an endpoint, creating the pool on first use.
+
+        Args:
+            endpoint: Endpoint name from endpoints.json
+            username: Database username
+            password: Database password
+            params: Endpoint connection parameters
+
+        Returns:
+            A database connection that must be handed back with release()
+        """
+        config = get_pool_config(params)
+        db_type = params.get("dbType", "oracle")
+        key = self._pool_key(endpoint, username, password)
+
+        self._evict_idle_pools()
+
+        with self._lock:
+            entry = self._pools.get(key)
+            if entry is None:
+                entry = PoolEntry(
+                    pool=self._create_pool(username, password, params, config),
+                    db_type=db_type,
+                    endpoint=endpoint,
+                    username=username,
+                    config=config,
+                    created_at=time.time(),
+                    last_used=time.time()
+                )
+                self._pools[key] = entry
+                logger.info(f"Created {db_type} connection pool for {endpoint}/{username} (max={config['max']})")
+
+        try:
+            if db_type == "postgres":
+                try:
+                    connection = entry.pool.getconn()
+                except psycopg2.pool.PoolError:
+                    # Pool exhausted - serve the request from a dedicated connection
+                    with self._lock:
+                        entry.overflow += 1
+                    logger.warning(f"Connection pool for {endpoint}/{username} exhausted, opening a dedicated connection")
+                    return psycopg2.connect(user=username, password=password, **postgres_connect_args(params))
+            else:
+                connection = entry.pool.acquire()
+        except Exception as e:
+            if is_pool_busy_error(e):
+                raise
+            # Drop pools that have never produced a connection (e.g. bad password)
+            with self._lock:
+                if entry.acquired == 0 and entry.in_use == 0 and self._pools.get(key) is entry:
+                    del self._pools[key]
+                    self._close_pool(entry)
+            raise
+
+        with self._lock:
+            entry.in_use += 1
+            entry.acquired += 1
+            entry.last_used = time.time()
+            self._borrowed[id(connection)] = key
+        return connection
+
+    def release(self, connection):
+        """Return a connection to its pool, or close it if it was not pooled."""
+        with self._lock:
+            key = self._borrowed.pop(id(connection), None)
+            entry = self._pools.get(key) if key else None
+            if entry:
+                entry.in_use -= 1
+                entry.released += 1
+                entry.last_used = time.time()
+
+        if entry is None:
+            connection.close()
+        elif entry.db_type == "postgres":
+            entry.pool.putconn(connection)
+        else:
+            # Do not carry a request's timeout_ms over to the next borrower
+            connection.call_timeout = 0
+            entry.pool.release(connection)
+
+    def _evict_idle_pools(self):
+        """Close pools that have not been used within their idle_timeout."""
+        current_time = time.time()
+        if current_time - self._last_eviction < self.eviction_interval:
+            return
+        with self._lock:
+            self._last_eviction = current_time
+            idle_keys = [
+                key for key, entry in self._pools.items()
+                if entry.in_use == 0 and current_time - entry.last_used > entry.config["idle_timeout"]
+            ]
+            for key in idle_keys:
+                entry = self._pools.pop(key)
+                logger.info(f"Closing idle connection pool for {entry.endpoint}/{entry.username}")
+                self._close_pool(entry)
+
+    def close_all(self):
+        """Close every pool managed by this instance."""
+        with self._lock:
+            for entry in self._pools.values():
+                self._close_pool(entry)
+            self._pools.clear()
+            self._borrowed.clear()
+
+    def get_stats(self) -> list:
+        """Get usage statistics for each open pool."""
+        current_time = time.time()
+        stats = []
+        with self._lock:
+            for entry in self._pools.values():
+                if entry.db_type == "postgres":
+                    # psycopg2 keeps at most min idle connections and closes the rest on return
+                    opened = max(entry.config["min"], entry.in_use)
+                    busy = entry.in_use
+                else:
+                    opened = entry.pool.opened
+                    busy = entry.pool.busy
+                stats.append({
+                    "endpoint": entry.endpoint,
+                    "username": entry.username,
+                    "db_type": entry.db_type,
+                    "min": entry.config["min"],
+                    "max": entry.config["max"],
+                    "opened": opened,
+                    "busy": busy,
+                    "in_use": entry.in_use,
+                    "acquired": entry.acquired,
+                    "released": entry.released,
+                    "overflow": entry.overflow,
+                    "age_seconds": round(current_time - entry.created_at, 1),
+                    "idle_seconds": round(current_time - entry.last_used, 1) if entry.in_use == 0 else 0
+                })
+        return stats
+
+
+# Global pool manager instance (one per gunicorn worker)
+pool_manager = ConnectionPoolManager()
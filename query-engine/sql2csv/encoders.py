@@ -0,0 +1,352 @@
+"""
+Result set encoders for the query engine.
+Turn blocks of fetched rows into buffered text chunks for streaming responses.
+"""
+
+import csv
+import io
+import zlib
+from decimal import Decimal
+
+import simplejson
+
+# orjson is an optional, faster JSON backend (3.9.15+ for Fragment, used to write Decimal values)
+try:
+    import orjson
+    ORJSON_AVAILABLE = hasattr(orjson, 'Fragment')
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# pyarrow is optional - it is only needed for the arrow and parquet output formats
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# zstandard is optional - gzip is used when it is not installed
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Approximate size of each chunk handed to the WSGI server
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Rows accumulated before a parquet row group is written
+PARQUET_ROW_GROUP_SIZE = 100000
+
+# Default compression levels for streamed results
+DEFAULT_COMPRESSION = {
+    "gzip_level": 6,
+    "zstd_level": 3
+}
+
+ARROW_MIMETYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+
+def _orjson_default(value):
+    """Serialize Decimal values as exact JSON numbers and other unknown types as strings."""
+    if isinstance(value, Decimal):
+        return orjson.Fragment(str(value))
+    return str(value)
+
+
+def dumps(value, indent=False) -> str:
+    """
+    Serialize a value to JSON text, indented by two spaces if indent is true.
+
+    Uses orjson when available. Decimal values are written with their exact digits;
+    integers wider than 64 bits fall back to simplejson so they are not rejected.
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            option = orjson.OPT_INDENT_2 if indent else None
+            return orjson.dumps(value, default=_orjson_default, option=option).decode('utf-8')
+        except TypeError:
+            pass
+    return simplejson.dumps(value, default=str, indent=2 if indent else None)
+
+
+def choose_content_encoding(accept_encoding: str):
+    """
+    Pick a response encoding from an Accept-Encoding header.
+
+    Returns:
+        "zstd" (when zstandard is installed), "gzip" or None if neither is acceptable
+    """
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding] = quality
+
+    candidates = (['zstd'] if ZSTD_AVAILABLE else []) + ['gzip']
+    for coding in candidates:
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def _block_compressor(encoding: str, level: int):
+    """Return a (compressor, block flush mode) pair for a content encoding."""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compressobj(), zstandard.COMPRESSOBJ_FLUSH_BLOCK
+    # wbits 31 = gzip container
+    return zlib.compressobj(level, zlib.DEFLATED, 31), zlib.Z_SYNC_FLUSH
+
+
+def compress_chunks(chunks, encoding: str, level: int):
+    """
+    Compress a stream of text or byte chunks.
+
+    Each chunk is flushed as a complete compressed block so the client can decode
+    data as it arrives rather than waiting for the compressor's window to fill.
+    The source iterator is closed when this generator is closed.
+    """
+    compressor, block_flush = _block_compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(block_flush)
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+async def compress_chunks_async(chunks, encoding: str, level: int):
+    """Async equivalent of compress_chunks() for async generators."""
+    compressor, block_flush = _block_compressor(encoding, level)
+    try:
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(block_flush)
+        yield compressor.flush()
+    finally:
+        await chunks.aclose()
+
+
+class CsvEncoder:
+    """
+    Buffered CSV encoder.
+
+    Rows are written with csv.writer.writerows() into an in-memory buffer that is
+    only handed back to the caller once it holds at least chunk_size characters.
+    This replaces one generator yield (and one socket write) per row with one per chunk.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n', quoting=csv.QUOTE_NONNUMERIC)
+
+    def write_header(self, columns: list):
+        """Buffer a header line with the column names."""
+        self._writer.writerow(columns)
+
+    def write_rows(self, rows) -> str:
+        """
+        Buffer a block of rows.
+
+        Returns:
+            The buffered text once it reaches chunk_size, otherwise an empty string
+        """
+        self._writer.writerows(rows)
+        if self._buffer.tell() >= self.chunk_size:
+            return self.flush()
+        return ''
+
+    def flush(self) -> str:
+        """Return and clear the buffered text."""
+        chunk = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return chunk
+
+
+class JsonEncoder:
+    """
+    Buffered JSON encoder.
+
+    Produces {"columns": [...], "rows": [...], <trailer>} where each row is an object
+    keyed by column name (the default "json" format) or a positional array ("json-compact").
+    Column keys are computed once and rows are serialized a block at a time, using
+    orjson when it is installed and simplejson otherwise.
+    """
+
+    def __init__(self, columns: list, compact: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.columns = columns
+        self.compact = compact
+        self.chunk_size = chunk_size
+        self._buffer = io.StringIO()
+        self._first_block = True
+
+    def start(self) -> str:
+        """Return the document header up to the opening bracket of the rows array."""
+        if self.compact:
+            return '{"columns":' + dumps(self.columns) + ',"rows":['
+        return '{\n' + f'"columns":{dumps(self.columns)}, \n' + '"rows": [\n'
+
+    def _encode_block(self, rows) -> str:
+        """Serialize a block of row value lists without the enclosing brackets."""
+        if self.compact:
+            return dumps(rows)[1:-1]
+        columns = self.columns
+        return ',\n'.join(dumps(dict(zip(columns, row))) for row in rows)
+
+    def write_rows(self, rows) -> str:
+        """
+        Buffer a block of rows.
+
+        Returns:
+            The buffered text once it reaches chunk_size, otherwise an empty string
+        """
+        if not rows:
+            return ''
+        if not self._first_block:
+            self._buffer.write(',' if self.compact else ',\n')
+        self._first_block = False
+        self._buffer.write(self._encode_block(rows))
+        if self._buffer.tell() >= self.chunk_size:
+            return self.flush()
+        return ''
+
+    def flush(self) -> str:
+        """Return and clear the buffered text."""
+        chunk = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return chunk
+
+    def finish(self, trailer: dict) -> str:
+        """Return any buffered rows followed by the closing bracket and trailer properties."""
+        if self.compact:
+            tail = ']' + ''.join(f',{dumps(key)}:{dumps(value)}' for key, value in trailer.items()) + '}'
+        else:
+            tail = '\n],' + ', '.join(f'"{key}":{dumps(value)}' for key, value in trailer.items()) + ' \n}'
+        return self.flush() + tail
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that collects bytes written by pyarrow until drained."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+        self.buffered = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        self.buffered += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        """Return and clear the collected bytes."""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self.buffered = 0
+        return data
+
+
+class ArrowEncoder:
+    """
+    Columnar encoder for the "arrow" (IPC stream) and "parquet" formats.
+
+    Each fetched block becomes a record batch built column by column, so values are
+    never rendered as text. Parquet batches are accumulated into row groups of
+    PARQUET_ROW_GROUP_SIZE rows to avoid writing one tiny row group per block.
+
+    Args:
+        fields: List of (column name, pyarrow type, converter) tuples. The converter is
+            applied to non-null values before they are added to the column, or None
+        output_format: "arrow" or "parquet"
+        chunk_size: Approximate size of the byte chunks returned to the caller
+    """
+
+    def __init__(self, fields: list, output_format: str = "arrow", chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("pyarrow is not installed")
+        self.output_format = output_format
+        self.chunk_size = chunk_size
+        self.schema = pyarrow.schema([(name, arrow_type) for name, arrow_type, _ in fields])
+        self._converters = [converter for _, _, converter in fields]
+        self._sink = _ChunkSink()
+        self._pending = []
+        self._pending_rows = 0
+        if output_format == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(self._sink, self.schema)
+        else:
+            self._writer = pyarrow.ipc.new_stream(self._sink, self.schema)
+
+    def _record_batch(self, rows):
+        """Transpose a block of rows into a record batch."""
+        arrays = []
+        for values, converter, field in zip(zip(*rows), self._converters, self.schema):
+            if converter:
+                values = [None if value is None else converter(value) for value in values]
+            arrays.append(pyarrow.array(values, type=field.type))
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def _write_pending(self):
+        """Write accumulated parquet batches as a single row group."""
+        if self._pending:
+            self._writer.write_table(pyarrow.Table.from_batches(self._pending, schema=self.schema))
+            self._pending = []
+            self._pending_rows = 0
+
+    def write_rows(self, rows) -> bytes:
+        """
+        Encode a block of rows.
+
+        Returns:
+            The encoded bytes once at least chunk_size are available, otherwise b''
+        """
+        if not rows:
+            return b''
+        batch = self._record_batch(rows)
+        if self.output_format == "parquet":
+            self._pending.append(batch)
+            self._pending_rows += batch.num_rows
+            if self._pending_rows >= PARQUET_ROW_GROUP_SIZE:
+                self._write_pending()
+        else:
+            self._writer.write_batch(batch)
+        if self._sink.buffered >= self.chunk_size:
+            return self._sink.drain()
+        return b''
+
+    def finish(self) -> bytes:
+        """Close the stream and return the remaining bytes (including the parquet footer)."""
+        self._write_pending()
+        self._writer.close()
+        return self._sink.drain()
@@ -0,0 +1,459 @@
+"""
+Export jobs for the query engine.
+Runs a query in the background into a compressed spool file that clients poll for
+progress and download with HTTP Range requests, so a large extract is not bound to
+the lifetime of a single HTTP request.
+"""
+
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from flask import Blueprint, request, jsonify, current_app, send_file
+from werkzeug.exceptions import HTTPException
+
+from . import sql2csv
+from .encoders import CsvEncoder, JsonEncoder, ArrowEncoder, ARROW_MIMETYPES
+
+bp = Blueprint('export_jobs', __name__, url_prefix='/sql')
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by every worker process for job metadata and spool files
+DEFAULT_SPOOL_DIR = os.getenv('EXPORT_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'sql2csv-exports'))
+# Jobs run concurrently per worker process
+DEFAULT_MAX_WORKERS = int(os.getenv('EXPORT_MAX_WORKERS', '2'))
+# Jobs allowed to wait for a free worker before submissions are rejected
+DEFAULT_MAX_QUEUED = int(os.getenv('EXPORT_MAX_QUEUED', '8'))
+# Seconds a job and its spool file are kept after its last update
+DEFAULT_JOB_TTL = float(os.getenv('EXPORT_JOB_TTL', '3600'))
+DEFAULT_SWEEP_INTERVAL = float(os.getenv('EXPORT_SWEEP_INTERVAL', '60'))
+
+# Minimum seconds between progress updates written to a job's metadata file
+PROGRESS_INTERVAL = 1.0
+GZIP_LEVEL = 6
+OWNER_ITERATIONS = 10000
+
+FINISHED = ("complete", "failed", "cancelled")
+FILE_EXTENSIONS = {"csv": "csv", "json": "json", "json-compact": "json", "arrow": "arrow", "parquet": "parquet"}
+
+_JOB_ID = re.compile(r'^[A-Za-z0-9_-]{32}$')
+
+
+def owner_digest(endpoint: str, username: str, password: str, salt: str) -> str:
+    """Return the salted digest recording which credentials own a job."""
+    material = json.dumps([endpoint, username, password]).encode('utf-8')
+    return hashlib.pbkdf2_hmac('sha256', material, bytes.fromhex(salt), OWNER_ITERATIONS).hex()
+
+
+def encode_results(query: dict, cursor, is_postgres: bool):
+    """Generator of encoded result chunks in the query's output format."""
+    output_format = query["output_format"]
+    window = query["window"]
+    if output_format in ARROW_MIMETYPES:
+        fields = sql2csv.build_arrow_fields(cursor.description, is_postgres, query["download_lobs"])
+        encoder = ArrowEncoder(fields, output_format, query["chunk_size"])
+        plan = []
+    else:
+        plan = sql2csv.build_converter_plan(cursor.description, is_postgres, query["download_lobs"])
+        if output_format == 'csv':
+            encoder = CsvEncoder(query["chunk_size"])
+            if query["csv_header"] == 'y':
+                encoder.write_header([desc[0] for desc in cursor.description])
+        else:
+            encoder = JsonEncoder([desc[0] for desc in cursor.description],
+                                  output_format == 'json-compact', query["chunk_size"])
+            yield encoder.start()
+
+    for rows in window.blocks(cursor):
+        chunk = encoder.write_rows(sql2csv.apply_converter_plan(plan, rows))
+        if chunk:
+            yield chunk
+
+    if output_format == 'csv':
+        yield encoder.flush()
+    elif output_format in ARROW_MIMETYPES:
+        yield encoder.finish()
+    else:
+        yield encoder.finish({"executionTime": time.time() - query["start_time"], **window.trailer()})
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class ExportJobManager:
+    """
+    Runs export jobs on a bounded thread pool and tracks them in a shared spool directory.
+
+    DESIGN:
+    - A job is a metadata file (<id>.json) and a spool file in spool_dir. Job state is
+      read from the directory, so any worker process can report status or serve the
+      download, not only the one running the query
+    - Metadata is replaced atomically; progress is written at most every PROGRESS_INTERVAL
+    - Results are gzip compressed as they are written (parquet is already compressed) and
+      the spool file is renamed to its final name only once the query has finished
+    - A job belongs to the endpoint and credentials that submitted it, recorded as a salted
+      PBKDF2 digest; other callers get 404
+    - At most max_workers jobs run and max_queued wait per process; further submissions
+      are rejected with 503
+    - A cancel marker file (<id>.cancel) stops a job before its next fetch
+    - A background sweeper removes jobs and their files ttl seconds after their last update
+    """
+
+    def __init__(self, spool_dir: str = DEFAULT_SPOOL_DIR, max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_queued: int = DEFAULT_MAX_QUEUED, ttl: float = DEFAULT_JOB_TTL,
+                 sweep_interval: float = DEFAULT_SWEEP_INTERVAL):
+        self.spool_dir = spool_dir
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._executor = None
+        self._pid = None
+        self._active = set()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._sweeper_pid = None
+        self._stop = threading.Event()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.swept = 0
+
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.{suffix}")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return this process's executor (a forked worker cannot use its parent's threads)."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._active = set()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="export-job")
+            os.makedirs(self.spool_dir, mode=0o700, exist_ok=True)
+        return self._executor
+
+    def _read(self, job_id: str) -> Optional[dict]:
+        if not _JOB_ID.match(job_id or ''):
+            return None
+        try:
+            with open(self._path(job_id, 'json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, job: dict):
+        job["updated"] = time.time()
+        temp = self._path(job["id"], f"{os.getpid()}.tmp")
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(job, f)
+        os.replace(temp, self._path(job["id"], 'json'))
+
+    def _remove_files(self, job_id: str, suffixes=('json', 'part', 'cancel'), filename: Optional[str] = None):
+        paths = [self._path(job_id, suffix) for suffix in suffixes]
+        if filename:
+            paths.append(os.path.join(self.spool_dir, filename))
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def submit(self, app, query: dict) -> dict:
+        """
+        Queue a prepared query for export.
+
+        Returns:
+            The new job's metadata
+
+        Raises:
+            HTTPException: 503 when max_workers jobs are running and max_queued are waiting
+        """
+        with self._lock:
+            executor = self._get_executor()
+            if len(self._active) >= self.max_workers + self.max_queued:
+                self.rejected += 1
+                sql2csv.fail_request(503, description="Too many export jobs, try again later")
+            job_id = secrets.token_urlsafe(24)
+            self._active.add(job_id)
+            self.submitted += 1
+
+        salt = secrets.token_hex(16)
+        output_format = query["output_format"]
+        extension = FILE_EXTENSIONS.get(output_format, 'json')
+        job = {
+            "id": job_id,
+            "endpoint": query["endpoint"],
+            "format": output_format,
+            "status": "queued",
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "rows": 0,
+            "bytes": 0,
+            "spool_bytes": 0,
+            "truncated": False,
+            "error": None,
+            "file": f"{job_id}.{extension}" + ('' if output_format == 'parquet' else '.gz'),
+            "salt": salt,
+            "owner": owner_digest(query["endpoint"], query["username"], query["password"], salt)
+        }
+        try:
+            self._write(job)
+            executor.submit(self._run, app, job, query)
+        except Exception:
+            with self._lock:
+                self._active.discard(job_id)
+            raise
+        return job
+
+    def _run(self, app, job: dict, query: dict):
+        try:
+            with app.app_context():
+                self._export(job, query)
+        except Exception as e:
+            logger.error(f"Export job {job['id']} failed: {e}")
+        finally:
+            with self._lock:
+                self._active.discard(job["id"])
+                if job["status"] == "complete":
+                    self.completed += 1
+                elif job["status"] == "cancelled":
+                    self.cancelled += 1
+                else:
+                    self.failed += 1
+
+    def _export(self, job: dict, query: dict):
+        """Run a job's query and write the encoded result to its spool file."""
+        part = self._path(job["id"], 'part')
+        connection = cursor = None
+        try:
+            self._check_cancelled(job)
+            job.update(status="running", started=time.time())
+            self._write(job)
+            connection = sql2csv.get_connection(query["username"], query["password"], query["params"], query["endpoint"])
+            cursor = sql2csv.get_cursor(connection, query["sql"], query["binds"], query["arraysize"],
+                                        query["prefetchrows"], query["timeout_ms"])
+            self._check_cancelled(job)
+            self._spool(job, query, connection, cursor, part)
+            os.replace(part, os.path.join(self.spool_dir, job["file"]))
+            job.update(status="complete", truncated=query["window"].truncated)
+            logger.info(f"Export job {job['id']} complete: {job['rows']} rows, {job['spool_bytes']} bytes")
+        except JobCancelled:
+            job["status"] = "cancelled"
+        except HTTPException as e:
+            # get_connection and get_cursor report errors through fail_request
+            job.update(status="failed", error=e.description)
+        except Exception as e:
+            logger.error(f"Error during export job {job['id']}: {str(e)}")
+            job.update(status="failed", error=str(e))
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+                # get_cursor releases the connection itself when execute fails
+                sql2csv.release_connection(connection)
+        job["finished"] = time.time()
+        if job["status"] != "complete":
+            self._remove_files(job["id"], suffixes=('part', 'cancel'))
+        self._write(job)
+
+    def _spool(self, job: dict, query: dict, connection, cursor, part: str):
+        is_postgres = hasattr(connection, 'cursor_factory')
+        window = query["window"]
+        fd = os.open(part, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as raw:
+            out = raw if job["format"] == 'parquet' else gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL)
+            try:
+                reported = time.time()
+                for chunk in encode_results(query, cursor, is_postgres):
+                    data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                    out.write(data)
+                    job["bytes"] += len(data)
+                    if time.time() - reported >= PROGRESS_INTERVAL:
+                        self._check_cancelled(job)
+                        job.update(rows=window.row_count, spool_bytes=raw.tell())
+                        self._write(job)
+                        reported = time.time()
+            finally:
+                if out is not raw:
+                    out.close()
+            job.update(rows=window.row_count, spool_bytes=raw.tell())
+
+    def _check_cancelled(self, job: dict):
+        if os.path.exists(self._path(job["id"], 'cancel')):
+            raise JobCancelled()
+
+    def get(self, job_id: str, endpoint: str, username: str, password: str) -> Optional[dict]:
+        """Return a job's metadata if it belongs to the endpoint and credentials, or None."""
+        job = self._read(job_id)
+        if job is None or job["endpoint"] != endpoint:
+            return None
+        if not hmac.compare_digest(job["owner"], owner_digest(endpoint, username, password, job["salt"])):
+            return None
+        return job
+
+    def result_path(self, job: dict) -> str:
+        return os.path.join(self.spool_dir, job["file"])
+
+    def cancel(self, job: dict):
+        """Stop a queued or running job, or remove a finished job and its spool file."""
+        if job["status"] in FINISHED:
+            self._remove_files(job["id"], filename=job["file"])
+        else:
+            fd = os.open(self._path(job["id"], 'cancel'), os.O_WRONLY | os.O_CREAT, 0o600)
+            os.close(fd)
+
+    def sweep(self) -> int:
+        """Remove jobs, spool files and cancel markers older than the TTL."""
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        expired_before = time.time() - self.ttl
+        with self._lock:
+            active = set(self._active) if self._pid == os.getpid() else set()
+        removed = 0
+        for name in os.listdir(self.spool_dir):
+            job_id = name.split('.', 1)[0]
+            if job_id in active:
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                if os.path.getmtime(path) < expired_before:
+                    os.remove(path)
+                    if name.endswith('.json'):
+                        removed += 1
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.swept += removed
+        return removed
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"Export job sweep failed: {e}")
+
+    def start(self):
+        """Start the sweeper thread in this process if it is not already running."""
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive() and self._sweeper_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._sweeper_pid = os.getpid()
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="export-job-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def stop(self):
+        """Stop the sweeper thread."""
+        self._stop.set()
+
+    def get_stats(self) -> dict:
+        """Get export job statistics for this worker process."""
+        with self._lock:
+            return {
+                "spool_dir": self.spool_dir,
+                "active": len(self._active) if self._pid == os.getpid() else 0,
+                "max_workers": self.max_workers,
+                "max_queued": self.max_queued,
+                "ttl": self.ttl,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "swept": self.swept
+            }
+
+
+# Global export job manager instance (one thread pool per gunicorn worker)
+job_manager = ExportJobManager()
+
+
+def job_status(job: dict) -> dict:
+    """Return the public view of a job's metadata."""
+    status = {
+        "id": job["id"],
+        "endpoint": job["endpoint"],
+        "format": job["format"],
+        "status": job["status"],
+        "rows": job["rows"],
+        "bytes": job["bytes"],
+        "spoolBytes": job["spool_bytes"],
+        "elapsed": round((job["finished"] or time.time()) - job["started"], 3) if job["started"] else 0,
+        "created": job["created"],
+        "expires": job["updated"] + job_manager.ttl
+    }
+    if job["status"] == "complete":
+        status["truncated"] = job["truncated"]
+        status["result"] = f"{request.script_root}/sql/{job['endpoint']}/jobs/{job['id']}/result"
+    if job["error"]:
+        status["error"] = job["error"]
+    return status
+
+
+def get_job(endpoint, job_id):
+    """Look up a job for the request's credentials, failing with 404 if it is not theirs."""
+    username, password = sql2csv.get_credentials()
+    job = job_manager.get(job_id, endpoint, username, password)
+    if job is None:
+        sql2csv.fail_request(404, description="Export job not found")
+    return job
+
+
+@bp.route('/<endpoint>/jobs', methods=['POST'])
+def submit_job(endpoint):
+    """Start an export job and return its id (202 Accepted)"""
+    query = sql2csv.prepare_query(endpoint)
+    job = job_manager.submit(current_app._get_current_object(), query)
+    response = jsonify(job_status(job))
+    response.status_code = 202
+    response.headers['Location'] = f"{request.script_root}/sql/{endpoint}/jobs/{job['id']}"
+    return response
+
+
+@bp.route('/<endpoint>/jobs/<job_id>', methods=['GET'])
+def get_job_status(endpoint, job_id):
+    """Report a job's status and progress"""
+    return jsonify(job_status(get_job(endpoint, job_id)))
+
+
+@bp.route('/<endpoint>/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(endpoint, job_id):
+    """Download a completed job's spool file (supports Range requests)"""
+    job = get_job(endpoint, job_id)
+    if job["status"] != "complete":
+        sql2csv.fail_request(409, description=f"Export job is {job['status']}")
+    if job["format"] == 'parquet':
+        mimetype = ARROW_MIMETYPES['parquet']
+    else:
+        mimetype = 'application/gzip'
+    try:
+        return send_file(job_manager.result_path(job), mimetype=mimetype, as_attachment=True,
+                         download_name=f"{endpoint}-{job['file']}", conditional=True, max_age=0)
+    except FileNotFoundError:
+        sql2csv.fail_request(404, description="Export job result has expired")
+
+
+@bp.route('/<endpoint>/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(endpoint, job_id):
+    """Cancel a queued or running job, or delete a finished one"""
+    job = get_job(endpoint, job_id)
+    job_manager.cancel(job)
+    return jsonify({"id": job_id, "status": "cancelling" if job["status"] not in FINISHED else "deleted"})
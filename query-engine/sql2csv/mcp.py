@@ -3,7 +3,6 @@ MCP (Model Context Protocol) blueprint for the Visulate query engine.
 Provides MCP-compatible endpoints for SQL execution.
 """
 
-import json
 import logging
 import time
 from flask import Blueprint, request, jsonify, current_app
@@ -18,7 +17,12 @@ except ImportError:
 
 # Import local SQL execution functions
 from . import sql2csv
-from .secure_credentials import credential_manager
+from .secure_credentials import credential_manager, credential_sweeper
+from .connection_pool import pool_manager
+from .encoders import dumps
+from .sql_validation import statement_classifier
+from .result_cache import result_cache
+from .export_jobs import job_manager
 
 bp = Blueprint('mcp', __name__, url_prefix='/mcp-sql')
 
@@ -33,14 +37,22 @@ def mask_sensitive_data(d, sensitive_keys=['password', 'credential_token']):
     return {k: ('********' if k.lower() in sensitive_keys else v) for k, v in d.items()}
 
 
-def format_sql_response(database, username, sql_query, result):
-    """Format SQL execution result into a readable response text. Sanitized to avoid credential exposure."""
+def format_sql_response(database, username, sql_query, result, compact=False):
+    """
+    Format SQL execution result into a readable response text. Sanitized to avoid credential exposure.
+
+    Rows are serialized as indented JSON unless compact is true.
+    """
     if result["success"]:
         response_text = f"Query executed successfully on {database}:\n\n"
         response_text += f"SQL: {sql_query}\n\n"
         if result.get("row_count") is not None:
             response_text += f"Rows returned: {result['row_count']}\n\n"
-        response_text += f"Results:\n{json.dumps(result['data'], indent=2)}"
+        if result.get("truncated"):
+            limit = "row" if result.get("truncated_reason") == "max_rows" else "size"
+            response_text += (f"Results truncated: the query returned more rows than the {limit} limit allows. "
+                              "Add a WHERE clause or aggregate to narrow the result.\n\n")
+        response_text += f"Results:\n{dumps(result['data'], indent=not compact)}"
     else:
         response_text = f"Query failed on {database}:\n\n"
         response_text += f"SQL: {sql_query}\n\n"
@@ -49,6 +61,21 @@ def format_sql_response(database, username, sql_query, result):
     return response_text
 
 
+def get_result_limits(database, max_rows=None):
+    """
+    Return the (max_rows, max_bytes) limits for an execute_sql call.
+
+    A max_rows argument can lower the endpoint's configured row limit but not raise it.
+    """
+    limits = sql2csv.get_mcp_limits(sql2csv.get_connection_params(database))
+    row_limit = limits.get("max_rows")
+    if max_rows is not None:
+        if not isinstance(max_rows, int) or isinstance(max_rows, bool) or max_rows < 1:
+            raise BadRequest("Argument 'max_rows' must be a positive integer")
+        row_limit = max_rows if row_limit is None else min(max_rows, row_limit)
+    return row_limit, limits.get("max_bytes")
+
+
 @bp.route('/', methods=['GET', 'POST', 'DELETE'])
 @bp.route('', methods=['GET', 'POST', 'DELETE'])
 def handle_mcp_request():
@@ -135,11 +162,13 @@ def handle_mcp_request():
                             "error": {"code": -32602, "message": "Missing required arguments: database, sql, credential_token, session_id"}
                         }), 400
 
-                    result = McpTools.execute_sql_query_with_token(database, sql_query, credential_token, session_id)
+                    result = McpTools.execute_sql_query_with_token(database, sql_query, credential_token, session_id,
+                                                           arguments.get("max_rows"))
 
                     # Get username for logging (without exposing password)
                     username = result.get("username", "unknown")
-                    response_text = format_sql_response(database, username, sql_query, result)
+                    response_text = format_sql_response(database, username, sql_query, result,
+                                               bool(arguments.get("compact", False)))
 
                     return jsonify({
                         "jsonrpc": "2.0",
@@ -384,6 +413,16 @@ class McpTools:
                         "session_id": {
                             "type": "string",
                             "description": "The browser session ID (must match the one used during token creation)"
+                        },
+                        "max_rows": {
+                            "type": "integer",
+                            "description": "Maximum number of rows to return. Cannot exceed the limit configured for the database",
+                            "minimum": 1
+                        },
+                        "compact": {
+                            "type": "boolean",
+                            "description": "Return results as compact JSON without indentation (default: false)",
+                            "default": False
                         }
                     },
                     "required": ["database", "sql", "credential_token", "session_id"]
@@ -460,8 +499,8 @@ class McpTools:
         return tools
 
     @staticmethod
-    def execute_sql_query_with_token(database, sql_query, credential_token, session_id=None):
-        """Execute SQL using secure credential token."""
+    def execute_sql_query_with_token(database, sql_query, credential_token, session_id=None, max_rows=None):
+        """Execute SQL using secure credential token. Results are limited to the endpoint's MCP row and byte limits."""
         try:
             # Retrieve credentials using the token
             credentials = credential_manager.get_credentials(credential_token, session_id)
@@ -491,19 +530,22 @@ class McpTools:
                     "username": username
                 }
 
-            # Use the internal SQL execution function
-            result = sql2csv.execute_sql_internal(database, sql_query, username, password)
+            # Fetch no more than the row and byte limits allow
+            row_limit, byte_limit = get_result_limits(database, max_rows)
+            result = sql2csv.execute_sql_bounded(database, sql_query, username, password, row_limit, byte_limit)
 
             # Secure logging - no sensitive data
             logger.info(f"SQL executed successfully on {database} for user {username}")
 
             return {
                 "success": True,
-                "data": result,
+                "data": result["rows"],
                 "database": database,
                 "query": sql_query,
                 "username": username,
-                "row_count": len(result) if isinstance(result, list) else None
+                "row_count": result["row_count"],
+                "truncated": result["truncated"],
+                "truncated_reason": result["truncated_reason"]
             }
 
         except Exception as e:
@@ -581,11 +623,13 @@ def call_tool():
             if not all([database, sql_query, credential_token, session_id]):
                 raise BadRequest("Missing required arguments: database, sql, credential_token, session_id")
 
-            result = McpTools.execute_sql_query_with_token(database, sql_query, credential_token, session_id)
+            result = McpTools.execute_sql_query_with_token(database, sql_query, credential_token, session_id,
+                                                           arguments.get("max_rows"))
 
             # Get username for logging (without exposing password)
             username = result.get("username", "unknown")
-            response_text = format_sql_response(database, username, sql_query, result)
+            response_text = format_sql_response(database, username, sql_query, result,
+                                               bool(arguments.get("compact", False)))
 
             return jsonify({
                 "content": [{"type": "text", "text": response_text}]
@@ -680,7 +724,12 @@ def mcp_status():
         "available_databases": McpTools.get_available_databases(),
         "available_tools": ["create_credential_token", "execute_sql", "revoke_credential_token", "list_databases"],
         "purpose": "SQL execution only - database introspection handled by api-server",
-        "credential_manager": credential_manager.get_instance_info()
+        "credential_manager": credential_manager.get_instance_info(),
+        "credential_sweeper": credential_sweeper.get_stats(),
+        "connection_pools": pool_manager.get_stats(),
+        "sql_validation_cache": statement_classifier.get_stats(),
+        "result_cache": result_cache.get_stats(),
+        "export_jobs": job_manager.get_stats()
     })
 
 
@@ -0,0 +1,379 @@
+"""
+Result cache for the query engine.
+Keeps the encoded output of repeated read-only queries for a per-endpoint TTL.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Defaults used when an endpoint's "cache" key in endpoints.json is true or an object
+DEFAULT_CACHE_CONFIG = {
+    "ttl": 60,                              # seconds a cached result is served
+    "max_entry_bytes": 64 * 1024 * 1024     # larger results are streamed but not cached
+}
+
+# Process-wide budgets (one cache per gunicorn worker)
+DEFAULT_MAX_MEMORY_BYTES = int(os.getenv("QUERY_CACHE_MAX_MEMORY", str(64 * 1024 * 1024)))
+DEFAULT_MAX_DISK_BYTES = int(os.getenv("QUERY_CACHE_MAX_DISK", str(1024 * 1024 * 1024)))
+# Results larger than this are compressed to a file instead of being held in memory
+DEFAULT_SPILL_BYTES = int(os.getenv("QUERY_CACHE_SPILL_BYTES", str(1024 * 1024)))
+DEFAULT_CACHE_DIR = os.getenv("QUERY_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sql2csv-cache"))
+
+# Size of the chunks a cached result is replayed in
+READ_CHUNK_SIZE = 64 * 1024
+
+# Per-process key used to fingerprint passwords in cache keys (never leaves RAM)
+_DIGEST_KEY = secrets.token_bytes(32)
+
+# Quoted literals and identifiers, whose whitespace is significant, and comments. Oracle
+# alternative-quoting literals (q'[...]', q'{...}', q'!...!') end at their own delimiter, so a
+# quote inside them does not end the match. A line comment keeps the newline that ends it,
+# so the text after it is not folded into the comment.
+_PRESERVED = re.compile(
+    r"(?<![\w$#])[nN]?[qQ]'(?:\[.*?\]|\{.*?\}|\(.*?\)|<.*?>|([^\s\[{(<]).*?\1)'"
+    r"|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*\n?|/\*.*?(?:\*/|$)",
+    re.DOTALL
+)
+
+
+def get_cache_config(params: dict) -> Optional[dict]:
+    """
+    Return the result cache configuration for an endpoint, or None if caching is off.
+
+    Caching is opt-in: the "cache" key in endpoints.json may be true or an object
+    overriding DEFAULT_CACHE_CONFIG.
+    """
+    cache = params.get("cache") if isinstance(params, dict) else None
+    if not cache:
+        return None
+    config = dict(DEFAULT_CACHE_CONFIG)
+    if isinstance(cache, dict):
+        config.update(cache)
+    return config if config["ttl"] > 0 else None
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace outside quoted literals and comments and drop a trailing semicolon."""
+    sql = sql.strip().rstrip(';').strip()
+    parts = []
+    position = 0
+    for match in _PRESERVED.finditer(sql):
+        parts.append(re.sub(r"\s+", " ", sql[position:match.start()]))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(re.sub(r"\s+", " ", sql[position:]))
+    return "".join(parts)
+
+
+@dataclass
+class CacheEntry:
+    """A cached result, held in memory or spilled to a compressed file."""
+    mimetype: str
+    size: int
+    expires_at: float
+    body: Optional[bytes] = None
+    path: Optional[str] = None
+    disk_size: int = 0
+
+
+class CachedResult:
+    """A cache hit: the result's mimetype and an iterator over its bytes."""
+
+    def __init__(self, mimetype: str, size: int, chunks):
+        self.mimetype = mimetype
+        self.size = size
+        self.chunks = chunks
+
+    def read(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+def _memory_chunks(body: bytes):
+    for start in range(0, len(body), READ_CHUNK_SIZE):
+        yield body[start:start + READ_CHUNK_SIZE]
+
+
+def _file_chunks(file):
+    decompressor = zlib.decompressobj()
+    try:
+        while True:
+            data = file.read(READ_CHUNK_SIZE)
+            if not data:
+                break
+            chunk = decompressor.decompress(data)
+            if chunk:
+                yield chunk
+        chunk = decompressor.flush()
+        if chunk:
+            yield chunk
+    finally:
+        file.close()
+
+
+class ResultCache:
+    """
+    Caches encoded query results.
+
+    DESIGN:
+    - Entries are keyed by a SHA-256 digest of (endpoint, username, password fingerprint,
+      normalized SQL, binds, output options) - a result is only served to a caller that
+      presented the credentials it was fetched with
+    - Entries live for the endpoint's TTL and are evicted least recently used first
+      when the memory or disk budget is exceeded
+    - Results larger than spill_bytes are zlib compressed into this process's
+      subdirectory of cache_dir; directories left behind by dead processes are removed
+    - Only results that streamed to completion are stored
+    """
+
+    def __init__(self, max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+                 max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+                 spill_bytes: int = DEFAULT_SPILL_BYTES,
+                 cache_dir: str = DEFAULT_CACHE_DIR):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.spill_bytes = spill_bytes
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.spills = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    @staticmethod
+    def make_key(endpoint: str, username: str, password: str, sql: str, binds, options: dict) -> str:
+        """Build the cache key for a query run with the given credentials and options."""
+        fingerprint = hmac.new(_DIGEST_KEY, password.encode(), hashlib.sha256).hexdigest()
+        material = json.dumps([endpoint, username, fingerprint, normalize_sql(sql), binds, options],
+                              sort_keys=True, default=str)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _process_dir(self) -> str:
+        """Return this process's spill directory, removing those of dead processes on first use."""
+        pid = os.getpid()
+        if self._pid != pid:
+            # A forked worker must not inherit its parent's entries or files
+            self._entries.clear()
+            self.memory_bytes = self.disk_bytes = 0
+            self._pid = pid
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            for name in os.listdir(self.cache_dir):
+                if name.isdigit() and int(name) != pid and not _pid_alive(int(name)):
+                    _remove_tree(os.path.join(self.cache_dir, name))
+        path = os.path.join(self.cache_dir, str(pid))
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        return path
+
+    def _remove(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        if entry.path:
+            self.disk_bytes -= entry.disk_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        else:
+            self.memory_bytes -= entry.size
+        return entry
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until both budgets are met."""
+        now = time.time()
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            self._remove(key)
+            self.expirations += 1
+        for key in list(self._entries):
+            if self.memory_bytes <= self.max_memory_bytes and self.disk_bytes <= self.max_disk_bytes:
+                break
+            entry = self._entries[key]
+            if (entry.path and self.disk_bytes > self.max_disk_bytes) or \
+               (not entry.path and self.memory_bytes > self.max_memory_bytes):
+                self._remove(key)
+                self.evictions += 1
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        """Return a cached result that has not expired, or None."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None and entry.path:
+                try:
+                    # Opened under the lock so a concurrent eviction cannot remove the file first
+                    chunks = _file_chunks(open(entry.path, 'rb'))
+                except OSError:
+                    self._remove(key)
+                    entry = None
+            elif entry is not None:
+                chunks = _memory_chunks(entry.body)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return CachedResult(entry.mimetype, entry.size, chunks)
+
+    def put(self, key: str, body: bytes, mimetype: str, config: dict) -> bool:
+        """Store a complete result. Returns False if it is larger than the endpoint allows."""
+        if len(body) > config["max_entry_bytes"]:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        entry = CacheEntry(mimetype=mimetype, size=len(body), expires_at=time.time() + config["ttl"])
+        with self._lock:
+            directory = self._process_dir()
+        if len(body) > self.spill_bytes:
+            entry.path = os.path.join(directory, uuid.uuid4().hex)
+            compressed = zlib.compress(body, 1)
+            with open(entry.path, 'wb') as f:
+                f.write(compressed)
+            entry.disk_size = len(compressed)
+        else:
+            entry.body = body
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            if entry.path:
+                self.disk_bytes += entry.disk_size
+                self.spills += 1
+            else:
+                self.memory_bytes += entry.size
+            self.stores += 1
+            self._evict()
+        return True
+
+    def capture(self, key: str, chunks, mimetype: str, config: dict, is_complete):
+        """
+        Pass a stream of result chunks through, storing a copy once it has finished.
+
+        Args:
+            is_complete: callable returning True if the stream ended without an error
+        """
+        collected = []
+        size = 0
+        try:
+            for chunk in chunks:
+                if collected is not None:
+                    data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                    size += len(data)
+                    if size > config["max_entry_bytes"]:
+                        collected = None
+                        with self._lock:
+                            self.rejected += 1
+                    else:
+                        collected.append(data)
+                yield chunk
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        if collected is not None and is_complete():
+            self._store_quietly(key, b"".join(collected), mimetype, config)
+
+    async def capture_async(self, key: str, chunks, mimetype: str, config: dict, is_complete):
+        """Async equivalent of capture() for async generators."""
+        collected = []
+        size = 0
+        try:
+            async for chunk in chunks:
+                if collected is not None:
+                    data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                    size += len(data)
+                    if size > config["max_entry_bytes"]:
+                        collected = None
+                        with self._lock:
+                            self.rejected += 1
+                    else:
+                        collected.append(data)
+                yield chunk
+        finally:
+            await chunks.aclose()
+        if collected is not None and is_complete():
+            # Compressing and writing a spilled result must not block the event loop
+            await asyncio.to_thread(self._store_quietly, key, b"".join(collected), mimetype, config)
+
+    def _store_quietly(self, key: str, body: bytes, mimetype: str, config: dict):
+        try:
+            self.put(key, body, mimetype, config)
+        except Exception as e:
+            logger.warning(f"Error caching query result: {e}")
+
+    def clear(self):
+        """Remove all cached results."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def get_stats(self) -> dict:
+        """Get cache statistics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self.memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "disk_bytes": self.disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0,
+                "stores": self.stores,
+                "spills": self.spills,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "rejected": self.rejected
+            }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_tree(path: str):
+    try:
+        for name in os.listdir(path):
+            os.remove(os.path.join(path, name))
+        os.rmdir(path)
+    except OSError as e:
+        logger.debug(f"Could not remove stale cache directory {path}: {e}")
+
+
+# Global result cache instance (one per gunicorn worker)
+result_cache = ResultCache()
@@ -14,6 +14,7 @@ import json
 import fcntl
 import stat
 import logging
+import sqlite3
 from typing import Dict, Optional, Tuple
 from dataclasses import dataclass, asdict
 from cryptography.fernet import Fernet
@@ -36,6 +37,9 @@ class CredentialData:
 _PROCESS_CREDENTIAL_STORAGE = {}
 _PROCESS_STORAGE_LOCK = threading.RLock()
 
+# Seconds between background sweeps of expired tokens
+DEFAULT_SWEEP_INTERVAL = 60
+
 # Ephemeral encryption key generated on startup (process RAM only)
 _ENCRYPTION_KEY = Fernet.generate_key()
 _FERNET = Fernet(_ENCRYPTION_KEY)
@@ -560,5 +564,353 @@ class SharedCredentialManager:
             }
 
 
+class IndexedCredentialManager:
+    """
+    Shared credential manager backed by a SQLite table in /dev/shm.
+
+    SECURITY DESIGN:
+    - Uses RAM-based filesystem (/dev/shm) - no persistent disk storage
+    - IN-MEMORY ENCRYPTION - passwords are encrypted with an ephemeral key
+    - SESSION BINDING - tokens are tied to a specific visulate_session_id
+    - Tokens are stored by SHA-256 hash, never in plaintext
+    - Restrictive file permissions (600) - owner read/write only
+    - SQLite locking provides thread and process safety across gunicorn workers
+
+    DESIGN:
+    - One table replaces the file-per-token layout of SharedCredentialManager
+    - Lookups use the primary key, revocation uses a (session_id, database) index and
+      expiry uses an expires_at index, so each operation touches only matching rows
+    - Each thread opens its own connection (reopened after a fork)
+    """
+
+    def __init__(self, default_expiry_minutes: int = 30, storage_dir: str = "/dev/shm/mcp_credentials"):
+        self.default_expiry_minutes = default_expiry_minutes
+        self.storage_dir = storage_dir
+        self.db_path = None
+        self._local = threading.local()
+        self._ensure_storage()
+
+    def _ensure_storage(self):
+        """Create the storage directory and credential table with secure permissions."""
+        try:
+            os.makedirs(self.storage_dir, mode=0o700, exist_ok=True)
+            os.chmod(self.storage_dir, 0o700)
+            self.db_path = os.path.join(self.storage_dir, "credentials.db")
+            # Create the file owner read/write only before SQLite opens it
+            os.close(os.open(self.db_path, os.O_CREAT | os.O_RDWR, 0o600))
+            os.chmod(self.db_path, 0o600)
+            connection = sqlite3.connect(self.db_path, timeout=10)
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript("""
+                    CREATE TABLE IF NOT EXISTS credentials (
+                        token_hash TEXT PRIMARY KEY,
+                        username TEXT NOT NULL,
+                        password TEXT NOT NULL,
+                        database TEXT NOT NULL,
+                        session_id TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    ) WITHOUT ROWID;
+                    CREATE INDEX IF NOT EXISTS credentials_session_idx ON credentials (session_id, database);
+                    CREATE INDEX IF NOT EXISTS credentials_expiry_idx ON credentials (expires_at);
+                """)
+                connection.commit()
+            finally:
+                connection.close()
+        except Exception as e:
+            logger.warning(f"Could not create credential store in {self.storage_dir}: {e}")
+            self.db_path = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection to the credential store."""
+        if not self.db_path:
+            raise RuntimeError("Shared storage not available")
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            # The database lives in RAM, so there is nothing to gain from fsync
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _token_hash(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def create_credential_token(self, username: str, password: str, database: str,
+                              session_id: str,
+                              expiry_minutes: Optional[int] = None) -> str:
+        """
+        Create a temporary token for database credentials.
+
+        Args:
+            username: Database username
+            password: Database password (encrypted in /dev/shm)
+            database: Database name
+            session_id: The browser session ID
+            expiry_minutes: Token expiration time (default: 30 minutes)
+
+        Returns:
+            Secure token string that can be used instead of plaintext credentials
+        """
+        connection = self._connection()
+
+        # Generate cryptographically secure token
+        token = secrets.token_urlsafe(32)
+
+        expiry_time = expiry_minutes or self.default_expiry_minutes
+        current_time = time.time()
+        expires_at = current_time + (expiry_time * 60)
+
+        # Encrypt password before storage
+        encrypted_password = _FERNET.encrypt(password.encode()).decode()
+
+        connection.execute(
+            "INSERT INTO credentials VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self._token_hash(token), username, encrypted_password, database, session_id, current_time, expires_at)
+        )
+
+        # Expired tokens are removed by the background CredentialSweeper
+        return token
+
+    def get_credentials(self, token: str, session_id: Optional[str] = None) -> Optional[Tuple[str, str, str]]:
+        """
+        Retrieve credentials using a token.
+
+        Args:
+            token: The credential token
+            session_id: The browser session ID
+
+        Returns:
+            Tuple of (username, password, database) or None if token invalid/expired/mismatched
+        """
+        if not self.db_path or not token:
+            return None
+
+        token_hash = self._token_hash(token)
+        row = self._connection().execute(
+            "SELECT username, password, database, session_id, expires_at FROM credentials WHERE token_hash = ?",
+            (token_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        username, encrypted_password, database, token_session_id, expires_at = row
+
+        # Check if token has expired
+        if time.time() > expires_at:
+            self._delete(token_hash)
+            return None
+
+        # Verify session binding
+        if session_id and token_session_id != session_id:
+            logger.warning(f"Session mismatch for shared token. Token bound to {token_session_id[:8]}, caller is {session_id[:8]}")
+            return None
+
+        # Decrypt password
+        try:
+            decrypted_password = _FERNET.decrypt(encrypted_password.encode()).decode()
+        except Exception as e:
+            logger.error(f"Failed to decrypt shared password for token (likely process restart): {e}")
+            self._delete(token_hash)
+            return None
+
+        return (username, decrypted_password, database)
+
+    def _delete(self, token_hash: str) -> bool:
+        """Delete a token by hash."""
+        cursor = self._connection().execute("DELETE FROM credentials WHERE token_hash = ?", (token_hash,))
+        return cursor.rowcount > 0
+
+    def revoke_token(self, token: str) -> bool:
+        """Immediately revoke a credential token."""
+        if not self.db_path or not token:
+            return False
+        return self._delete(self._token_hash(token))
+
+    def revoke_session_tokens(self, session_id: str) -> int:
+        """Revoke all tokens associated with a session ID."""
+        if not self.db_path or not session_id:
+            return 0
+        try:
+            cursor = self._connection().execute("DELETE FROM credentials WHERE session_id = ?", (session_id,))
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error revoking session tokens in shared storage: {e}")
+            return 0
+
+    def revoke_database_tokens(self, session_id: str, database: str) -> int:
+        """Revoke all tokens for a specific session and database."""
+        if not self.db_path or not session_id or not database:
+            return 0
+        try:
+            cursor = self._connection().execute(
+                "DELETE FROM credentials WHERE session_id = ? AND database = ?", (session_id, database)
+            )
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error revoking database tokens in shared storage: {e}")
+            return 0
+
+    def _cleanup_expired_tokens(self, before: Optional[float] = None, batch_size: int = 500) -> int:
+        """
+        Remove expired tokens from storage in batches.
+
+        Args:
+            before: Remove tokens that expired before this time (default: now)
+            batch_size: Maximum rows deleted per statement, bounding how long the write lock is held
+
+        Returns:
+            Number of tokens removed
+        """
+        if not self.db_path:
+            return 0
+        cutoff = time.time() if before is None else before
+        removed = 0
+        try:
+            connection = self._connection()
+            while True:
+                cursor = connection.execute(
+                    "DELETE FROM credentials WHERE token_hash IN "
+                    "(SELECT token_hash FROM credentials WHERE expires_at < ? LIMIT ?)",
+                    (cutoff, batch_size)
+                )
+                removed += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return removed
+        except Exception:
+            return removed  # Cleanup is best-effort
+
+    def get_active_token_count(self) -> int:
+        """Get count of active (non-expired) tokens."""
+        if not self.db_path:
+            return 0
+        try:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM credentials WHERE expires_at >= ?", (time.time(),)
+            ).fetchone()[0]
+        except Exception:
+            return 0
+
+    def get_instance_info(self) -> dict:
+        """Get debugging information about this shared credential manager instance."""
+        try:
+            current_time = time.time()
+            token_list = []
+            if self.db_path:
+                rows = self._connection().execute(
+                    "SELECT token_hash, username, database, session_id, expires_at FROM credentials "
+                    "WHERE expires_at >= ? ORDER BY expires_at", (current_time,)
+                ).fetchall()
+                token_list = [
+                    {
+                        "token_prefix": token_hash[:12] + "...",
+                        "username": username,
+                        "database": database,
+                        "session_id_prefix": session_id[:8] + "...",
+                        "expires_in_minutes": (expires_at - current_time) / 60
+                    }
+                    for token_hash, username, database, session_id, expires_at in rows
+                ]
+
+            return {
+                "instance_id": id(self),
+                "active_tokens": len(token_list),
+                "default_expiry_minutes": self.default_expiry_minutes,
+                "storage_type": "shared_sqlite_dev_shm",
+                "storage_security": "ram_based_no_disk_persistence",
+                "storage_dir": self.storage_dir,
+                "token_list": token_list
+            }
+
+        except Exception as e:
+            return {
+                "instance_id": id(self),
+                "active_tokens": 0,
+                "error": str(e),
+                "storage_type": "shared_sqlite_dev_shm",
+                "storage_security": "ram_based_no_disk_persistence",
+                "storage_dir": self.storage_dir
+            }
+
+
+class CredentialSweeper:
+    """
+    Background thread that removes expired credential tokens.
+
+    DESIGN:
+    - Keeps expiry off the request path - create_credential_token no longer sweeps inline
+    - Time-bucketed: each run drops every token that expired before the start of the
+      current interval-sized bucket, so expired tokens are removed in batches rather than
+      one at a time (lookups still reject expired tokens immediately)
+    - The interval is read from CREDENTIAL_SWEEP_INTERVAL (seconds, default 60)
+    - One sweeper per worker process; sweeps against the shared store are idempotent
+    """
+
+    def __init__(self, manager, interval: Optional[float] = None):
+        self.manager = manager
+        self.interval = interval or float(os.getenv('CREDENTIAL_SWEEP_INTERVAL', DEFAULT_SWEEP_INTERVAL))
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.swept_total = 0
+        self.last_swept = 0
+        self.last_duration_ms = 0.0
+        self.last_run_at = None
+
+    def sweep(self) -> int:
+        """Remove tokens that expired before the current time bucket."""
+        started = time.time()
+        bucket_start = (started // self.interval) * self.interval
+        swept = self.manager._cleanup_expired_tokens(before=bucket_start)
+        with self._lock:
+            self.runs += 1
+            self.swept_total += swept
+            self.last_swept = swept
+            self.last_duration_ms = round((time.time() - started) * 1000, 3)
+            self.last_run_at = started
+        return swept
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"Credential sweep failed: {e}")
+
+    def start(self):
+        """Start the sweeper thread in this process if it is not already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="credential-sweeper", daemon=True)
+            self._thread.start()
+        logger.info(f"Credential sweeper started (interval={self.interval}s)")
+
+    def stop(self):
+        """Stop the sweeper thread."""
+        self._stop.set()
+
+    def get_stats(self) -> dict:
+        """Get sweeper statistics."""
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive() and self._pid == os.getpid(),
+                "interval_seconds": self.interval,
+                "runs": self.runs,
+                "swept_total": self.swept_total,
+                "last_swept": self.last_swept,
+                "last_sweep_duration_ms": self.last_duration_ms,
+                "last_run_at": self.last_run_at,
+                "active_tokens": self.manager.get_active_token_count()
+            }
+
+
 # Global credential manager instance with shared storage
-credential_manager = SharedCredentialManager()
\ No newline at end of file
+credential_manager = IndexedCredentialManager()
+credential_sweeper = CredentialSweeper(credential_manager)
\ No newline at end of file
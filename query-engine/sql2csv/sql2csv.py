@@ -1,32 +1,53 @@
-import csv
 import sys
-import simplejson as json
+import json
 import oracledb
 import psycopg2
-import psycopg2.extras
-import sqlparse
 import base64
+import re
+import hashlib
 import time
 import datetime
+import decimal
 import os
 
 from flask import (
-    Blueprint, Response, request, abort, current_app, make_response
+    Blueprint, Response, request, abort, current_app, make_response, stream_with_context
+)
+from .sql_validation import statement_classifier, INVALID, REJECTED
+from .result_cache import result_cache, get_cache_config
+from .connection_pool import (
+    pool_manager, get_pool_config, oracle_connect_args, postgres_connect_args,
+    is_pool_busy_error, POOL_BUSY_RETRY_AFTER
+)
+from .encoders import (
+    CsvEncoder, JsonEncoder, ArrowEncoder, dumps, choose_content_encoding, compress_chunks,
+    DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE, DEFAULT_COMPRESSION, ARROW_MIMETYPES, PYARROW_AVAILABLE
 )
 
+if PYARROW_AVAILABLE:
+    import pyarrow
+
 bp = Blueprint('sql2csv', __name__, url_prefix='/')
 
-def fail_request(code, description):
-    current_app.logger.error(description)
-    abort(code, description=description)
+# Rows fetched per round trip when neither the request nor the endpoint sets arraysize
+DEFAULT_ARRAYSIZE = 1000
+MAX_ARRAYSIZE = 100000
 
-class Line(object):
-    def __init__(self):
-        self._line = None
-    def write(self, line):
-        self._line = line
-    def read(self):
-        return self._line
+# Largest timeout_ms accepted from a request or endpoint (24 hours)
+MAX_TIMEOUT_MS = 24 * 60 * 60 * 1000
+
+# Errors raised when a call exceeds Oracle's call_timeout or Postgres' statement_timeout
+TIMEOUT_ERROR_CODES = {"DPY-4024", "DPI-1067", "ORA-03156", "57014"}
+
+# Result limits for MCP execute_sql calls when an endpoint does not supply an "mcp" object
+DEFAULT_MCP_LIMITS = {
+    "max_rows": 1000,
+    "max_bytes": 1024 * 1024
+}
+
+def fail_request(code, description, **kwargs):
+    current_app.logger.error(description)
+    abort(code, description=description, **kwargs)
 
 def format_bytes(num):
     """Convert bytes to KB, MB, GB or TB"""
@@ -45,6 +66,160 @@ def get_option(option, default):
     else:
         return default
 
+def validate_fetch_size(option, value):
+    """Check that a fetch size option is a positive integer no larger than MAX_ARRAYSIZE"""
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1 or value > MAX_ARRAYSIZE:
+        fail_request(400, description=f"Option '{option}' must be an integer between 1 and {MAX_ARRAYSIZE}")
+    return value
+
+def get_fetch_sizes(params):
+    """Return (arraysize, prefetchrows) from the request options or the endpoint defaults"""
+    arraysize = get_option('arraysize', params.get('arraysize', DEFAULT_ARRAYSIZE))
+    prefetchrows = get_option('prefetchrows', params.get('prefetchrows'))
+    return (validate_fetch_size('arraysize', arraysize),
+            validate_fetch_size('prefetchrows', prefetchrows))
+
+def get_timeout_ms(params, requested=None):
+    """
+    Return the statement timeout in milliseconds, or None for no timeout.
+
+    The endpoint's timeout_ms is the default and the upper limit; a request can
+    only lower it.
+    """
+    timeout_ms = None
+    for value in (params.get('timeout_ms'), requested):
+        if value is None:
+            continue
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1 or value > MAX_TIMEOUT_MS:
+            fail_request(400, description=f"Option 'timeout_ms' must be an integer between 1 and {MAX_TIMEOUT_MS}")
+        timeout_ms = value if timeout_ms is None else min(timeout_ms, value)
+    return timeout_ms
+
+def is_timeout_error(error):
+    """Return True if a database error was raised by call_timeout or statement_timeout"""
+    if isinstance(error, oracledb.Error) and error.args:
+        code = getattr(error.args[0], 'full_code', None)
+    else:
+        code = getattr(error, 'pgcode', None) or getattr(error, 'sqlstate', None)
+    return code in TIMEOUT_ERROR_CODES
+
+def get_chunk_size():
+    """Return the streaming chunk size in bytes from the request options"""
+    chunk_size = get_option('chunk_size', DEFAULT_CHUNK_SIZE)
+    if not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or chunk_size < 1 or chunk_size > MAX_CHUNK_SIZE:
+        fail_request(400, description=f"Option 'chunk_size' must be an integer between 1 and {MAX_CHUNK_SIZE}")
+    return chunk_size
+
+def fetch_row_blocks(cursor):
+    """Yield blocks of up to cursor.arraysize rows using fetchmany()"""
+    while True:
+        rows = cursor.fetchmany(cursor.arraysize)
+        if not rows:
+            break
+        yield rows
+
+class RowWindow(object):
+    """Skip the first `offset` rows of a result set and stop after `max_rows`"""
+    def __init__(self, offset=0, max_rows=None, statement_hash=None):
+        self.offset = offset
+        self.max_rows = max_rows
+        self.statement_hash = statement_hash
+        self.row_count = 0
+        self.truncated = False
+        # Set by the streaming functions once every chunk has been produced without error
+        self.complete = False
+        self._skip = offset
+
+    def _clip(self, rows):
+        """Return the part of a fetched block that falls inside the window"""
+        if self._skip:
+            if len(rows) <= self._skip:
+                self._skip -= len(rows)
+                return []
+            rows = rows[self._skip:]
+            self._skip = 0
+        if self.max_rows is not None and len(rows) > self.max_rows - self.row_count:
+            rows = rows[:self.max_rows - self.row_count]
+            self.truncated = True
+        self.row_count += len(rows)
+        return rows
+
+    def _at_limit(self):
+        return self.max_rows is not None and self.row_count >= self.max_rows
+
+    def blocks(self, cursor):
+        """Yield fetched blocks inside the window, recording whether rows remain beyond it"""
+        self._skip = self.offset
+        for rows in fetch_row_blocks(cursor):
+            rows = self._clip(rows)
+            if rows:
+                yield rows
+            if self.truncated:
+                return
+            if self._at_limit():
+                # Probe for one more row to report truncation, then stop fetching
+                self.truncated = bool(cursor.fetchmany(1))
+                return
+
+    async def async_blocks(self, cursor):
+        """Async equivalent of blocks() for cursors of the asyncio drivers"""
+        self._skip = self.offset
+        while True:
+            rows = await cursor.fetchmany(cursor.arraysize)
+            if not rows:
+                return
+            rows = self._clip(rows)
+            if rows:
+                yield rows
+            if self.truncated:
+                return
+            if self._at_limit():
+                self.truncated = bool(await cursor.fetchmany(1))
+                return
+
+    def next_cursor(self):
+        """Return a token for the page following this window, or None if there is none"""
+        if not self.truncated:
+            return None
+        token = json.dumps({"offset": self.offset + self.row_count, "statement": self.statement_hash})
+        return base64.urlsafe_b64encode(token.encode('utf-8')).decode('utf-8')
+
+    def trailer(self):
+        """Return the pagination properties reported after the rows of a JSON result"""
+        trailer = {"rowCount": self.row_count, "truncated": self.truncated}
+        if self.truncated:
+            trailer["nextCursor"] = self.next_cursor()
+        return trailer
+
+def statement_hash(sql, binds):
+    """Return a short hash identifying a SQL statement and its bind values"""
+    statement = json.dumps({"sql": sql, "binds": binds}, sort_keys=True, default=str)
+    return hashlib.sha256(statement.encode('utf-8')).hexdigest()[:16]
+
+def get_row_window(sql, binds):
+    """Build a RowWindow from the max_rows, offset and cursor request options"""
+    max_rows = get_option('max_rows', None)
+    offset = get_option('offset', 0)
+    cursor_token = get_option('cursor', None)
+    current_hash = statement_hash(sql, binds)
+
+    if max_rows is not None and (not isinstance(max_rows, int) or isinstance(max_rows, bool) or max_rows < 1):
+        fail_request(400, description="Option 'max_rows' must be a positive integer")
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        fail_request(400, description="Option 'offset' must be a non-negative integer")
+    if cursor_token is not None:
+        try:
+            token = json.loads(base64.urlsafe_b64decode(cursor_token.encode('utf-8')))
+            offset = int(token["offset"])
+            token_hash = token["statement"]
+        except Exception:
+            fail_request(400, description="Invalid cursor token")
+        if token_hash != current_hash:
+            fail_request(400, description="Cursor token does not match the SQL statement and binds")
+    return RowWindow(offset, max_rows, current_hash)
+
 def dump_oracle_object_to_dict(obj):
     """Recursively converts an oracledb.Object into a dictionary or list."""
     if not isinstance(obj, oracledb.Object):
@@ -66,20 +241,24 @@ def dump_oracle_object_to_dict(obj):
                 result[attr.name] = f"Error: Attribute '{attr.name}' not found/accessible"
         return result
 
+def convert_lob(value, download_lobs):
+    """Read a LOB's content (base64 encoding BLOBs) or describe its size"""
+    if download_lobs:
+        try:
+            lob_data = value.read()
+            if value.type == oracledb.DB_TYPE_BLOB:
+                return base64.b64encode(lob_data).decode('utf-8')
+            return lob_data
+        except Exception as e:
+            return f"ERROR_LOB_DOWNLOAD: {str(e)}"
+    else:
+        lobsize = sys.getsizeof(value)
+        return f'LOB (size: {format_bytes(lobsize)})'
+
 def convert_db_value(value, download_lobs_flag):
     """Converts a database value to a Python-friendly format."""
     if isinstance(value, oracledb.LOB):
-        if download_lobs_flag.upper() == 'Y':
-            try:
-                lob_data = value.read()
-                if value.type == oracledb.DB_TYPE_BLOB:
-                    return base64.b64encode(lob_data).decode('utf-8')
-                return lob_data
-            except Exception as e:
-                return f"ERROR_LOB_DOWNLOAD: {str(e)}"
-        else:
-            lobsize = sys.getsizeof(value)
-            return f'LOB (size: {format_bytes(lobsize)})'
+        return convert_lob(value, download_lobs_flag.upper() == 'Y')
     elif isinstance(value, bytes):
         return value.decode('utf-8', errors='replace')
     elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
@@ -89,6 +268,157 @@ def convert_db_value(value, download_lobs_flag):
     else:
         return value
 
+# Column types whose fetched values are already JSON/CSV friendly
+PASSTHROUGH_ORACLE_TYPES = {
+    oracledb.DB_TYPE_NUMBER, oracledb.DB_TYPE_BINARY_INTEGER, oracledb.DB_TYPE_BINARY_FLOAT,
+    oracledb.DB_TYPE_BINARY_DOUBLE, oracledb.DB_TYPE_VARCHAR, oracledb.DB_TYPE_NVARCHAR,
+    oracledb.DB_TYPE_CHAR, oracledb.DB_TYPE_NCHAR, oracledb.DB_TYPE_LONG, oracledb.DB_TYPE_ROWID,
+    oracledb.DB_TYPE_BOOLEAN
+}
+DATETIME_ORACLE_TYPES = {
+    oracledb.DB_TYPE_DATE, oracledb.DB_TYPE_TIMESTAMP, oracledb.DB_TYPE_TIMESTAMP_TZ,
+    oracledb.DB_TYPE_TIMESTAMP_LTZ
+}
+BINARY_ORACLE_TYPES = {oracledb.DB_TYPE_RAW, oracledb.DB_TYPE_LONG_RAW}
+
+# Postgres type OIDs: bool, char, name, int8, int2, int4, text, oid, float4, float8, bpchar, varchar, numeric
+PASSTHROUGH_POSTGRES_TYPES = {16, 18, 19, 20, 21, 23, 25, 26, 700, 701, 1042, 1043, 1700}
+# date, time, timestamp, timestamptz, timetz
+DATETIME_POSTGRES_TYPES = {1082, 1083, 1114, 1184, 1266}
+
+def isoformat_value(value):
+    return value.isoformat()
+
+def decode_bytes(value):
+    return value.decode('utf-8', errors='replace')
+
+def build_converter_plan(description, is_postgres, download_lobs_flag):
+    """
+    Build a list of (column index, converter) pairs from cursor.description type codes.
+
+    Columns whose values need no conversion (NUMBER, VARCHAR ...) are left out of the plan.
+    Unrecognized types fall back to convert_db_value.
+    """
+    download_lobs = download_lobs_flag.upper() == 'Y'
+
+    def convert_other(value):
+        if isinstance(value, oracledb.LOB):
+            return convert_lob(value, download_lobs)
+        return convert_db_value(value, download_lobs_flag)
+
+    if is_postgres:
+        passthrough_types, datetime_types, binary_types = PASSTHROUGH_POSTGRES_TYPES, DATETIME_POSTGRES_TYPES, set()
+    else:
+        passthrough_types, datetime_types, binary_types = PASSTHROUGH_ORACLE_TYPES, DATETIME_ORACLE_TYPES, BINARY_ORACLE_TYPES
+
+    plan = []
+    for index, column in enumerate(description):
+        type_code = column[1]
+        if type_code in passthrough_types:
+            continue
+        elif type_code in datetime_types:
+            plan.append((index, isoformat_value))
+        elif type_code in binary_types:
+            plan.append((index, decode_bytes))
+        elif not is_postgres and type_code == oracledb.DB_TYPE_OBJECT:
+            plan.append((index, dump_oracle_object_to_dict))
+        else:
+            plan.append((index, convert_other))
+    return plan
+
+def build_arrow_fields(description, is_postgres, download_lobs_flag):
+    """
+    Map cursor.description to (name, pyarrow type, converter) tuples for ArrowEncoder.
+
+    Numbers, strings, dates and binary columns keep their native types. Anything else
+    (LOBs, objects, intervals, Postgres json ...) is converted to text.
+    """
+    download_lobs = download_lobs_flag.upper() == 'Y'
+
+    def to_text(value):
+        if isinstance(value, oracledb.LOB):
+            value = convert_lob(value, download_lobs)
+        else:
+            value = convert_db_value(value, download_lobs_flag)
+        if isinstance(value, (dict, list)):
+            return dumps(value)
+        return str(value)
+
+    def to_decimal(value):
+        # Scaled NUMBER values are fetched as float; str() gives their shortest exact digits
+        return value if isinstance(value, decimal.Decimal) else decimal.Decimal(str(value))
+
+    fields = []
+    for column in description:
+        name, type_code, precision, scale = column[0], column[1], column[4], column[5]
+        converter = None
+        if is_postgres:
+            if type_code == 16:
+                arrow_type = pyarrow.bool_()
+            elif type_code in (20, 21, 23, 26):
+                arrow_type = pyarrow.int64()
+            elif type_code in (700, 701):
+                arrow_type = pyarrow.float64()
+            elif type_code == 1700 and precision and 0 < precision <= 38 and scale is not None and 0 <= scale <= precision:
+                arrow_type = pyarrow.decimal128(precision, scale)
+            elif type_code in (18, 19, 25, 1042, 1043):
+                arrow_type = pyarrow.string()
+            elif type_code == 1082:
+                arrow_type = pyarrow.date32()
+            elif type_code == 1083:
+                arrow_type = pyarrow.time64('us')
+            elif type_code == 1114:
+                arrow_type = pyarrow.timestamp('us')
+            elif type_code == 1184:
+                arrow_type = pyarrow.timestamp('us', tz='UTC')
+            elif type_code == 17:
+                arrow_type, converter = pyarrow.binary(), bytes
+            else:
+                arrow_type, converter = pyarrow.string(), to_text
+        else:
+            if type_code == oracledb.DB_TYPE_NUMBER:
+                if scale == 0 and precision and precision <= 18:
+                    arrow_type = pyarrow.int64()
+                elif precision and 0 < precision <= 38 and scale is not None and 0 <= scale <= precision:
+                    arrow_type, converter = pyarrow.decimal128(precision, scale), to_decimal
+                elif precision and scale == -127:
+                    # FLOAT(b): precision is in binary digits
+                    arrow_type = pyarrow.float64()
+                else:
+                    # Unconstrained NUMBER values may not fit any fixed precision and scale
+                    arrow_type, converter = pyarrow.string(), str
+            elif type_code == oracledb.DB_TYPE_BINARY_INTEGER:
+                arrow_type = pyarrow.int64()
+            elif type_code in (oracledb.DB_TYPE_BINARY_FLOAT, oracledb.DB_TYPE_BINARY_DOUBLE):
+                arrow_type = pyarrow.float64()
+            elif type_code == oracledb.DB_TYPE_BOOLEAN:
+                arrow_type = pyarrow.bool_()
+            elif type_code in (oracledb.DB_TYPE_VARCHAR, oracledb.DB_TYPE_NVARCHAR, oracledb.DB_TYPE_CHAR,
+                               oracledb.DB_TYPE_NCHAR, oracledb.DB_TYPE_LONG, oracledb.DB_TYPE_ROWID):
+                arrow_type = pyarrow.string()
+            elif type_code in DATETIME_ORACLE_TYPES:
+                arrow_type = pyarrow.timestamp('us')
+            elif type_code in BINARY_ORACLE_TYPES:
+                arrow_type = pyarrow.binary()
+            else:
+                arrow_type, converter = pyarrow.string(), to_text
+        fields.append((name, arrow_type, converter))
+    return fields
+
+def apply_converter_plan(plan, rows):
+    """Apply a converter plan to a block of rows, skipping NULL values"""
+    if not plan:
+        return rows
+    converted = []
+    for row in rows:
+        values = list(row)
+        for index, convert in plan:
+            value = values[index]
+            if value is not None:
+                values[index] = convert(value)
+        converted.append(values)
+    return converted
+
 def output_type_handler(cursor, name, default_type, size, precision, scale):
     """Modify the fetched data types for LOB and OBJECT columns (Oracle only)."""
     if default_type == oracledb.DB_TYPE_CLOB:
@@ -97,171 +427,252 @@ def output_type_handler(cursor, name, default_type, size, precision, scale):
         return cursor.var(oracledb.DB_TYPE_LONG_RAW, arraysize=cursor.arraysize)
     return None
 
-def pipe_results_as_csv(connection, cursor, start_time, download_lobs):
+def pipe_results_as_csv(connection, cursor, start_time, download_lobs, window=None):
     """Loop through a SQL statement's result set and return as a CSV stream"""
     if cursor is None:
-        connection.close()
+        release_connection(connection)
         return Response('Statement processed', mimetype='text/csv')
 
     csv_header = get_option('csv_header', 'n').lower()
+    chunk_size = get_chunk_size()
+    window = window or RowWindow()
 
     def generate(download_lobs_arg):
-        line = Line()
-        writer = csv.writer(line, lineterminator='\n', quoting=csv.QUOTE_NONNUMERIC)
-        
-        is_postgres = hasattr(connection, 'cursor_factory')
-        if is_postgres:
-            columns = [desc[0] for desc in cursor.description]
-        else:
-            columns = [col[0] for col in cursor.description]
+        encoder = CsvEncoder(chunk_size)
 
+        is_postgres = hasattr(connection, 'cursor_factory')
         if csv_header == 'y':
-            writer.writerow(columns)
-            yield line.read()
+            encoder.write_header([desc[0] for desc in cursor.description])
 
+        plan = build_converter_plan(cursor.description, is_postgres, download_lobs_arg)
         try:
-            for row in cursor:
-                # If row is a dict (Postgres with RealDictCursor), convert to list
-                if isinstance(row, dict):
-                    row_values = [convert_db_value(row[col], download_lobs_arg) for col in columns]
-                else:
-                    row_values = [convert_db_value(val, download_lobs_arg) for val in row]
-                
-                writer.writerow(row_values)
-                yield line.read()
-            
-            connection.close()
+            for rows in window.blocks(cursor):
+                chunk = encoder.write_rows(apply_converter_plan(plan, rows))
+                if chunk:
+                    yield chunk
+            chunk = encoder.flush()
+            if chunk:
+                yield chunk
+            window.complete = True
         except Exception as e:
             current_app.logger.error(f"Error during CSV streaming: {str(e)}")
-            yield f"ERROR: {str(e)}"
+            yield encoder.flush() + f"ERROR: {str(e)}"
         finally:
             try:
                 cursor.close()
             except:
                 pass
-            try:
-                connection.close()
-            except:
-                pass
+            release_connection(connection)
 
-    return Response(generate(download_lobs), mimetype='text/csv')
+    return Response(stream_with_context(generate(download_lobs)), mimetype='text/csv')
 
-def pipe_results_as_json(connection, cursor, start_time, download_lobs):
+def pipe_results_as_json(connection, cursor, start_time, download_lobs, compact=False, window=None):
     """Loop through a SQL statement's result set and return as a JSON object"""
     if cursor is None:
-        connection.close()
+        release_connection(connection)
         return Response('{"message": "Statement processed"}', mimetype='application/json')
 
     is_postgres = hasattr(connection, 'cursor_factory')
+    chunk_size = get_chunk_size()
+    window = window or RowWindow()
 
     def generate(download_lobs_arg):
-        if is_postgres:
-            columns = [desc[0] for desc in cursor.description]
-        else:
-            columns = [col[0] for col in cursor.description]
-
-        yield('{\n')
-        yield(f'"columns":{json.dumps(columns)}, \n')
-        yield('"rows": [\n')
+        columns = [desc[0] for desc in cursor.description]
+        encoder = JsonEncoder(columns, compact, chunk_size)
+        plan = build_converter_plan(cursor.description, is_postgres, download_lobs_arg)
+        yield encoder.start()
         try:
-            firstRow = True
-            for row in cursor:
-                if firstRow:
-                    firstRow = False
-                else:
-                    yield (',\n')
-
-                row_dict = {}
-                if is_postgres:
-                    # row is already a dict-like object if using RealDictCursor
-                    for k, v in row.items():
-                        row_dict[k] = convert_db_value(v, download_lobs_arg)
-                else:
-                    for i, col_value in enumerate(row):
-                        col_name = columns[i]
-                        row_dict[col_name] = convert_db_value(col_value, download_lobs_arg)
-
-                yield(json.dumps(row_dict, default=str))
+            for rows in window.blocks(cursor):
+                chunk = encoder.write_rows(apply_converter_plan(plan, rows))
+                if chunk:
+                    yield chunk
 
-            yield('\n],')
-            yield(f'"executionTime":{json.dumps(time.time() - start_time)} \n')
-            yield('}')
+            yield encoder.finish({"executionTime": time.time() - start_time, **window.trailer()})
+            window.complete = True
         except Exception as e:
             current_app.logger.error(f"Error during JSON streaming: {str(e)}")
-            yield(f'{{"error": "Internal Server Error: {str(e)}"}}')
+            yield encoder.flush() + f'{{"error": "Internal Server Error: {str(e)}"}}'
         finally:
             try:
                 cursor.close()
             except:
                 pass
+            release_connection(connection)
+
+    return Response(stream_with_context(generate(download_lobs)), mimetype='application/json')
+
+def pipe_results_as_arrow(connection, cursor, start_time, download_lobs, output_format, window=None):
+    """Loop through a SQL statement's result set and return as an Arrow IPC or Parquet stream"""
+    if cursor is None:
+        release_connection(connection)
+        return Response(b'', mimetype=ARROW_MIMETYPES[output_format])
+
+    is_postgres = hasattr(connection, 'cursor_factory')
+    chunk_size = get_chunk_size()
+    window = window or RowWindow()
+
+    def generate(download_lobs_arg):
+        try:
+            fields = build_arrow_fields(cursor.description, is_postgres, download_lobs_arg)
+            encoder = ArrowEncoder(fields, output_format, chunk_size)
+            for rows in window.blocks(cursor):
+                chunk = encoder.write_rows(rows)
+                if chunk:
+                    yield chunk
+            yield encoder.finish()
+            window.complete = True
+        except Exception as e:
+            # Error text cannot be embedded in a binary stream. Re-raise so the server aborts the
+            # chunked response: a stream that just stops would be read as a complete result
+            current_app.logger.error(f"Error during {output_format} streaming: {str(e)}")
+            raise
+        finally:
             try:
-                connection.close()
+                cursor.close()
             except:
                 pass
-
-    return Response(generate(download_lobs), mimetype='application/json')
-
-def get_connection(username, password, params):
-    """Get a database connection (Oracle or Postgres)"""
+            release_connection(connection)
+
+    return Response(stream_with_context(generate(download_lobs)), mimetype=ARROW_MIMETYPES[output_format])
+
+def get_compression_config(params):
+    """Return the endpoint's compression levels, or None if compression is disabled"""
+    compression = params.get('compression')
+    if compression is False:
+        return None
+    config = dict(DEFAULT_COMPRESSION)
+    if isinstance(compression, dict):
+        config.update(compression)
+    return config
+
+def compress_response(response, params, output_format):
+    """Compress a streamed response with gzip or zstd when the client's Accept-Encoding allows it"""
+    config = get_compression_config(params)
+    # Parquet pages are already compressed
+    if config is None or not response.is_streamed or output_format == 'parquet':
+        return response
+    encoding = choose_content_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    response.response = compress_chunks(response.response, encoding, config[f'{encoding}_level'])
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def get_connection(username, password, params, endpoint=None):
+    """Get a database connection (Oracle or Postgres), borrowed from the endpoint's pool when enabled"""
     db_type = params.get("dbType", "oracle")
     try:
-        if db_type == "postgres":
-            dsn = params.get("dsn")
-            if '/' in dsn and ':' in dsn and ' ' not in dsn and '=' not in dsn:
-                host_port, dbname = dsn.split('/')
-                host, port = host_port.split(':')
-                connection = psycopg2.connect(
-                    user=username,
-                    password=password,
-                    host=host,
-                    port=port,
-                    database=dbname,
-                    cursor_factory=psycopg2.extras.RealDictCursor
-                )
-            else:
-                connection = psycopg2.connect(dsn, user=username, password=password, cursor_factory=psycopg2.extras.RealDictCursor)
-            return connection
+        if endpoint is not None and get_pool_config(params)["enabled"]:
+            connection = pool_manager.acquire(endpoint, username, password, params)
+        elif db_type == "postgres":
+            connection = psycopg2.connect(user=username, password=password, **postgres_connect_args(params))
         else:
-            wallet_location = params.get("wallet_location")
-            if wallet_location:
-                connection = oracledb.connect(user=username, password=password,
-                                                 dsn=params.get("dsn"),
-                                                 config_dir=wallet_location,
-                                                 wallet_location=wallet_location,
-                                                 wallet_password=params.get("wallet_password"))
-            else:
-                connection = oracledb.connect(user=username, password=password, dsn=params.get("dsn"))
+            connection = oracledb.connect(user=username, password=password, **oracle_connect_args(params))
+        if db_type != "postgres":
             connection.outputtypehandler = output_type_handler
-            return connection
+        return connection
     except Exception as e:
+        if is_pool_busy_error(e):
+            fail_request(503, description=f"No database connection available, try again later: {str(e)}",
+                         retry_after=POOL_BUSY_RETRY_AFTER)
         fail_request(401, description=str(e))
 
-def get_cursor(connection, sql, binds):
+def release_connection(connection):
+    """Return a connection to its pool (or close it if it was not pooled)"""
+    try:
+        pool_manager.release(connection)
+    except Exception as e:
+        current_app.logger.warning(f"Error releasing connection: {str(e)}")
+
+def translate_binds(sql, binds, is_postgres):
+    """Return (sql, binds) with Oracle-style bind placeholders converted for Postgres"""
+    if not is_postgres:
+        return sql, binds
+    if isinstance(binds, dict):
+        # Convert :name to %(name)s
+        return re.sub(r':(\w+)', r'%(\1)s', sql), binds
+    # Convert :1, :2 or :any to %s for positional binds
+    return re.sub(r':\w+', '%s', sql), binds
+
+class PostgresServerCursor(object):
+    """
+    A psycopg2 named (server side) cursor that streams a result set in arraysize blocks.
+
+    psycopg2 only populates description after the first fetch from a named cursor, so
+    execute() fetches the first block straight away and fetchmany() hands it out first.
+    """
+    def __init__(self, connection, name='sql2csv'):
+        self._cursor = connection.cursor(name=name)
+        self._buffer = []
+
+    @property
+    def arraysize(self):
+        return self._cursor.arraysize
+
+    @arraysize.setter
+    def arraysize(self, value):
+        # itersize is the FETCH size when the cursor is iterated; fetchmany() uses arraysize
+        self._cursor.arraysize = value
+        self._cursor.itersize = value
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql, binds=None):
+        self._cursor.execute(sql, binds)
+        self._buffer = self._cursor.fetchmany(self._cursor.arraysize)
+
+    def fetchmany(self, size=None):
+        size = size or self._cursor.arraysize
+        if self._buffer:
+            rows, self._buffer = self._buffer[:size], self._buffer[size:]
+            return rows
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._buffer = []
+        self._cursor.close()
+
+def set_statement_timeout(connection, timeout_ms, is_postgres):
+    """Limit each database call made by the current request to timeout_ms milliseconds"""
+    if is_postgres:
+        # Transaction scoped, so the rollback when the connection is released resets it
+        with connection.cursor() as cursor:
+            cursor.execute("select set_config('statement_timeout', %s, true)", (str(timeout_ms),))
+    else:
+        # Reset by ConnectionPoolManager.release before the connection is reused
+        connection.call_timeout = timeout_ms
+
+def get_cursor(connection, sql, binds, arraysize=None, prefetchrows=None, timeout_ms=None):
     """Create a cursor and execute a SQL statement"""
     is_postgres = hasattr(connection, 'cursor_factory')
     try:
-        cursor = connection.cursor()
+        if timeout_ms:
+            set_statement_timeout(connection, timeout_ms, is_postgres)
+        if is_postgres:
+            # A named cursor keeps the result set on the server instead of buffering it in the worker
+            cursor = PostgresServerCursor(connection)
+        else:
+            cursor = connection.cursor()
+        if arraysize:
+            cursor.arraysize = arraysize
         if not is_postgres:
+            # prefetchrows must be set before execute (Oracle only)
+            if prefetchrows:
+                cursor.prefetchrows = prefetchrows
             cursor.execute("set transaction read only")
             
         if binds is None or not binds:
             cursor.execute(sql)
         else:
-            if is_postgres:
-                # Convert Oracle-style binds to Postgres
-                import re
-                if isinstance(binds, dict):
-                    # Convert :name to %(name)s
-                    pg_sql = re.sub(r':(\w+)', r'%(\1)s', sql)
-                    cursor.execute(pg_sql, binds)
-                else:
-                    # Convert :1, :2 or :any to %s for positional binds
-                    pg_sql = re.sub(r':\w+', '%s', sql)
-                    cursor.execute(pg_sql, binds)
-            else:
-                cursor.execute(sql, binds)
+            cursor.execute(*translate_binds(sql, binds, is_postgres))
         return cursor
     except Exception as e:
+        release_connection(connection)
+        if timeout_ms and is_timeout_error(e):
+            fail_request(504, description=f"Query exceeded timeout_ms ({timeout_ms}): {str(e)}")
         fail_request(400, description=str(e))
 
 @bp.route('/healthz')
@@ -278,19 +689,8 @@ def get_endpoint(endpoint):
         return params
     return params.get('dsn', '')
 
-@bp.route('/sql', methods=['POST'])
-@bp.route('/sql/<endpoint>', methods=['POST'])
-def run_sql(endpoint=None):
-    """Main entry point for running SQL and streaming results"""
-    start_time = time.time()
-    if not request.json or 'sql' not in request.json:
-        fail_request(400, description="Missing 'sql' in request body")
-    
-    sql = request.json.get('sql')
-    if endpoint is None:
-        endpoint = request.json.get('endpoint')
-    
-    # Get credentials from X-DB-Credentials header or similar
+def get_credentials():
+    """Return (username, password) from the X-DB-Credentials header or basic auth"""
     auth = request.headers.get('X-DB-Credentials')
     if auth:
         try:
@@ -316,35 +716,36 @@ def run_sql(endpoint=None):
             password = request.authorization.password
         else:
             fail_request(401, description="Missing database credentials")
+    return username, password
+
+def prepare_query(endpoint=None):
+    """
+    Validate a /sql request and collect everything needed to run it.
+
+    Returns:
+        A dictionary with the endpoint, connection params, credentials, SQL, binds,
+        fetch sizes, row window, output format and streaming options
+    """
+    start_time = time.time()
+    if not request.json or 'sql' not in request.json:
+        fail_request(400, description="Missing 'sql' in request body")
+    
+    sql = request.json.get('sql')
+    if endpoint is None:
+        endpoint = request.json.get('endpoint')
+    
+    # Get credentials from X-DB-Credentials header or similar
+    username, password = get_credentials()
 
     params = get_connection_params(endpoint)
-    options = validate_options(request.json.get('options'))
+    validate_options(request.json.get('options'))
     
     # Validate SQL - only SELECT allowed
-    parsed = sqlparse.parse(sql)
-    if not parsed:
+    classification = statement_classifier.classify(sql)
+    if classification == INVALID:
         fail_request(400, description="Invalid SQL statement")
-    
-    main_stmt = parsed[0]
-    stmt_type = main_stmt.get_type()
-    
-    if stmt_type != 'SELECT':
-        # Check if it's a WITH statement that is actually a SELECT
-        is_with_select = False
-        if stmt_type == 'UNKNOWN':
-            sql_upper = sql.strip().upper()
-            if sql_upper.startswith('WITH'):
-                # Crude check: does it contain SELECT?
-                # A more robust way is needed but for now let's be strict
-                # Actually sqlparse should identify WITH ... SELECT as SELECT in some versions
-                # but if it's UNKNOWN we need to be careful.
-                if 'SELECT' in sql_upper:
-                    # Final check: does it contain DELETE, INSERT, UPDATE?
-                    if not any(x in sql_upper for x in ['DELETE', 'INSERT', 'UPDATE', 'DROP', 'ALTER']):
-                        is_with_select = True
-        
-        if not is_with_select:
-            fail_request(403, description="SQL statement is not of type SELECT")
+    if classification == REJECTED:
+        fail_request(403, description="SQL statement is not of type SELECT")
 
     # Validate binds
     binds = request.json.get('binds')
@@ -356,8 +757,13 @@ def run_sql(endpoint=None):
         elif not isinstance(binds, dict):
             fail_request(400, description="Bind variables must be a simple array or object")
 
-    download_lobs = get_option('download_lobs', 'N')
-    
+    arraysize, prefetchrows = get_fetch_sizes(params)
+    timeout_ms = get_timeout_ms(params, get_option('timeout_ms', None))
+    window = get_row_window(sql, binds)
+    if window.max_rows is not None and window.offset + window.max_rows + 1 < arraysize:
+        # Fetch the whole window (+1 row to detect truncation) in a single round trip
+        arraysize = prefetchrows = window.offset + window.max_rows + 1
+
     # Determine output format
     output_format = get_option('format', None)
     if not output_format:
@@ -365,50 +771,159 @@ def run_sql(endpoint=None):
             output_format = 'json'
         else:
             output_format = 'csv'
+    if output_format in ARROW_MIMETYPES and not PYARROW_AVAILABLE:
+        fail_request(501, description=f"Output format '{output_format}' requires pyarrow to be installed")
+
+    return {
+        "start_time": start_time,
+        "endpoint": endpoint,
+        "params": params,
+        "username": username,
+        "password": password,
+        "sql": sql,
+        "binds": binds,
+        "arraysize": arraysize,
+        "prefetchrows": prefetchrows,
+        "timeout_ms": timeout_ms,
+        "window": window,
+        "output_format": output_format,
+        "download_lobs": get_option('download_lobs', 'N'),
+        "csv_header": get_option('csv_header', 'n').lower(),
+        "chunk_size": get_chunk_size()
+    }
 
-    connection = get_connection(username, password, params)
-    cursor = get_cursor(connection, sql, binds)
+@bp.route('/sql', methods=['POST'])
+@bp.route('/sql/<endpoint>', methods=['POST'])
+def run_sql(endpoint=None):
+    """Main entry point for running SQL and streaming results"""
+    query = prepare_query(endpoint)
+    output_format = query["output_format"]
+    start_time, download_lobs, window = query["start_time"], query["download_lobs"], query["window"]
+
+    cache_config = get_cache_config(query["params"])
+    if cache_config:
+        cache_key = get_cache_key(query)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            response = Response(cached.chunks, mimetype=cached.mimetype)
+            response.headers['X-Cache'] = 'HIT'
+            return compress_response(response, query["params"], output_format)
+
+    connection = get_connection(query["username"], query["password"], query["params"], query["endpoint"])
+    cursor = get_cursor(connection, query["sql"], query["binds"], query["arraysize"], query["prefetchrows"],
+                        query["timeout_ms"])
 
     if output_format == 'csv':
-        return pipe_results_as_csv(connection, cursor, start_time, download_lobs)
+        response = pipe_results_as_csv(connection, cursor, start_time, download_lobs, window)
+    elif output_format in ARROW_MIMETYPES:
+        response = pipe_results_as_arrow(connection, cursor, start_time, download_lobs, output_format, window)
     else:
-        return pipe_results_as_json(connection, cursor, start_time, download_lobs)
-
-def execute_sql_internal(endpoint, sql_query, username, password):
-    """Internal function to execute SQL queries for MCP endpoints."""
+        response = pipe_results_as_json(connection, cursor, start_time, download_lobs,
+                                        compact=(output_format == 'json-compact'), window=window)
+    if cache_config and response.is_streamed:
+        response.response = result_cache.capture(cache_key, response.response, response.mimetype,
+                                                 cache_config, lambda: window.complete)
+        response.headers['X-Cache'] = 'MISS'
+    return compress_response(response, query["params"], output_format)
+
+def get_cache_key(query):
+    """Return the result cache key for a prepared query"""
+    window = query["window"]
+    options = {
+        "format": query["output_format"],
+        "csv_header": query["csv_header"],
+        "download_lobs": str(query["download_lobs"]).upper(),
+        "offset": window.offset,
+        "max_rows": window.max_rows
+    }
+    return result_cache.make_key(query["endpoint"], query["username"], query["password"],
+                                 query["sql"], query["binds"], options)
+
+def get_mcp_limits(params):
+    """
+    Return the row and byte limits applied to MCP query results for an endpoint.
+
+    The "mcp" key in endpoints.json may be an object overriding DEFAULT_MCP_LIMITS.
+    """
+    limits = dict(DEFAULT_MCP_LIMITS)
+    if isinstance(params.get('mcp'), dict):
+        limits.update(params['mcp'])
+    return limits
+
+def execute_sql_bounded(endpoint, sql_query, username, password, max_rows=None, max_bytes=None):
+    """
+    Execute a query for the MCP endpoints, stopping once max_rows rows or roughly
+    max_bytes bytes of JSON have been fetched.
+
+    Returns:
+        A dictionary with the rows (as dictionaries keyed by column name), row_count,
+        truncated and truncated_reason ("max_rows", "max_bytes" or None)
+    """
     try:
         conn_params = get_connection_params(endpoint)
-        sql_query_clean = sql_query.strip()
-        sql_query_for_execution = sql_query_clean.rstrip(';')
-
-        connection = get_connection(username, password, conn_params)
+        sql_query_for_execution = sql_query.strip().rstrip(';')
+        arraysize = validate_fetch_size('arraysize', conn_params.get('arraysize', DEFAULT_ARRAYSIZE))
+        if max_rows is not None:
+            arraysize = min(arraysize, max_rows + 1)
+
+        cache_config = get_cache_config(conn_params)
+        if cache_config:
+            cache_key = result_cache.make_key(endpoint, username, password, sql_query_for_execution, None,
+                                              {"mcp": True, "max_rows": max_rows, "max_bytes": max_bytes})
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                # Decimal keeps the exact digits written by dumps; format_sql_response encodes it the same way
+                return json.loads(cached.read(), parse_float=decimal.Decimal)
+
+        connection = get_connection(username, password, conn_params, endpoint)
         is_postgres = hasattr(connection, 'cursor_factory')
-        
-        cursor = get_cursor(connection, sql_query_for_execution, None)
 
-        if is_postgres:
-            rows = cursor.fetchall()
-            result = []
-            for row in rows:
-                processed_row = {k: convert_db_value(v, 'Y') for k, v in row.items()}
-                result.append(processed_row)
-        else:
+        cursor = get_cursor(connection, sql_query_for_execution, None, arraysize,
+                            timeout_ms=get_timeout_ms(conn_params))
+        try:
             columns = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
+            plan = build_converter_plan(cursor.description, is_postgres, 'Y')
+            window = RowWindow(max_rows=max_rows)
             result = []
-            for row in rows:
-                row_dict = {}
-                for i, value in enumerate(row):
-                    row_dict[columns[i]] = convert_db_value(value, 'Y')
-                result.append(row_dict)
-
-        cursor.close()
-        connection.close()
-        return result
+            result_bytes = 0
+            truncated_reason = None
+            for rows in window.blocks(cursor):
+                block = [dict(zip(columns, row)) for row in apply_converter_plan(plan, rows)]
+                if max_bytes is not None:
+                    block_bytes = len(dumps(block))
+                    if result_bytes + block_bytes > max_bytes:
+                        # Keep the rows of this block that still fit, then stop fetching
+                        for row in block:
+                            result_bytes += len(dumps(row)) + 1
+                            if result_bytes > max_bytes:
+                                break
+                            result.append(row)
+                        truncated_reason = 'max_bytes'
+                        break
+                    result_bytes += block_bytes
+                result.extend(block)
+            if truncated_reason is None and window.truncated:
+                truncated_reason = 'max_rows'
+        finally:
+            cursor.close()
+            release_connection(connection)
+        bounded = {
+            "rows": result,
+            "row_count": len(result),
+            "truncated": truncated_reason is not None,
+            "truncated_reason": truncated_reason
+        }
+        if cache_config:
+            result_cache.put(cache_key, dumps(bounded).encode('utf-8'), 'application/json', cache_config)
+        return bounded
     except Exception as e:
         current_app.logger.error(f"Error executing SQL internally for endpoint '{endpoint}': {e}")
         raise
 
+def execute_sql_internal(endpoint, sql_query, username, password):
+    """Internal function to execute SQL queries for MCP endpoints. Returns every row."""
+    return execute_sql_bounded(endpoint, sql_query, username, password)["rows"]
+
 def get_connection_params(endpoint):
     """Get the connection parameters for a registered endpoint"""
     params = current_app.endpoints.get(endpoint)
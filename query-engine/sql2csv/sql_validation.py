@@ -0,0 +1,136 @@
+"""
+SQL statement validation for the query engine.
+Classifies statements as SELECT or rejected, caching the result for repeated SQL.
+"""
+
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+import sqlparse
+from sqlparse import lexer, tokens
+
+logger = logging.getLogger(__name__)
+
+
+# Statement classifications
+SELECT = "SELECT"
+WITH_SELECT = "WITH_SELECT"
+REJECTED = "REJECTED"
+INVALID = "INVALID"
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+def _classify_by_first_token(sql: str):
+    """
+    Classify a statement from its first keyword without building a parse tree.
+
+    Returns SELECT or REJECTED when the first token after any whitespace and comments
+    is a DML or DDL keyword, otherwise None (e.g. WITH or a leading parenthesis).
+    """
+    for ttype, value in lexer.tokenize(sql):
+        if ttype in tokens.Whitespace or ttype in tokens.Comment:
+            continue
+        if ttype in tokens.Keyword.DML or ttype in tokens.Keyword.DDL:
+            return SELECT if value.upper() == "SELECT" else REJECTED
+        return None
+    return None
+
+
+def _classify_by_parse(sql: str) -> str:
+    """Classify a statement using a full sqlparse parse."""
+    parsed = sqlparse.parse(sql)
+    if not parsed:
+        return INVALID
+
+    stmt_type = parsed[0].get_type()
+    if stmt_type == 'SELECT':
+        return SELECT
+
+    # sqlparse may report a WITH ... SELECT statement as UNKNOWN
+    if stmt_type == 'UNKNOWN':
+        sql_upper = sql.strip().upper()
+        if sql_upper.startswith('WITH') and 'SELECT' in sql_upper:
+            if not any(x in sql_upper for x in ['DELETE', 'INSERT', 'UPDATE', 'DROP', 'ALTER']):
+                return WITH_SELECT
+    return REJECTED
+
+
+class StatementClassifier:
+    """
+    Classifies SQL statements and caches the results.
+
+    DESIGN:
+    - Results are cached in an LRU keyed by the SHA-256 digest of the statement text
+    - Statements that start with a DML or DDL keyword are classified from the
+      token stream; only the remainder (WITH, parentheses, ...) are fully parsed
+    - The cache is per process and holds classifications only, never SQL text
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.token_classified = 0
+        self.parse_classified = 0
+
+    def classify(self, sql: str) -> str:
+        """
+        Classify a SQL statement.
+
+        Returns:
+            SELECT, WITH_SELECT, REJECTED or INVALID
+        """
+        key = hashlib.sha256(sql.encode('utf-8')).digest()
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = _classify_by_first_token(sql)
+        if result is None:
+            result = _classify_by_parse(sql)
+            fast = False
+        else:
+            fast = True
+
+        with self._lock:
+            if fast:
+                self.token_classified += 1
+            else:
+                self.parse_classified += 1
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def clear(self):
+        """Remove all cached classifications."""
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> dict:
+        """Get cache statistics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0,
+                "token_classified": self.token_classified,
+                "parse_classified": self.parse_classified
+            }
+
+
+# Global classifier instance (one per gunicorn worker)
+statement_classifier = StatementClassifier()
@@ -8,7 +8,12 @@ if [ -d "/dev/shm/mcp_credentials" ]; then
     echo "Clearing credential cache in /dev/shm..."
     rm -rf /dev/shm/mcp_credentials/*
 fi
-gunicorn --worker-tmp-dir /dev/shm --workers=2 --threads=4 --worker-class=gthread --bind 0.0.0.0:5000 "sql2csv:create_app()" &
+# QUERY_ENGINE_SERVER=asgi streams /sql results on an asyncio event loop (uvicorn)
+if [ "$QUERY_ENGINE_SERVER" = "asgi" ]; then
+    uvicorn --factory "sql2csv.asgi:create_asgi_app" --workers=2 --host 0.0.0.0 --port 5000 &
+else
+    gunicorn --worker-tmp-dir /dev/shm --workers=2 --threads=4 --worker-class=gthread --bind 0.0.0.0:5000 "sql2csv:create_app()" &
+fi
 QUERY_ENGINE_PID=$!
 
 # Wait for query engine to be ready (optional, but good practice)
@@ -0,0 +1,131 @@
+import os
+import json
+import asyncio
+import oracledb
+import pytest
+from unittest.mock import MagicMock
+
+pytest.importorskip("starlette")
+pytest.importorskip("a2wsgi")
+from starlette.testclient import TestClient
+from sql2csv import asgi
+
+CREDENTIALS = {"X-DB-Credentials": "dXNlcjpwYXNz", "Content-Type": "application/json"}
+
+class FakeAsyncCursor:
+    """Async cursor over canned Oracle rows."""
+    description = [("ID", oracledb.DB_TYPE_NUMBER, None, None, 10, 0, False),
+                   ("NAME", oracledb.DB_TYPE_VARCHAR, None, None, None, None, True)]
+
+    def __init__(self, rows):
+        self.arraysize = 2
+        self.remaining = list(rows)
+        self.closed = False
+
+    async def fetchmany(self, size):
+        block = self.remaining[:size]
+        del self.remaining[:size]
+        return block
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def fake_async_db(monkeypatch):
+    cursor = FakeAsyncCursor([(i, f"name{i}") for i in range(1, 6)])
+    released = []
+
+    async def get_connection(query, is_postgres):
+        return object()
+
+    async def get_cursor(connection, query, is_postgres):
+        return cursor
+
+    async def release(connection, is_postgres, discard=False):
+        released.append(connection)
+        cursor.discarded = discard
+
+    monkeypatch.setattr(asgi, "get_async_connection", get_connection)
+    monkeypatch.setattr(asgi, "get_async_cursor", get_cursor)
+    monkeypatch.setattr(asgi, "release_async_connection", release)
+    cursor.released = released
+    return cursor
+
+@pytest.fixture
+def asgi_client():
+    os.environ['ENDPOINTS_FILE'] = os.path.join(os.path.dirname(__file__), 'conftest.json')
+    with TestClient(asgi.create_asgi_app({'TESTING': True})) as client:
+        yield client
+
+def test_flask_routes_are_mounted(asgi_client):
+    response = asgi_client.get("/healthz")
+    assert response.status_code == 200
+    assert response.text == "healthy"
+
+def test_validation_errors_match_wsgi_route(asgi_client):
+    response = asgi_client.post("/sql/pdb21", headers={"Content-Type": "application/json"},
+                                json={"sql": "select 1 from dual"})
+    assert response.status_code == 401
+    response = asgi_client.post("/sql/pdb21", headers=CREDENTIALS, json={"sql": "delete from t"})
+    assert response.status_code == 403
+    assert "error" in response.json()
+
+def test_busy_pool_returns_503(asgi_client, monkeypatch):
+    async def acquire(*args):
+        raise oracledb.DatabaseError(MagicMock(full_code="DPY-4005"))
+    monkeypatch.setattr(asgi.async_pool_manager, "acquire", acquire)
+    response = asgi_client.post("/sql/pdb21", headers=CREDENTIALS, json={"sql": "select 1 from dual"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+def test_streams_paginated_json(asgi_client, fake_async_db):
+    response = asgi_client.post("/sql/pdb21", headers=CREDENTIALS,
+        json={"sql": "select id, name from t", "options": {"format": "json-compact", "max_rows": 3}})
+    assert response.status_code == 200
+    body = json.loads(response.text)
+    assert body["rows"] == [[1, "name1"], [2, "name2"], [3, "name3"]]
+    assert body["truncated"] is True
+    assert fake_async_db.closed
+    assert len(fake_async_db.released) == 1
+
+def test_streams_gzip_csv(asgi_client, fake_async_db):
+    response = asgi_client.post("/sql/pdb21", headers={**CREDENTIALS, "Accept-Encoding": "gzip"},
+        json={"sql": "select id, name from t", "options": {"csv_header": "y"}})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Content-Type"].startswith("text/csv")
+    assert response.text.splitlines() == ['"ID","NAME"'] + [f'{i},"name{i}"' for i in range(1, 6)]
+
+def test_async_postgres_connect_args():
+    args = asgi.async_postgres_connect_args({"dsn": "db.example.com:5432/cmbs"})
+    assert args == {"host": "db.example.com", "port": "5432", "dbname": "cmbs"}
+
+def test_disconnect_during_fetch_cancels_query(fake_async_db):
+    async def fetchmany(size):
+        raise asyncio.CancelledError()
+    fake_async_db.fetchmany = fetchmany
+    connection = MagicMock()
+    query = {"output_format": "csv", "window": asgi.sql2csv.RowWindow(), "download_lobs": "N",
+             "chunk_size": 1024, "csv_header": "n", "start_time": 0}
+
+    async def consume():
+        return [chunk async for chunk in asgi.stream_results(query, connection, fake_async_db, False)]
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(consume())
+    connection.cancel.assert_called_once()
+    assert fake_async_db.closed
+    assert fake_async_db.discarded is True
+
+def test_completed_stream_does_not_cancel(asgi_client, fake_async_db):
+    asgi_client.post("/sql/pdb21", headers=CREDENTIALS, json={"sql": "select id, name from t"})
+    assert fake_async_db.discarded is False
+
+def test_arrow_stream_error_aborts_response(asgi_client, fake_async_db):
+    pytest.importorskip("pyarrow")
+    async def fetchmany(size):
+        raise RuntimeError("ORA-03113")
+    fake_async_db.fetchmany = fetchmany
+    with pytest.raises(RuntimeError, match="ORA-03113"):
+        asgi_client.post("/sql/pdb21", headers=CREDENTIALS,
+                         json={"sql": "select id, name from t", "options": {"format": "arrow"}})
+    assert fake_async_db.closed
@@ -0,0 +1,113 @@
+import oracledb
+import psycopg2.pool
+import pytest
+from unittest.mock import MagicMock, patch
+from sql2csv.connection_pool import ConnectionPoolManager, get_pool_config, postgres_connect_args, is_pool_busy_error
+
+ORACLE_PARAMS = {"dsn": "localhost:1521/XEPDB1"}
+POSTGRES_PARAMS = {"dsn": "localhost:5432/cmbs", "dbType": "postgres", "pool": {"max": 2}}
+
+def test_pool_config_defaults_and_overrides():
+    assert get_pool_config("localhost:1521/XEPDB1")["enabled"] is True
+    assert get_pool_config({"dsn": "x", "pool": False})["enabled"] is False
+    config = get_pool_config({"dsn": "x", "pool": {"max": 10}})
+    assert config["max"] == 10
+    assert config["min"] == 0
+
+def test_postgres_connect_args_host_port_format():
+    args = postgres_connect_args({"dsn": "db.example.com:5432/cmbs"})
+    assert args["host"] == "db.example.com"
+    assert args["port"] == "5432"
+    assert args["database"] == "cmbs"
+    assert "dsn" not in args
+    # Rows are fetched as plain tuples
+    assert "cursor_factory" not in args
+
+@patch("sql2csv.connection_pool.oracledb.create_pool")
+def test_oracle_pool_reused_for_same_credentials(mock_create_pool):
+    mgr = ConnectionPoolManager()
+    conn1 = mgr.acquire("pdb21", "scott", "tiger", ORACLE_PARAMS)
+    mgr.release(conn1)
+    conn2 = mgr.acquire("pdb21", "scott", "tiger", ORACLE_PARAMS)
+    mgr.release(conn2)
+
+    assert mock_create_pool.call_count == 1
+    pool = mock_create_pool.return_value
+    assert pool.acquire.call_count == 2
+    assert pool.release.call_count == 2
+
+    # A request's timeout_ms is not passed on to the next borrower
+    assert pool.acquire.return_value.call_timeout == 0
+
+    stats = mgr.get_stats()
+    assert len(stats) == 1
+    assert stats[0]["acquired"] == 2
+    assert stats[0]["in_use"] == 0
+    assert "tiger" not in str(stats)
+
+@patch("sql2csv.connection_pool.oracledb.create_pool")
+def test_different_password_gets_separate_pool(mock_create_pool):
+    mock_create_pool.side_effect = lambda **kwargs: MagicMock()
+    mgr = ConnectionPoolManager()
+    mgr.release(mgr.acquire("pdb21", "scott", "tiger", ORACLE_PARAMS))
+    mgr.release(mgr.acquire("pdb21", "scott", "wrong", ORACLE_PARAMS))
+    assert mock_create_pool.call_count == 2
+
+@patch("sql2csv.connection_pool.oracledb.create_pool")
+def test_failed_first_acquire_drops_pool(mock_create_pool):
+    mock_create_pool.return_value.acquire.side_effect = Exception("ORA-01017: invalid username/password")
+    mgr = ConnectionPoolManager()
+    with pytest.raises(Exception):
+        mgr.acquire("pdb21", "scott", "wrong", ORACLE_PARAMS)
+    assert mgr.get_stats() == []
+    mock_create_pool.return_value.close.assert_called_once()
+
+@patch("sql2csv.connection_pool.psycopg2.pool.ThreadedConnectionPool")
+def test_postgres_release_puts_connection_back(mock_pool_class):
+    mgr = ConnectionPoolManager()
+    conn = mgr.acquire("cmbs", "postgres", "secret", POSTGRES_PARAMS)
+    mgr.release(conn)
+    pool = mock_pool_class.return_value
+    pool.putconn.assert_called_once_with(conn)
+    assert mock_pool_class.call_args[0] == (0, 2)
+
+@patch("sql2csv.connection_pool.psycopg2.pool.ThreadedConnectionPool")
+def test_postgres_stats_use_manager_counts(mock_pool_class):
+    # Only the public pool API is available, so stats cannot rely on psycopg2 internals
+    mock_pool_class.return_value = MagicMock(spec=["getconn", "putconn", "closeall"])
+    mgr = ConnectionPoolManager()
+    conn1 = mgr.acquire("cmbs", "postgres", "secret", POSTGRES_PARAMS)
+    mgr.acquire("cmbs", "postgres", "secret", POSTGRES_PARAMS)
+    mgr.release(conn1)
+    stats = mgr.get_stats()[0]
+    assert (stats["acquired"], stats["released"], stats["in_use"], stats["busy"]) == (2, 1, 1, 1)
+
+def test_pool_busy_errors():
+    assert is_pool_busy_error(psycopg2.pool.PoolError("connection pool exhausted"))
+    assert not is_pool_busy_error(psycopg2.pool.PoolError("connection pool is closed"))
+    assert is_pool_busy_error(oracledb.DatabaseError(MagicMock(full_code="DPY-4005")))
+    assert not is_pool_busy_error(oracledb.DatabaseError(MagicMock(full_code="ORA-01017")))
+
+@patch("sql2csv.connection_pool.oracledb.create_pool")
+def test_busy_pool_is_kept(mock_create_pool):
+    mock_create_pool.return_value.acquire.side_effect = oracledb.DatabaseError(MagicMock(full_code="DPY-4005"))
+    mgr = ConnectionPoolManager()
+    with pytest.raises(oracledb.DatabaseError):
+        mgr.acquire("pdb21", "scott", "tiger", ORACLE_PARAMS)
+    assert len(mgr.get_stats()) == 1
+    mock_create_pool.return_value.close.assert_not_called()
+
+@patch("sql2csv.connection_pool.oracledb.create_pool")
+def test_idle_pools_are_evicted(mock_create_pool):
+    mgr = ConnectionPoolManager(eviction_interval=0)
+    params = {**ORACLE_PARAMS, "pool": {"idle_timeout": 0}}
+    mgr.release(mgr.acquire("pdb21", "scott", "tiger", params))
+    mgr._evict_idle_pools()
+    assert mgr.get_stats() == []
+    mock_create_pool.return_value.close.assert_called_once_with(force=True)
+
+def test_unpooled_connection_is_closed():
+    mgr = ConnectionPoolManager()
+    conn = MagicMock()
+    mgr.release(conn)
+    conn.close.assert_called_once()
@@ -0,0 +1,117 @@
+import csv
+import pytest
+import io
+import json
+import datetime
+import zlib
+from decimal import Decimal
+from sql2csv.encoders import CsvEncoder, JsonEncoder, dumps, choose_content_encoding, compress_chunks
+
+def test_csv_encoder_buffers_until_chunk_size():
+    encoder = CsvEncoder(chunk_size=50)
+    assert encoder.write_rows([["a", 1]]) == ''
+    chunk = encoder.write_rows([["b" * 60, 2]])
+    assert chunk == '"a",1\n"' + "b" * 60 + '",2\n'
+    assert encoder.flush() == ''
+
+def test_csv_encoder_output_matches_csv_writer():
+    rows = [["x", 1, None], ['quote "me"', 2.5, "line\nbreak"]]
+    expected = io.StringIO()
+    csv.writer(expected, lineterminator='\n', quoting=csv.QUOTE_NONNUMERIC).writerows([["A", "B", "C"]] + rows)
+
+    encoder = CsvEncoder()
+    encoder.write_header(["A", "B", "C"])
+    output = encoder.write_rows(rows) + encoder.flush()
+    assert output == expected.getvalue()
+
+def encode_json(encoder, blocks, trailer):
+    output = encoder.start()
+    for rows in blocks:
+        output += encoder.write_rows(rows)
+    return output + encoder.finish(trailer)
+
+def test_json_encoder_object_rows():
+    encoder = JsonEncoder(["ID", "NAME"])
+    output = encode_json(encoder, [[[1, "a"], [2, "b"]], [[3, None]]], {"executionTime": 0.5})
+    data = json.loads(output)
+    assert data["columns"] == ["ID", "NAME"]
+    assert data["rows"] == [{"ID": 1, "NAME": "a"}, {"ID": 2, "NAME": "b"}, {"ID": 3, "NAME": None}]
+    assert data["executionTime"] == 0.5
+
+def test_json_encoder_compact_rows():
+    encoder = JsonEncoder(["ID", "NAME"], compact=True, chunk_size=10)
+    output = encode_json(encoder, [[[1, "a"]], [], [[2, "b"]]], {"executionTime": 0.5})
+    data = json.loads(output)
+    assert data["rows"] == [[1, "a"], [2, "b"]]
+    assert data["executionTime"] == 0.5
+
+def test_json_encoder_empty_result():
+    for compact in (True, False):
+        data = json.loads(encode_json(JsonEncoder(["ID"], compact), [], {"executionTime": 0.1}))
+        assert data["rows"] == []
+
+def test_dumps_preserves_decimal_precision():
+    value = Decimal("12345678901234567890.123456789")
+    assert dumps([value]) == "[12345678901234567890.123456789]"
+    assert dumps([datetime.date(2024, 1, 2)]) == '["2024-01-02"]'
+
+def test_dumps_decimal_does_not_fall_back_to_simplejson(monkeypatch):
+    from sql2csv import encoders
+    if not encoders.ORJSON_AVAILABLE:
+        pytest.skip("orjson with Fragment support is not installed")
+    monkeypatch.setattr(encoders.simplejson, "dumps", lambda *args, **kwargs: pytest.fail("simplejson used"))
+    assert dumps([[1, Decimal("0.10"), "a"], [2, Decimal("-3.5E+2"), None]]) == '[[1,0.10,"a"],[2,-3.5E+2,null]]'
+
+def test_arrow_encoder_stream_round_trip():
+    pyarrow = pytest.importorskip("pyarrow")
+    from sql2csv.encoders import ArrowEncoder
+    fields = [("ID", pyarrow.int64(), None), ("NAME", pyarrow.string(), str)]
+    encoder = ArrowEncoder(fields, "arrow", chunk_size=1)
+    output = encoder.write_rows([(1, "a"), (2, None)]) + encoder.write_rows([(3, 4)]) + encoder.finish()
+
+    table = pyarrow.ipc.open_stream(output).read_all()
+    assert table.column_names == ["ID", "NAME"]
+    assert table.to_pylist() == [{"ID": 1, "NAME": "a"}, {"ID": 2, "NAME": None}, {"ID": 3, "NAME": "4"}]
+
+def test_parquet_encoder_round_trip():
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+    from sql2csv.encoders import ArrowEncoder
+    fields = [("DAY", pyarrow.timestamp('us'), None), ("VALUE", pyarrow.float64(), None)]
+    encoder = ArrowEncoder(fields, "parquet")
+    day = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    output = encoder.write_rows([(day, 1.5), (None, 2)]) + encoder.finish()
+
+    table = pyarrow.parquet.read_table(pyarrow.BufferReader(output))
+    assert table.to_pylist() == [{"DAY": day, "VALUE": 1.5}, {"DAY": None, "VALUE": 2.0}]
+
+def test_choose_content_encoding():
+    assert choose_content_encoding(None) is None
+    assert choose_content_encoding("identity") is None
+    assert choose_content_encoding("gzip, deflate") == "gzip"
+    assert choose_content_encoding("gzip;q=0") is None
+    assert choose_content_encoding("*") in ("gzip", "zstd")
+
+def test_compress_chunks_gzip_flushes_each_chunk():
+    closed = []
+
+    def chunks():
+        try:
+            yield "first,1\n"
+            yield b"second,2\n"
+        finally:
+            closed.append(True)
+
+    decompressor = zlib.decompressobj(31)
+    compressed = compress_chunks(chunks(), "gzip", 6)
+    # Each chunk can be decoded as soon as it arrives
+    assert decompressor.decompress(next(compressed)) == b"first,1\n"
+    assert decompressor.decompress(next(compressed)) == b"second,2\n"
+    decompressor.decompress(b"".join(compressed))
+    assert decompressor.eof
+    assert closed == [True]
+
+def test_compress_chunks_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    output = b"".join(compress_chunks(iter(["a" * 1000, "b" * 1000]), "zstd", 3))
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(output) == b"a" * 1000 + b"b" * 1000
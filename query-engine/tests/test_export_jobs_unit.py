@@ -0,0 +1,124 @@
+import gzip
+import os
+import threading
+import time
+import pytest
+from sql2csv import export_jobs
+from sql2csv.export_jobs import ExportJobManager
+from .test_sql2csv_unit import CREDENTIALS, fake_db  # noqa: F401
+
+OTHER_USER = {**CREDENTIALS, "X-DB-Credentials": "b3RoZXI6cGFzcw=="}
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    manager = ExportJobManager(spool_dir=str(tmp_path), max_workers=1, max_queued=1, ttl=60)
+    monkeypatch.setattr(export_jobs, "job_manager", manager)
+    return manager
+
+def wait_for(client, location, headers=CREDENTIALS):
+    for _ in range(100):
+        status = client.get(location, headers=headers).get_json()
+        if status["status"] in export_jobs.FINISHED:
+            return status
+        time.sleep(0.02)
+    raise AssertionError("export job did not finish")
+
+def test_export_job_spools_compressed_result(client, fake_db, manager):
+    response = client.post("/sql/pdb21/jobs", headers=CREDENTIALS,
+                           json={"sql": "select id, name from t", "options": {"csv_header": "y"}})
+    assert response.status_code == 202
+    location = response.headers["Location"]
+    assert location.endswith(f"/sql/pdb21/jobs/{response.get_json()['id']}")
+
+    status = wait_for(client, location)
+    assert status["status"] == "complete"
+    assert status["rows"] == 5
+    assert status["bytes"] > 0 and status["spoolBytes"] > 0
+
+    result = client.get(status["result"], headers=CREDENTIALS)
+    assert result.status_code == 200
+    assert result.mimetype == "application/gzip"
+    assert fake_db.close.called
+
+    # The spooled file holds the same CSV as a streamed /sql response
+    fake_db.reset([(i, f"name{i}") for i in range(1, 6)])
+    streamed = client.post("/sql/pdb21", headers=CREDENTIALS,
+                           json={"sql": "select id, name from t", "options": {"csv_header": "y"}}).data
+    assert gzip.decompress(result.data) == streamed
+    assert streamed.count(b"\n") == 6
+
+def test_export_result_supports_range_requests(client, fake_db, manager):
+    location = client.post("/sql/pdb21/jobs", headers=CREDENTIALS,
+                           json={"sql": "select id, name from t"}).headers["Location"]
+    status = wait_for(client, location)
+    full = client.get(status["result"], headers=CREDENTIALS).data
+
+    partial = client.get(status["result"], headers={**CREDENTIALS, "Range": "bytes=10-"})
+    assert partial.status_code == 206
+    assert partial.headers["Content-Range"] == f"bytes 10-{len(full) - 1}/{len(full)}"
+    assert partial.data == full[10:]
+
+def test_export_job_scoped_to_credentials(client, fake_db, manager):
+    location = client.post("/sql/pdb21/jobs", headers=CREDENTIALS,
+                           json={"sql": "select id, name from t"}).headers["Location"]
+    wait_for(client, location)
+    assert client.get(location, headers=OTHER_USER).status_code == 404
+    assert client.get(location + "/result", headers=OTHER_USER).status_code == 404
+    assert client.get(location.replace("/pdb21/", "/other/"), headers=CREDENTIALS).status_code == 404
+    assert client.get("/sql/pdb21/jobs/..%2F..%2Fetc", headers=CREDENTIALS).status_code == 404
+
+def test_failed_export_job_reports_error(client, manager, monkeypatch):
+    monkeypatch.setattr(export_jobs.sql2csv, "get_connection",
+                        lambda *args, **kwargs: export_jobs.sql2csv.fail_request(401, description="ORA-01017"))
+    location = client.post("/sql/pdb21/jobs", headers=CREDENTIALS,
+                           json={"sql": "select id, name from t"}).headers["Location"]
+    status = wait_for(client, location)
+    assert status["status"] == "failed"
+    assert status["error"] == "ORA-01017"
+    assert client.get(location + "/result", headers=CREDENTIALS).status_code == 409
+    assert manager.get_stats()["failed"] == 1
+
+def test_export_jobs_bounded(client, manager, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(export_jobs.sql2csv, "get_connection",
+                        lambda *args, **kwargs: release.wait(5) and export_jobs.sql2csv.fail_request(401, description="done"))
+    request = {"sql": "select id, name from t"}
+    try:
+        assert client.post("/sql/pdb21/jobs", headers=CREDENTIALS, json=request).status_code == 202
+        assert client.post("/sql/pdb21/jobs", headers=CREDENTIALS, json=request).status_code == 202
+        assert client.post("/sql/pdb21/jobs", headers=CREDENTIALS, json=request).status_code == 503
+    finally:
+        release.set()
+    assert manager.get_stats()["rejected"] == 1
+
+def test_delete_cancels_running_job(client, fake_db, manager, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    get_connection = export_jobs.sql2csv.get_connection
+    monkeypatch.setattr(export_jobs.sql2csv, "get_connection",
+                        lambda *args, **kwargs: started.set() or release.wait(5) and get_connection(*args, **kwargs))
+    location = client.post("/sql/pdb21/jobs", headers=CREDENTIALS,
+                           json={"sql": "select id, name from t"}).headers["Location"]
+    assert started.wait(5)
+    assert client.delete(location, headers=CREDENTIALS).get_json()["status"] == "cancelling"
+    release.set()
+    assert wait_for(client, location)["status"] == "cancelled"
+    assert client.get(location + "/result", headers=CREDENTIALS).status_code == 409
+    assert not fake_db.fetchmany.called
+
+def test_delete_removes_finished_job(client, fake_db, manager, tmp_path):
+    location = client.post("/sql/pdb21/jobs", headers=CREDENTIALS,
+                           json={"sql": "select id, name from t"}).headers["Location"]
+    wait_for(client, location)
+    assert client.delete(location, headers=CREDENTIALS).get_json()["status"] == "deleted"
+    assert client.get(location, headers=CREDENTIALS).status_code == 404
+    assert os.listdir(tmp_path) == []
+
+def test_sweep_removes_expired_jobs(client, fake_db, manager, tmp_path):
+    location = client.post("/sql/pdb21/jobs", headers=CREDENTIALS,
+                           json={"sql": "select id, name from t"}).headers["Location"]
+    wait_for(client, location)
+    assert manager.sweep() == 0
+    manager.ttl = -1
+    assert manager.sweep() == 1
+    assert os.listdir(tmp_path) == []
+    assert client.get(location, headers=CREDENTIALS).status_code == 404
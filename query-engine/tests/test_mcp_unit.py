@@ -0,0 +1,25 @@
+import pytest
+from werkzeug.exceptions import BadRequest
+from sql2csv.mcp import format_sql_response, get_result_limits
+
+RESULT = {"success": True, "data": [{"ID": 1, "NAME": "name1"}], "row_count": 1,
+          "truncated": True, "truncated_reason": "max_rows"}
+
+def test_format_sql_response_compact():
+    text = format_sql_response("pdb21", "user", "select id, name from t", RESULT, compact=True)
+    assert text.endswith('Results:\n[{"ID":1,"NAME":"name1"}]')
+    assert "Results truncated" in text
+    assert "row limit" in text
+
+def test_format_sql_response_indented_by_default():
+    text = format_sql_response("pdb21", "user", "select id, name from t", {**RESULT, "truncated": False})
+    assert '  {\n    "ID": 1,' in text
+    assert "Results truncated" not in text
+
+def test_result_limits_cannot_exceed_endpoint_limit(app):
+    with app.app_context():
+        assert get_result_limits("pdb21") == (1000, 1024 * 1024)
+        assert get_result_limits("pdb21", 10)[0] == 10
+        assert get_result_limits("pdb21", 50000)[0] == 1000
+        with pytest.raises(BadRequest):
+            get_result_limits("pdb21", 0)
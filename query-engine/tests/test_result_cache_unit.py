@@ -0,0 +1,123 @@
+import json
+import time
+import pytest
+from sql2csv import sql2csv as sql2csv_module
+from sql2csv.result_cache import ResultCache, get_cache_config, normalize_sql
+from sql2csv.mcp import format_sql_response
+from .test_sql2csv_unit import CREDENTIALS, fake_db  # noqa: F401
+
+CONFIG = {"ttl": 60, "max_entry_bytes": 10000}
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(max_memory_bytes=100, max_disk_bytes=100000, spill_bytes=50, cache_dir=str(tmp_path))
+
+def key(sql="select 1 from dual", password="tiger", username="scott"):
+    return ResultCache.make_key("pdb21", username, password, sql, None, {"format": "csv"})
+
+def test_cache_is_opt_in():
+    assert get_cache_config({"dsn": "x"}) is None
+    assert get_cache_config({"dsn": "x", "cache": False}) is None
+    assert get_cache_config({"dsn": "x", "cache": True})["ttl"] == 60
+    assert get_cache_config({"dsn": "x", "cache": {"ttl": 300}})["ttl"] == 300
+    assert get_cache_config({"dsn": "x", "cache": {"ttl": 0}}) is None
+
+def test_normalize_sql_keeps_quoted_whitespace():
+    assert normalize_sql("select  *\n from t where a = 'x  y';") == "select * from t where a = 'x  y'"
+
+def test_normalize_sql_keeps_line_comment_ends():
+    assert normalize_sql("select a -- x\n, b from t") != normalize_sql("select a -- x , b from t")
+    assert normalize_sql("select a  -- x\n,  b from t") == normalize_sql("select a -- x\n, b from t")
+    assert normalize_sql("select /* -- */ 1 from t") != normalize_sql("select /* -- */ 2 from t")
+
+def test_normalize_sql_keeps_q_quoted_whitespace():
+    for literal in ("q'[it's  a]'", "Q'{it's  a}'", "nq'(it's  a)'", "q'<it's  a>'", "q'!it's  a!'"):
+        sql = f"select  {literal}  from t"
+        assert normalize_sql(sql) == f"select {literal} from t"
+        assert normalize_sql(sql) != normalize_sql(sql.replace("  a", " a"))
+
+def test_key_scoped_to_credentials():
+    assert key("select 1\nfrom dual") == key()
+    assert key(password="other") != key()
+    assert key(username="hr") != key()
+
+def test_memory_hit_and_ttl_expiry(cache):
+    cache.put(key(), b"1\n", "text/csv", {"ttl": 0.05, "max_entry_bytes": 1000})
+    cached = cache.get(key())
+    assert cached.read() == b"1\n"
+    assert cached.mimetype == "text/csv"
+    time.sleep(0.06)
+    assert cache.get(key()) is None
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+
+def test_large_result_spills_to_compressed_file(cache, tmp_path):
+    body = b"x" * 5000
+    cache.put(key(), body, "text/csv", CONFIG)
+    files = list(tmp_path.rglob("*"))
+    spilled = [f for f in files if f.is_file()]
+    assert len(spilled) == 1
+    assert spilled[0].stat().st_size < len(body)
+    assert cache.get(key()).read() == body
+    assert cache.get_stats()["memory_bytes"] == 0
+
+    cache.clear()
+    assert not [f for f in tmp_path.rglob("*") if f.is_file()]
+
+def test_lru_eviction_under_memory_budget(cache):
+    for i in range(3):
+        cache.put(key(f"select {i} from dual"), b"y" * 40, "text/csv", CONFIG)
+        if i == 1:
+            # Touch the first entry so the second becomes least recently used
+            cache.get(key("select 0 from dual"))
+    assert cache.get(key("select 1 from dual")) is None
+    assert cache.get(key("select 0 from dual")) is not None
+    assert cache.get_stats()["evictions"] == 1
+
+def test_entry_larger_than_limit_not_stored(cache):
+    assert cache.put(key(), b"z" * 20000, "text/csv", CONFIG) is False
+    assert cache.get_stats()["rejected"] == 1
+
+def test_capture_only_stores_complete_streams(cache):
+    done = {"complete": False}
+    assert list(cache.capture(key(), iter(["a", b"b"]), "text/csv", CONFIG, lambda: done["complete"])) == ["a", b"b"]
+    assert cache.get(key()) is None
+
+    done["complete"] = True
+    list(cache.capture(key(), iter(["a", b"b"]), "text/csv", CONFIG, lambda: done["complete"]))
+    assert cache.get(key()).read() == b"ab"
+
+@pytest.fixture
+def cached_endpoint(app, fake_db, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.endpoints, "cached", {"dsn": "x", "cache": {"ttl": 60}})
+    monkeypatch.setattr(sql2csv_module, "result_cache", ResultCache(cache_dir=str(tmp_path)))
+    calls = []
+    get_cursor = sql2csv_module.get_cursor
+    monkeypatch.setattr(sql2csv_module, "get_cursor", lambda *args, **kwargs: calls.append(args) or get_cursor(*args, **kwargs))
+    return calls
+
+def test_repeated_query_served_from_cache(client, fake_db, cached_endpoint):
+    request = {"sql": "select id, name from t", "options": {"format": "json-compact"}}
+    first = client.post("/sql/cached", headers=CREDENTIALS, json=request)
+    assert first.headers["X-Cache"] == "MISS"
+    rows = json.loads(first.data)["rows"]
+    second = client.post("/sql/cached", headers=CREDENTIALS, json={**request, "sql": "select id, name\n  from t;"})
+    assert second.headers["X-Cache"] == "HIT"
+    assert json.loads(second.data)["rows"] == rows
+    assert len(cached_endpoint) == 1
+
+    other_user = {**CREDENTIALS, "X-DB-Credentials": "b3RoZXI6cGFzcw=="}
+    fake_db.reset([(1, "name1")])
+    assert client.post("/sql/cached", headers=other_user, json=request).headers["X-Cache"] == "MISS"
+    assert len(cached_endpoint) == 2
+
+def test_mcp_cache_hit_formats_like_a_miss(app, fake_db, cached_endpoint):
+    fake_db.reset([(1.25, "name1")])
+    with app.app_context():
+        miss = sql2csv_module.execute_sql_bounded("cached", "select id, name from t", "user", "pass", max_rows=10)
+        hit = sql2csv_module.execute_sql_bounded("cached", "select id, name from t", "user", "pass", max_rows=10)
+    assert len(cached_endpoint) == 1
+    texts = [format_sql_response("cached", "user", "select id, name from t", {"success": True, "data": result["rows"]})
+             for result in (miss, hit)]
+    assert texts[0] == texts[1]
+    assert '"ID": 1.25' in texts[1]
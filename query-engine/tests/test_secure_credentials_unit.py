@@ -3,7 +3,9 @@ import time
 import os
 import shutil
 import json
-from sql2csv.secure_credentials import SecureCredentialManager, SharedCredentialManager
+from sql2csv.secure_credentials import (
+    SecureCredentialManager, SharedCredentialManager, IndexedCredentialManager, CredentialSweeper
+)
 
 def test_secure_credential_manager_basic():
     mgr = SecureCredentialManager()
@@ -89,3 +91,68 @@ def test_encryption_key_persistence():
     assert creds[1] == "super_secret"
 
     shutil.rmtree(test_shm)
+
+def test_indexed_credential_manager_round_trip(tmp_path):
+    mgr = IndexedCredentialManager(storage_dir=str(tmp_path / "creds"))
+    token = mgr.create_credential_token("user", "super_secret", "db", "sessionA")
+
+    assert mgr.get_credentials(token, "sessionA") == ("user", "super_secret", "db")
+    assert mgr.get_credentials(token, "sessionB") is None
+    assert mgr.get_credentials("not-a-token", "sessionA") is None
+
+    # Passwords are encrypted and tokens are only stored as hashes
+    raw = b"".join(path.read_bytes() for path in (tmp_path / "creds").iterdir())
+    assert b"super_secret" not in raw
+    assert token.encode() not in raw
+    assert oct(os.stat(mgr.db_path).st_mode & 0o777) == oct(0o600)
+
+def test_indexed_credential_manager_revocation(tmp_path):
+    mgr = IndexedCredentialManager(storage_dir=str(tmp_path / "creds"))
+    token1 = mgr.create_credential_token("user", "pass", "db1", "sessionA")
+    mgr.create_credential_token("user", "pass", "db2", "sessionA")
+    token3 = mgr.create_credential_token("user", "pass", "db1", "sessionB")
+
+    assert mgr.revoke_database_tokens("sessionA", "db2") == 1
+    assert mgr.revoke_session_tokens("sessionA") == 1
+    assert mgr.get_credentials(token1, "sessionA") is None
+    assert mgr.revoke_token(token3) is True
+    assert mgr.revoke_token(token3) is False
+    assert mgr.get_active_token_count() == 0
+
+def test_indexed_credential_manager_expiry(tmp_path):
+    mgr = IndexedCredentialManager(storage_dir=str(tmp_path / "creds"))
+    expired = mgr.create_credential_token("user", "pass", "db", "sessionA", expiry_minutes=-1)
+    active = mgr.create_credential_token("user", "pass", "db", "sessionA")
+    assert mgr.get_credentials(expired, "sessionA") is None
+    assert mgr.get_active_token_count() == 1
+    info = mgr.get_instance_info()
+    assert info["active_tokens"] == 1
+    assert info["token_list"][0]["username"] == "user"
+    assert mgr.get_credentials(active, "sessionA") is not None
+
+def test_create_token_does_not_sweep_inline(tmp_path):
+    mgr = IndexedCredentialManager(storage_dir=str(tmp_path / "creds"))
+    mgr.create_credential_token("user", "pass", "db", "sessionA", expiry_minutes=-1)
+    mgr.create_credential_token("user", "pass", "db", "sessionA")
+    assert mgr.get_instance_info()["active_tokens"] == 1
+    assert mgr._connection().execute("SELECT COUNT(*) FROM credentials").fetchone()[0] == 2
+
+def test_sweeper_drops_expired_buckets(tmp_path):
+    mgr = IndexedCredentialManager(storage_dir=str(tmp_path / "creds"))
+    for _ in range(3):
+        mgr.create_credential_token("user", "pass", "db", "sessionA", expiry_minutes=-10)
+    mgr.create_credential_token("user", "pass", "db", "sessionA")
+
+    sweeper = CredentialSweeper(mgr, interval=60)
+    assert sweeper.sweep() == 3
+    stats = sweeper.get_stats()
+    assert stats["runs"] == 1
+    assert stats["swept_total"] == 3
+    assert stats["active_tokens"] == 1
+    assert stats["running"] is False
+
+def test_cleanup_deletes_in_batches(tmp_path):
+    mgr = IndexedCredentialManager(storage_dir=str(tmp_path / "creds"))
+    for _ in range(5):
+        mgr.create_credential_token("user", "pass", "db", "sessionA", expiry_minutes=-1)
+    assert mgr._cleanup_expired_tokens(batch_size=2) == 5
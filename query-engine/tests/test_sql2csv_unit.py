@@ -0,0 +1,300 @@
+import datetime
+import oracledb
+import psycopg2.pool
+import pytest
+import json
+import zlib
+from unittest.mock import MagicMock
+from sql2csv import sql2csv as sql2csv_module
+from sql2csv.sql2csv import fetch_row_blocks, build_converter_plan, apply_converter_plan, build_arrow_fields, RowWindow
+
+def make_cursor(rows, arraysize):
+    """Mock a DB-API cursor whose fetchmany() returns successive slices of rows."""
+    cursor = MagicMock()
+    cursor.arraysize = arraysize
+    remaining = list(rows)
+
+    def fetchmany(size):
+        block = remaining[:size]
+        del remaining[:size]
+        return block
+
+    def reset(new_rows):
+        remaining[:] = new_rows
+
+    cursor.fetchmany.side_effect = fetchmany
+    cursor.reset = reset
+    return cursor
+
+CREDENTIALS = {"X-DB-Credentials": "dXNlcjpwYXNz", "Content-Type": "application/json"}
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Replace the database connection with a cursor over canned Oracle rows."""
+    description = [("ID", oracledb.DB_TYPE_NUMBER, None, None, 10, 0, False),
+                   ("NAME", oracledb.DB_TYPE_VARCHAR, None, None, None, None, True)]
+    rows = [(i, f"name{i}") for i in range(1, 6)]
+    cursor = make_cursor(rows, 2)
+    cursor.description = description
+    connection = MagicMock(spec=["close", "cursor"])
+    monkeypatch.setattr(sql2csv_module, "get_connection", lambda *args, **kwargs: connection)
+    monkeypatch.setattr(sql2csv_module, "get_cursor", lambda *args, **kwargs: cursor)
+    return cursor
+
+def test_fetch_row_blocks_uses_arraysize():
+    cursor = make_cursor([(i,) for i in range(25)], 10)
+    blocks = list(fetch_row_blocks(cursor))
+    assert [len(block) for block in blocks] == [10, 10, 5]
+    assert cursor.fetchmany.call_count == 4
+
+def test_fetch_row_blocks_empty_result():
+    cursor = make_cursor([], 100)
+    assert list(fetch_row_blocks(cursor)) == []
+
+def test_invalid_arraysize_rejected(client):
+    response = client.post("/sql/pdb21",
+        headers={"X-DB-Credentials": "dXNlcjpwYXNz", "Content-Type": "application/json"},
+        json={"sql": "select 1 from dual", "options": {"arraysize": 0}})
+    assert response.status_code == 400
+    assert "arraysize" in response.data.decode("utf-8")
+
+def test_busy_pool_returns_503(client, monkeypatch):
+    def acquire(*args):
+        raise psycopg2.pool.PoolError("connection pool exhausted")
+    monkeypatch.setattr(sql2csv_module.pool_manager, "acquire", acquire)
+    response = client.post("/sql/pdb21", headers=CREDENTIALS, json={"sql": "select 1 from dual"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+def test_invalid_prefetchrows_rejected(client):
+    response = client.post("/sql/pdb21",
+        headers={"X-DB-Credentials": "dXNlcjpwYXNz", "Content-Type": "application/json"},
+        json={"sql": "select 1 from dual", "options": {"prefetchrows": "many"}})
+    assert response.status_code == 400
+    assert "prefetchrows" in response.data.decode("utf-8")
+
+def test_converter_plan_skips_passthrough_oracle_columns():
+    description = [("ID", oracledb.DB_TYPE_NUMBER), ("NAME", oracledb.DB_TYPE_VARCHAR),
+                   ("CREATED", oracledb.DB_TYPE_DATE), ("HASH", oracledb.DB_TYPE_RAW)]
+    plan = build_converter_plan(description, False, 'n')
+    assert [index for index, _ in plan] == [2, 3]
+
+    rows = [(1, "a", datetime.datetime(2024, 1, 2, 3, 4, 5), b"abc"), (2, None, None, None)]
+    assert apply_converter_plan(plan, rows) == [
+        [1, "a", "2024-01-02T03:04:05", "abc"],
+        [2, None, None, None]
+    ]
+
+def test_converter_plan_postgres_type_codes():
+    description = [("id", 23), ("amount", 1700), ("day", 1082), ("doc", 114)]
+    plan = build_converter_plan(description, True, 'Y')
+    assert [index for index, _ in plan] == [2, 3]
+    assert apply_converter_plan(plan, [(1, 2, datetime.date(2024, 1, 2), '{"a": 1}')]) == [
+        [1, 2, "2024-01-02", '{"a": 1}']
+    ]
+
+def test_empty_converter_plan_returns_rows_unchanged():
+    rows = [(1, "a")]
+    plan = build_converter_plan([("ID", oracledb.DB_TYPE_NUMBER), ("NAME", oracledb.DB_TYPE_CHAR)], False, 'N')
+    assert plan == []
+    assert apply_converter_plan(plan, rows) is rows
+
+def test_arrow_fields_from_oracle_description():
+    pyarrow = pytest.importorskip("pyarrow")
+    description = [("ID", oracledb.DB_TYPE_NUMBER, None, None, 10, 0, False),
+                   ("PRICE", oracledb.DB_TYPE_NUMBER, None, None, 10, 2, True),
+                   ("NAME", oracledb.DB_TYPE_VARCHAR, None, None, None, None, True),
+                   ("CREATED", oracledb.DB_TYPE_DATE, None, None, None, None, True),
+                   ("DOC", oracledb.DB_TYPE_CLOB, None, None, None, None, True)]
+    fields = build_arrow_fields(description, False, 'N')
+    assert [arrow_type for _, arrow_type, _ in fields] == [
+        pyarrow.int64(), pyarrow.decimal128(10, 2), pyarrow.string(), pyarrow.timestamp('us'), pyarrow.string()
+    ]
+    assert [converter is None for _, _, converter in fields] == [True, False, True, True, False]
+
+def test_arrow_fields_keep_wide_oracle_numbers_exact():
+    pyarrow = pytest.importorskip("pyarrow")
+    from sql2csv.encoders import ArrowEncoder
+    description = [("BIG", oracledb.DB_TYPE_NUMBER, None, None, 38, 0, True),
+                   ("AMOUNT", oracledb.DB_TYPE_NUMBER, None, None, 12, 3, True),
+                   ("ANY", oracledb.DB_TYPE_NUMBER, None, None, 0, -127, True),
+                   ("RATIO", oracledb.DB_TYPE_NUMBER, None, None, 126, -127, True)]
+    fields = build_arrow_fields(description, False, 'N')
+    assert [arrow_type for _, arrow_type, _ in fields] == [
+        pyarrow.decimal128(38, 0), pyarrow.decimal128(12, 3), pyarrow.string(), pyarrow.float64()
+    ]
+    encoder = ArrowEncoder(fields)
+    output = encoder.write_rows([(2**60 + 1, 1234.567, 10**40, 0.5)]) + encoder.finish()
+    table = pyarrow.ipc.open_stream(output).read_all()
+    assert table.column("BIG")[0].as_py() == 2**60 + 1
+    assert str(table.column("AMOUNT")[0].as_py()) == "1234.567"
+    assert table.column("ANY")[0].as_py() == str(10**40)
+
+def test_arrow_stream_error_aborts_response(client, fake_db):
+    pytest.importorskip("pyarrow")
+    fake_db.fetchmany.side_effect = RuntimeError("ORA-03113")
+    with pytest.raises(RuntimeError, match="ORA-03113"):
+        client.post("/sql/pdb21", headers=CREDENTIALS,
+                    json={"sql": "select id, name from t", "options": {"format": "arrow"}}).data
+
+def test_csv_response_gzip_encoded(client, fake_db):
+    response = client.post("/sql/pdb21", headers={**CREDENTIALS, "Accept-Encoding": "gzip"},
+        json={"sql": "select id, name from t", "options": {"csv_header": "y"}})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    body = zlib.decompress(response.data, 31).decode("utf-8")
+    assert body.splitlines() == ['"ID","NAME"'] + [f'{i},"name{i}"' for i in range(1, 6)]
+
+def test_csv_response_uncompressed_without_accept_encoding(client, fake_db):
+    response = client.post("/sql/pdb21", headers=CREDENTIALS, json={"sql": "select id, name from t"})
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert response.data.decode("utf-8").startswith('1,"name1"\n')
+
+def test_row_window_limits_and_reports_truncation():
+    cursor = make_cursor([(i,) for i in range(10)], 3)
+    window = RowWindow(offset=2, max_rows=4)
+    assert [row for rows in window.blocks(cursor) for row in rows] == [(2,), (3,), (4,), (5,)]
+    assert window.row_count == 4
+    assert window.truncated is True
+
+def test_row_window_exact_end_is_not_truncated():
+    cursor = make_cursor([(i,) for i in range(4)], 2)
+    window = RowWindow(max_rows=4)
+    assert sum(len(rows) for rows in window.blocks(cursor)) == 4
+    assert window.truncated is False
+    assert window.next_cursor() is None
+
+def test_json_pagination_with_cursor_token(client, fake_db):
+    request = {"sql": "select id, name from t", "options": {"format": "json-compact", "max_rows": 2}}
+    response = client.post("/sql/pdb21", headers=CREDENTIALS, json=request)
+    page1 = json.loads(response.data)
+    assert page1["rows"] == [[1, "name1"], [2, "name2"]]
+    assert page1["rowCount"] == 2
+    assert page1["truncated"] is True
+
+    fake_db.reset([(i, f"name{i}") for i in range(1, 6)])
+    request["options"]["cursor"] = page1["nextCursor"]
+    page2 = json.loads(client.post("/sql/pdb21", headers=CREDENTIALS, json=request).data)
+    assert page2["rows"] == [[3, "name3"], [4, "name4"]]
+
+    request["sql"] = "select id from t"
+    response = client.post("/sql/pdb21", headers=CREDENTIALS, json=request)
+    assert response.status_code == 400
+
+def test_invalid_max_rows_rejected(client):
+    response = client.post("/sql/pdb21", headers=CREDENTIALS,
+        json={"sql": "select 1 from dual", "options": {"max_rows": -1}})
+    assert response.status_code == 400
+
+def test_execute_sql_bounded_row_limit(app, fake_db):
+    with app.app_context():
+        result = sql2csv_module.execute_sql_bounded("pdb21", "select id, name from t", "user", "pass", max_rows=3)
+    assert result["rows"] == [{"ID": 1, "NAME": "name1"}, {"ID": 2, "NAME": "name2"}, {"ID": 3, "NAME": "name3"}]
+    assert result["truncated"] is True
+    assert result["truncated_reason"] == "max_rows"
+
+def test_execute_sql_bounded_byte_limit(app, fake_db):
+    with app.app_context():
+        result = sql2csv_module.execute_sql_bounded("pdb21", "select id, name from t", "user", "pass", max_bytes=70)
+    assert result["row_count"] == 2
+    assert result["truncated_reason"] == "max_bytes"
+    # Fetching stopped at the block that crossed the limit
+    assert fake_db.fetchmany.call_count == 2
+
+def test_execute_sql_internal_returns_all_rows(app, fake_db):
+    with app.app_context():
+        rows = sql2csv_module.execute_sql_internal("pdb21", "select id, name from t;", "user", "pass")
+    assert len(rows) == 5
+
+def make_named_cursor(rows):
+    """Mock a psycopg2 named cursor whose description is only set by the first fetch."""
+    cursor = make_cursor(rows, 1)
+    cursor.description = None
+    fetchmany = cursor.fetchmany.side_effect
+
+    def fetch(size):
+        cursor.description = [("id", 23), ("name", 25)]
+        return fetchmany(size)
+
+    cursor.fetchmany.side_effect = fetch
+    return cursor
+
+def test_postgres_get_cursor_uses_named_cursor():
+    rows = [(i, f"name{i}") for i in range(5)]
+    named = make_named_cursor(rows)
+    connection = MagicMock(spec=["cursor", "cursor_factory"])
+    connection.cursor.return_value = named
+
+    cursor = sql2csv_module.get_cursor(connection, "select id, name from t where id > %s", [0], arraysize=2)
+
+    connection.cursor.assert_called_once_with(name="sql2csv")
+    assert named.itersize == 2
+    # description is available before the caller fetches anything
+    assert [d[0] for d in cursor.description] == ["id", "name"]
+    assert [len(block) for block in fetch_row_blocks(cursor)] == [2, 2, 1]
+    assert named.fetchmany.call_count == 4
+
+def test_postgres_server_cursor_serves_prefetched_rows_in_smaller_blocks():
+    named = make_named_cursor([(i,) for i in range(4)])
+    connection = MagicMock(spec=["cursor", "cursor_factory"])
+    connection.cursor.return_value = named
+    cursor = sql2csv_module.PostgresServerCursor(connection)
+    cursor.arraysize = 3
+    cursor.execute("select id from t")
+
+    assert cursor.fetchmany(1) == [(0,)]
+    assert cursor.fetchmany(5) == [(1,), (2,)]
+    assert cursor.fetchmany(5) == [(3,)]
+    assert cursor.fetchmany(5) == []
+
+def test_postgres_tuple_rows_streamed_as_json(client, monkeypatch):
+    named = make_named_cursor([(1, "a"), (2, "b")])
+    connection = MagicMock(spec=["cursor", "cursor_factory"])
+    connection.cursor.return_value = named
+    monkeypatch.setattr(sql2csv_module, "get_connection", lambda *args, **kwargs: connection)
+    monkeypatch.setattr(sql2csv_module, "release_connection", lambda connection: None)
+
+    response = client.post("/sql/pdb21", headers=CREDENTIALS,
+        json={"sql": "select id, name from t", "options": {"format": "json-compact"}})
+    body = json.loads(response.data)
+    assert body["columns"] == ["id", "name"]
+    assert body["rows"] == [[1, "a"], [2, "b"]]
+
+def test_timeout_ms_capped_by_endpoint(app):
+    with app.test_request_context():
+        assert sql2csv_module.get_timeout_ms({}) is None
+        assert sql2csv_module.get_timeout_ms({}, 5000) == 5000
+        assert sql2csv_module.get_timeout_ms({"timeout_ms": 30000}) == 30000
+        assert sql2csv_module.get_timeout_ms({"timeout_ms": 30000}, 5000) == 5000
+        assert sql2csv_module.get_timeout_ms({"timeout_ms": 30000}, 60000) == 30000
+
+def test_invalid_timeout_ms_rejected(client):
+    response = client.post("/sql/pdb21", headers=CREDENTIALS,
+        json={"sql": "select 1 from dual", "options": {"timeout_ms": "soon"}})
+    assert response.status_code == 400
+    assert "timeout_ms" in response.data.decode("utf-8")
+
+def test_oracle_timeout_sets_call_timeout(app):
+    connection = MagicMock(spec=["cursor", "close", "call_timeout"])
+    with app.app_context():
+        sql2csv_module.get_cursor(connection, "select 1 from dual", None, timeout_ms=1500)
+    assert connection.call_timeout == 1500
+
+def test_postgres_timeout_sets_statement_timeout(app):
+    connection = MagicMock()
+    setup = connection.cursor.return_value.__enter__.return_value
+    with app.app_context():
+        sql2csv_module.get_cursor(connection, "select 1", None, timeout_ms=1500)
+    setup.execute.assert_called_once_with("select set_config('statement_timeout', %s, true)", ("1500",))
+
+def test_timeout_during_execute_returns_504(client, monkeypatch):
+    connection = MagicMock(spec=["cursor", "close", "call_timeout"])
+    error = MagicMock(full_code="DPY-4024")
+    connection.cursor.return_value.execute.side_effect = [None, oracledb.DatabaseError(error)]
+    monkeypatch.setattr(sql2csv_module, "get_connection", lambda *args, **kwargs: connection)
+    response = client.post("/sql/pdb21", headers=CREDENTIALS,
+        json={"sql": "select 1 from dual", "options": {"timeout_ms": 100}})
+    assert response.status_code == 504
+    assert "timeout_ms" in response.data.decode("utf-8")
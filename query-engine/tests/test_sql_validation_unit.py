@@ -0,0 +1,36 @@
+import pytest
+from sql2csv.sql_validation import StatementClassifier, SELECT, WITH_SELECT, REJECTED, INVALID
+
+@pytest.mark.parametrize("sql,expected", [
+    ("select * from dual", SELECT),
+    ("  /* report */\n-- daily\nSELECT id FROM t", SELECT),
+    ("with a as (select 1 x from dual) select x from a", SELECT),
+    ("delete from t", REJECTED),
+    ("drop table t", REJECTED),
+    ("begin null; end;", REJECTED),
+    ("", INVALID),
+])
+def test_classification(sql, expected):
+    assert StatementClassifier().classify(sql) in ((SELECT, WITH_SELECT) if expected == SELECT else (expected,))
+
+def test_token_path_skips_full_parse():
+    classifier = StatementClassifier()
+    classifier.classify("select 1 from dual")
+    classifier.classify("with a as (select 1 x from dual) select x from a")
+    stats = classifier.get_stats()
+    assert stats["token_classified"] == 1
+    assert stats["parse_classified"] == 1
+
+def test_cache_hits_and_lru_eviction():
+    classifier = StatementClassifier(max_entries=2)
+    classifier.classify("select 1 from dual")
+    classifier.classify("select 2 from dual")
+    classifier.classify("select 1 from dual")
+    classifier.classify("select 3 from dual")   # evicts "select 2"
+    classifier.classify("select 1 from dual")
+    stats = classifier.get_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+    assert stats["size"] == 2
+    classifier.classify("select 2 from dual")
+    assert classifier.get_stats()["misses"] == 4